@@ -0,0 +1,119 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Hashable, Optional
+
+
+class LRUCache:
+    """
+    Thread-safe in-memory cache with least-recently-used eviction
+
+    Args:
+        - max_size: maximum number of entries kept in memory. 0 disables the cache
+    """
+
+    def __init__(self, max_size: int = 1024) -> None:
+        self.max_size = max_size
+        self._data: OrderedDict = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Get the cached value of the key and mark it as recently used
+
+        Args:
+            - key: cache key
+            - default: value to be returned if the key is not cached
+
+        Returns:
+            - cached value or default value
+        """
+        with self._lock:
+            if key not in self._data:
+                return default
+
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """
+        Store the value in the cache. The least recently used entry is evicted if the cache is full
+
+        Args:
+            - key: cache key
+            - value: value to be cached
+        """
+        if self.max_size <= 0:
+            return
+
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        """
+        Remove the key from the cache
+
+        Returns:
+            - the removed value or default value if the key is not cached
+        """
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._data
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+
+class TTLCache(LRUCache):
+    """
+    Thread-safe in-memory LRU cache whose entries expire after a fixed time
+
+    Args:
+        - max_size: maximum number of entries kept in memory. 0 disables the cache
+        - ttl_seconds: lifetime of an entry in seconds. 0 disables the cache
+    """
+
+    def __init__(self, max_size: int = 1024, ttl_seconds: float = 60.0) -> None:
+        super().__init__(max_size if ttl_seconds > 0 else 0)
+        self.ttl_seconds = ttl_seconds
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = super().get(key)
+        if entry is None:
+            return default
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            with self._lock:
+                # the entry may have been replaced by another thread in the meantime
+                if self._data.get(key) is entry:
+                    del self._data[key]
+            return default
+
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        super().put(key, (time.monotonic() + self.ttl_seconds, value))
+
+    def pop(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        entry = super().pop(key)
+        if entry is None:
+            return default
+
+        return entry[1]
+
+    def __contains__(self, key: Hashable) -> bool:
+        marker = object()
+        return self.get(key, marker) is not marker
@@ -126,6 +126,36 @@ class UnsupportedFileTypeError(APIError):
         )
 
 
+class InvalidMultipartRequestError(APIError):
+    """
+    This error is threw when the body of the streaming upload request is not valid multipart/form-data
+
+    Args
+        - message (str): Optional message to show if it is supplied. Otherwise, the default message is used
+    """
+
+    def __init__(self, message: str = None) -> None:
+        if message is None:
+            message = "The request body is not valid multipart/form-data"
+
+        super().__init__(message)
+
+
+class IncompleteUploadError(APIError):
+    """
+    This error is threw when the presigned upload is finalized before all of its parts are uploaded
+
+    Args
+        - message (str): Optional message to show if it is supplied. Otherwise, the default message is used
+    """
+
+    def __init__(self, message: str = None) -> None:
+        if message is None:
+            message = "Some parts of the file are not uploaded"
+
+        super().__init__(message)
+
+
 class ObjectStorageError(APIError):
     """
     General error for object storage service
@@ -0,0 +1,189 @@
+from collections import deque
+from typing import AsyncIterable, AsyncIterator, Dict, Optional
+
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
+
+from api.common.error import InvalidMultipartRequestError
+
+
+def _decode(value: bytes) -> str:
+    try:
+        return value.decode("utf-8")
+    except UnicodeDecodeError:
+        return value.decode("latin-1")
+
+
+def get_multipart_boundary(content_type: Optional[str]) -> bytes:
+    """
+    Function to get the boundary of multipart/form-data request from its Content-Type header
+
+    Args:
+        - content_type: Content-Type header of the request
+
+    Returns:
+        - boundary
+
+    Raises:
+        - InvalidMultipartRequestError if the request is not multipart/form-data or the boundary is missing
+    """
+    media_type, params = parse_options_header(content_type or "")
+    if media_type != b"multipart/form-data" or b"boundary" not in params:
+        raise InvalidMultipartRequestError(
+            "The request should be multipart/form-data with boundary"
+        )
+
+    return params[b"boundary"]
+
+
+class MultipartPart:
+    """
+    One part (form field or file) of the streamed multipart body.
+    The data of the part can be read only until the next part is requested from the parser.
+    Unread data is skipped
+
+    Args:
+        - name: form field name
+        - filename: filename of the file part. None for non-file fields
+        - content_type: content type of the part
+        - data: iterator of the data chunks of the part
+    """
+
+    def __init__(
+        self,
+        name: str,
+        filename: Optional[str],
+        content_type: str,
+        data: AsyncIterator[bytes],
+    ) -> None:
+        self.name = name
+        self.filename = filename
+        self.content_type = content_type
+        self.data = data
+
+
+class StreamingMultipartParser:
+    """
+    Incremental parser of multipart/form-data request body.
+    Unlike FastAPI UploadFile, which spools each file to a temporary file before the endpoint runs,
+    the data of each part is passed on in the chunks of the request body as they arrive.
+    The body is read only as fast as the data is consumed, so memory usage does not depend on the file sizes
+
+    Args:
+        - stream: chunks of the request body (e.g. Request.stream())
+        - boundary: multipart boundary (see get_multipart_boundary)
+    """
+
+    def __init__(self, stream: AsyncIterable[bytes], boundary: bytes) -> None:
+        self._stream = stream.__aiter__()
+        self._events = deque()
+        self._stream_finished = False
+        self._part_number = 0
+
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+
+        callbacks = {
+            "on_part_begin": self._on_part_begin,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_end": self._on_end,
+        }
+        self._parser = MultipartParser(boundary, callbacks)
+
+    async def iter_parts(self) -> AsyncIterator[MultipartPart]:
+        """
+        Iterate the parts of the body in order
+
+        Returns:
+            - iterator of parts
+
+        Raises:
+            - InvalidMultipartRequestError if the body is malformed or truncated
+        """
+        while True:
+            event, value = await self._next_event()
+            if event == "end":
+                return
+
+            # data of the previous part that was not read is skipped
+            if event != "headers":
+                continue
+
+            self._part_number += 1
+
+            _, disposition = parse_options_header(
+                value.get(b"content-disposition", b"")
+            )
+            filename = disposition.get(b"filename")
+
+            yield MultipartPart(
+                name=_decode(disposition.get(b"name", b"")),
+                filename=_decode(filename) if filename is not None else None,
+                content_type=_decode(
+                    value.get(b"content-type", b"application/octet-stream")
+                ),
+                data=self._iter_part_data(self._part_number),
+            )
+
+    async def _iter_part_data(self, part_number: int) -> AsyncIterator[bytes]:
+        while part_number == self._part_number:
+            event, value = await self._next_event()
+            if event == "data":
+                yield value
+            elif event == "part_end":
+                return
+            else:
+                raise InvalidMultipartRequestError
+
+    async def _next_event(self):
+        """
+        Private function to get the next parser event. The body is read only when there is no pending event
+        """
+        while not self._events:
+            if self._stream_finished:
+                raise InvalidMultipartRequestError("The request body is truncated")
+
+            chunk = await anext(self._stream, None)
+            try:
+                if chunk is None:
+                    self._stream_finished = True
+                    self._parser.finalize()
+                else:
+                    self._parser.write(chunk)
+
+            except MultipartParseError as err:
+                raise InvalidMultipartRequestError from err
+
+        return self._events.popleft()
+
+    def _on_part_begin(self) -> None:
+        self._headers = {}
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        self._events.append(("data", data[start:end]))
+
+    def _on_part_end(self) -> None:
+        self._events.append(("part_end", None))
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self) -> None:
+        self._events.append(("headers", self._headers))
+
+    def _on_end(self) -> None:
+        self._events.append(("end", None))
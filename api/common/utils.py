@@ -1,5 +1,9 @@
 import os
+import time
 import traceback
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Optional
 from urllib.parse import unquote, urlparse
 from api.common.error import ObjectStorageFileNotFoundError
 
@@ -23,9 +27,47 @@ def is_allowed_content_type(mime_type: str) -> bool:
     return False
 
 
+# leading bytes (magic numbers) of the allowed file formats
+FILE_SIGNATURES = {
+    b"%PDF-": "application/pdf",
+    b"\xff\xd8\xff": "image/jpeg",
+    b"\x89PNG\r\n\x1a\n": "image/png",
+    b"II*\x00": "image/tiff",
+    b"MM\x00*": "image/tiff",
+    b"II+\x00": "image/tiff",  # BigTIFF
+    b"MM\x00+": "image/tiff",  # BigTIFF
+}
+
+# pdf readers accept the header anywhere in the first 1024 bytes
+FILE_SIGNATURE_LENGTH = 1024
+
+
+def get_content_type_from_signature(data: bytes) -> Optional[str]:
+    """
+    Function to detect the file type from the first bytes of the file (magic numbers) instead of trusting
+    the content type declared by the client
+
+    Args:
+        - data: the first FILE_SIGNATURE_LENGTH bytes of the file (or the whole file if it is shorter)
+
+    Returns:
+        - mime type of the allowed file type (tiff, jpeg, png, or pdf). None if the file type is not allowed
+    """
+    for signature, mime_type in FILE_SIGNATURES.items():
+        if data.startswith(signature):
+            return mime_type
+
+    if b"%PDF-" in data[:FILE_SIGNATURE_LENGTH]:
+        return "application/pdf"
+
+    return None
+
+
+@lru_cache(maxsize=4096)
 def get_filename_from_signed_url(signed_url: str) -> str:
     """
-    Function to get the original file name from the encoded & signed url returned from upload endpoint
+    Function to get the original file name from the encoded & signed url returned from upload endpoint.
+    The result is cached because the same url is parsed on every query of the document
 
     Args:
         - signed_url: the signed url obtained from upload endpoint
@@ -44,6 +86,20 @@ def get_filename_from_signed_url(signed_url: str) -> str:
     return os.path.basename(parsed_url.path)
 
 
+def format_sse_event(event: str, data: str) -> str:
+    """
+    Function to format a Server-Sent Events message
+
+    Args:
+        - event: event name
+        - data: event data (single line, e.g. json)
+
+    Returns:
+        - SSE message terminated by a blank line
+    """
+    return f"event: {event}\ndata: {data}\n\n"
+
+
 def get_traceback_str(exc: Exception, debug=False) -> str:
     if debug:
         traceback_str = "".join(
@@ -53,3 +109,27 @@ def get_traceback_str(exc: Exception, debug=False) -> str:
         return f"{str(exc)}: {traceback_str}"
 
     return str(exc)
+
+
+class StageTimer:
+    """
+    Timer collecting the durations (milliseconds) of the named stages of a request.
+    Durations of a stage entered more than once are summed
+    """
+
+    def __init__(self) -> None:
+        self.durations = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.durations[name] = self.durations.get(name, 0.0) + elapsed
+
+    def __str__(self) -> str:
+        return ", ".join(
+            f"{name} {duration:.1f}ms" for name, duration in self.durations.items()
+        )
@@ -1,23 +1,49 @@
+import asyncio
+import json
 import logging
-from fastapi.concurrency import run_in_threadpool
-from fastapi import APIRouter, UploadFile, status
-from fastapi.responses import JSONResponse, Response
+from typing import AsyncIterator, List, Union
+from fastapi import APIRouter, Request, UploadFile, status
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from celery.exceptions import CeleryError
 from vector_db_task import import_doc_to_vector_store
 
+from api.service.storage import get_original_filename
 from api.service.storage.minio_storage import MinioStorage
+from api.common.multipart_stream import StreamingMultipartParser, get_multipart_boundary
 from api.service.llm.gpt35 import Gpt35LLMService
-from api.common.utils import is_allowed_content_type, get_filename_from_signed_url
-from api.schemas.upload import UploadResponse, UploadListResponse
+from api.common.utils import (
+    FILE_SIGNATURE_LENGTH,
+    is_allowed_content_type,
+    get_content_type_from_signature,
+    get_filename_from_signed_url,
+    format_sse_event,
+    get_traceback_str,
+)
+from api.schemas.upload import (
+    UploadResponse,
+    UploadListResponse,
+    PresignedUploadRequest,
+    PresignedUploadResponse,
+    ResumeUploadRequest,
+    FinalizeUploadRequest,
+)
 from api.common.error import (
     ObjectStorageError,
     UnsupportedFileTypeError,
+    InvalidMultipartRequestError,
     ObjectStorageFileNotFoundError,
     LlmError,
     APIError,
 )
 from api.schemas.ocr import OcrRequest, OcrResponse
-from api.schemas.extract import ExtractRequest, ExtractResponse
+from api.schemas.extract import (
+    ExtractRequest,
+    ExtractResponse,
+    ExtractStreamMetadata,
+    ExtractBatchRequest,
+    ExtractBatchResult,
+    ExtractBatchResponse,
+)
 from config import app_config
 
 logger = logging.getLogger(__name__)
@@ -27,9 +53,37 @@ llm_service = Gpt35LLMService(
     openai_api_key=app_config.openai_api_key,
     vector_db_url=app_config.llm_vector_db_url,
     vector_db_collection_name=app_config.llm_vector_db_collection_name,
+    vector_db_partitions=app_config.llm_vector_db_partitions,
+    vector_on_disk=app_config.llm_vector_db_on_disk,
+    hnsw_m=app_config.llm_vector_db_hnsw_m,
+    hnsw_ef_construct=app_config.llm_vector_db_hnsw_ef_construct,
+    quantization=app_config.llm_vector_db_quantization,
+    quantization_always_ram=app_config.llm_vector_db_quantization_always_ram,
+    quantization_rescore=app_config.llm_vector_search_rescore,
+    quantization_oversampling=app_config.llm_vector_search_oversampling,
     text_split_chunk_size=app_config.llm_preprocess_chunk_size,
     text_split_chunk_overlap=app_config.llm_preprocess_chunk_overlap,
     vector_search_top_k=app_config.llm_vector_search_top_k,
+    vector_search_mode=app_config.llm_vector_search_mode,
+    hybrid_search_candidates=app_config.llm_hybrid_search_candidates,
+    retrieval_candidates=app_config.llm_retrieval_candidates,
+    mmr_lambda=app_config.llm_retrieval_mmr_lambda,
+    reranker_model=app_config.llm_retrieval_reranker_model,
+    retrieval_max_tokens=app_config.llm_retrieval_max_tokens,
+    embedding_backend=app_config.llm_embedding_backend,
+    embedding_model=app_config.llm_embedding_model,
+    embedding_dimensions=app_config.llm_embedding_dimensions,
+    embedding_cache_path=app_config.llm_embedding_cache_path,
+    embedding_cache_memory_size=app_config.llm_embedding_cache_memory_size,
+    embedding_batch_max_tokens=app_config.llm_embedding_batch_max_tokens,
+    embedding_batch_max_size=app_config.llm_embedding_batch_max_size,
+    embedding_max_concurrency=app_config.llm_embedding_max_concurrency,
+    import_queue_depth=app_config.llm_import_queue_depth,
+    text_split_workers=app_config.llm_preprocess_split_workers,
+    answer_cache_size=app_config.llm_answer_cache_size,
+    answer_cache_ttl_seconds=app_config.llm_answer_cache_ttl_seconds,
+    answer_cache_similarity_threshold=app_config.llm_answer_cache_similarity_threshold,
+    batch_query_max_concurrency=app_config.llm_batch_query_max_concurrency,
 )
 
 
@@ -38,6 +92,9 @@ object_storage_service = MinioStorage(
     bucket_name=app_config.storage_bucket_name,
     access_key=app_config.storage_access_key,
     secret_key=app_config.storage_secret_key,
+    existence_cache_size=app_config.storage_existence_cache_size,
+    existence_cache_ttl_seconds=app_config.storage_existence_cache_ttl_seconds,
+    deduplicate_uploads=app_config.storage_deduplicate_uploads,
 )
 
 
@@ -51,11 +108,11 @@ async def upload(files: list[UploadFile]) -> UploadListResponse:
         - list of UploadFile objects
 
     Returns:
-        - UploadResultResponse
+        - UploadListResponse. Results are in the same order as the files and contain per-file errors
 
     Raises:
         - UnsupportedFileTypeError if any file type of the uploaded file is not among supported types
-        - ObjectStorageError if there is problem with object storage service
+        - ObjectStorageError if there is problem with object storage service for all files
     """
 
     logger.info(f"Got file upload request: {len(files)} files")
@@ -73,27 +130,254 @@ async def upload(files: list[UploadFile]) -> UploadListResponse:
         )
         raise UnsupportedFileTypeError(not_allowed_files_str)
 
-    # start uploading operations
+    # start uploading operations. Files are uploaded concurrently and failed files are reported in the results
+    semaphore = asyncio.Semaphore(app_config.storage_upload_max_concurrency)
+    outcomes = await asyncio.gather(*[_upload_file(file, semaphore) for file in files])
+
+    return _get_upload_list_response([file.filename for file in files], outcomes)
+
+
+@router.post("/upload/stream")
+async def upload_stream(request: Request) -> UploadListResponse:
+    """
+    Streaming version of upload endpoint for large files. The multipart/form-data body is parsed as it arrives and
+    each file is piped into a multipart upload of the object storage, so the files are not spooled to temporary
+    files and memory usage is bounded by the part size. For more information, please refer to README
+
+    Args:
+        - multipart/form-data request body with files
+
+    Returns:
+        - UploadListResponse. Results are in the same order as the files and contain per-file errors
+
+    Raises:
+        - InvalidMultipartRequestError if the request body is not valid multipart/form-data
+        - UnsupportedFileTypeError if all files are not among supported types
+        - ObjectStorageError if there is problem with object storage service for all files
+    """
+    parser = StreamingMultipartParser(
+        request.stream(), get_multipart_boundary(request.headers.get("Content-Type"))
+    )
+    part_size = app_config.storage_upload_part_size_mb * 1024 * 1024
+
+    filenames = []
+    outcomes = []
+
+    # the body is read sequentially, so the files are uploaded one by one
+    async for part in parser.iter_parts():
+        # form fields other than files are ignored
+        if part.filename is None:
+            continue
+
+        logger.info(f"Got streaming upload of file {part.filename}")
+        filenames.append(part.filename)
+
+        if not is_allowed_content_type(part.content_type):
+            logger.error(
+                f"The request contains unsupported file type > {part.filename}"
+            )
+            outcomes.append(UnsupportedFileTypeError(part.filename))
+            continue
+
+        try:
+            outcome = await object_storage_service.aupload_stream(
+                part.filename, part.data, part_size
+            )
+
+        except ObjectStorageError as err:
+            logger.exception(
+                f"There is a problem with object storage while uploading {part.filename}"
+            )
+            outcome = err
+
+        except InvalidMultipartRequestError:
+            raise
+
+        except Exception as err:
+            logger.exception(f"Unexpected error while uploading {part.filename}")
+            outcome = APIError("Unknown error")
+
+        outcomes.append(outcome)
+
+    if not filenames:
+        raise InvalidMultipartRequestError("The request does not contain files")
+
+    return _get_upload_list_response(filenames, outcomes)
+
+
+@router.post("/upload/presigned")
+async def create_presigned_upload(
+    request: PresignedUploadRequest,
+) -> PresignedUploadResponse:
+    """
+    Presigned upload endpoint. It returns presigned urls to upload the parts of the file directly to the object storage,
+    so the file data does not pass through the API. The upload is completed by the finalize endpoint.
+    For more information, please refer to README
+
+    Args:
+        - PresignedUploadRequest object
+
+    Returns:
+        - PresignedUploadResponse object
+
+    Raises:
+        - UnsupportedFileTypeError if the declared content type is not among supported types
+        - ObjectStorageError if there is problem with object storage service
+    """
+    logger.info(
+        f"Got presigned upload request of file {request.filename} ({request.file_length_in_bytes} bytes)"
+    )
+
+    if not is_allowed_content_type(request.content_type):
+        logger.error(f"The request contains unsupported file type > {request.filename}")
+        raise UnsupportedFileTypeError(request.filename)
+
+    presigned_upload = await object_storage_service.acreate_presigned_upload(
+        request.filename,
+        request.file_length_in_bytes,
+        app_config.storage_upload_part_size_mb * 1024 * 1024,
+        app_config.storage_presigned_upload_expiration_seconds,
+    )
+
+    return PresignedUploadResponse(
+        filename=presigned_upload.filename,
+        stored_filename=presigned_upload.stored_filename,
+        upload_id=presigned_upload.upload_id,
+        part_size_in_bytes=presigned_upload.part_size_in_bytes,
+        part_urls=presigned_upload.part_urls,
+    )
+
+
+@router.post("/upload/presigned/resume")
+async def resume_presigned_upload(
+    request: ResumeUploadRequest,
+) -> PresignedUploadResponse:
+    """
+    Resume endpoint of presigned upload. It returns renewed presigned urls and the numbers of the uploaded parts,
+    so an interrupted upload continues with the missing parts instead of restarting. For more information, please refer to README
+
+    Args:
+        - ResumeUploadRequest object
+
+    Returns:
+        - PresignedUploadResponse object
+
+    Raises:
+        - ObjectStorageFileNotFoundError if the upload does not exist (e.g. it is already finalized)
+        - ObjectStorageError if there is problem with object storage service
+    """
+    logger.info(f"Got resume request of presigned upload {request.upload_id}")
+
+    presigned_upload = await object_storage_service.aresume_presigned_upload(
+        request.upload_id, app_config.storage_presigned_upload_expiration_seconds
+    )
+
+    return PresignedUploadResponse(
+        filename=presigned_upload.filename,
+        stored_filename=presigned_upload.stored_filename,
+        upload_id=presigned_upload.upload_id,
+        part_size_in_bytes=presigned_upload.part_size_in_bytes,
+        part_urls=presigned_upload.part_urls,
+        uploaded_parts=presigned_upload.uploaded_parts,
+    )
+
+
+@router.post("/upload/presigned/finalize")
+async def finalize_presigned_upload(request: FinalizeUploadRequest) -> UploadResponse:
+    """
+    Finalize endpoint of presigned upload. It completes the upload after all parts are uploaded and
+    checks the file type from the first bytes of the stored file. The file with unsupported type is deleted.
+    For more information, please refer to README
+
+    Args:
+        - FinalizeUploadRequest object
+
+    Returns:
+        - UploadResponse object with signed URL of the file (same as upload endpoint)
+
+    Raises:
+        - IncompleteUploadError if not all parts are uploaded
+        - ObjectStorageFileNotFoundError if the upload does not exist (e.g. it is already finalized)
+        - UnsupportedFileTypeError if the uploaded file is not among supported types
+        - ObjectStorageError if there is problem with object storage service
+    """
+    filename = get_original_filename(request.stored_filename)
+    logger.info(f"Got finalize request of presigned upload of file {filename}")
+
+    signed_url = await object_storage_service.acomplete_presigned_upload(
+        request.stored_filename, request.upload_id
+    )
+
+    # the content type declared by the client is not trusted
+    head = await object_storage_service.aread_range(
+        request.stored_filename, 0, FILE_SIGNATURE_LENGTH
+    )
+    if get_content_type_from_signature(head) is None:
+        logger.error(f"The uploaded file has unsupported file type > {filename}")
+        await object_storage_service.adelete(request.stored_filename)
+        raise UnsupportedFileTypeError(filename)
+
+    return UploadResponse(filename=filename, signed_url=signed_url)
+
+
+def _get_upload_list_response(
+    filenames: List[str], outcomes: List[Union[str, APIError]]
+) -> UploadListResponse:
+    """
+    Private function to build the response of upload endpoints from the signed URL or the error of each file
+
+    Raises:
+        - the error of the first file if all files failed
+    """
+    errors = [outcome for outcome in outcomes if isinstance(outcome, Exception)]
+    if errors and len(errors) == len(outcomes):
+        # nothing could be uploaded (e.g. object storage is down), so the whole request fails
+        raise errors[0]
+
     upload_results = []
-    try:
-        for file in files:
-            file_id = await run_in_threadpool(
-                object_storage_service.upload, file.filename, file.file, file.size
+    for filename, outcome in zip(filenames, outcomes):
+        if isinstance(outcome, Exception):
+            upload_results.append(
+                UploadResponse(
+                    filename=filename,
+                    signed_url=None,
+                    error_code=outcome.__class__.__name__,
+                    detail=get_traceback_str(outcome, debug=app_config.debug),
+                )
             )
-            # file_id = object_storage_service.upload(file.filename, file.file, file.size)
-            result = UploadResponse(filename=file.filename, signed_url=file_id)
-            upload_results.append(result)
+        else:
+            upload_results.append(UploadResponse(filename=filename, signed_url=outcome))
 
-        logger.info(f"All files are uploaded")
-    except ObjectStorageError as err:
-        logger.exception("There is a problem with object storage while uploading")
-        raise
-    except Exception as err:
-        raise APIError("Unknown error") from err
+    logger.info(f"{len(outcomes) - len(errors)} of {len(outcomes)} files are uploaded")
 
     return UploadListResponse(upload_results=upload_results)
 
 
+async def _upload_file(
+    file: UploadFile, semaphore: asyncio.Semaphore
+) -> Union[str, APIError]:
+    """
+    Private function to upload one file of the upload request.
+    Errors are returned instead of raised, so the other files of the request are still uploaded
+
+    Returns:
+        - signed URL of the uploaded file, or the error
+    """
+    try:
+        async with semaphore:
+            return await object_storage_service.aupload(file.filename, file, file.size)
+
+    except ObjectStorageError as err:
+        logger.exception(
+            f"There is a problem with object storage while uploading {file.filename}"
+        )
+        return err
+
+    except Exception as err:
+        logger.exception(f"Unexpected error while uploading {file.filename}")
+        return APIError("Unknown error")
+
+
 @router.post("/ocr")
 async def mock_ocr(request: OcrRequest, response: Response) -> OcrResponse:
     """
@@ -196,11 +480,10 @@ async def extract(request: ExtractRequest) -> ExtractResponse:
         filename = get_filename_from_signed_url(signed_url)
         logger.info(f"Got extract request for file {filename}")
 
-        if not object_storage_service.contains_file(filename):
+        if not await object_storage_service.acontains_file(filename):
             raise ObjectStorageFileNotFoundError
 
-        result = await run_in_threadpool(llm_service.query, query, signed_url)
-        # result = llm_service.query(query, signed_url)
+        result = await llm_service.aquery(query, signed_url)
 
         return ExtractResponse(
             query=query, signed_url=signed_url, filename=filename, response=result
@@ -220,6 +503,155 @@ async def extract(request: ExtractRequest) -> ExtractResponse:
         raise APIError from err
 
 
+@router.post("/extract/batch")
+async def extract_batch(request: ExtractBatchRequest) -> ExtractBatchResponse:
+    """
+    Batch extract endpoint for asking many queries about the same file. For more information, please refer to README
+
+    Args:
+        - queries: list of query texts
+        - signed_url:  the document to be used as context
+
+    Returns:
+        - ExtractBatchResponse. Results are in the same order as the queries and contain per-query errors
+
+    Raises:
+        - ObjectStorageFileNotFoundError if file does not exist
+        - LlmError if there is problem with embedding or vector search
+        - ApiError for unexepected error
+    """
+
+    signed_url = request.signed_url
+
+    try:
+        filename = get_filename_from_signed_url(signed_url)
+        logger.info(
+            f"Got batch extract request with {len(request.queries)} queries for file {filename}"
+        )
+
+        if not await object_storage_service.acontains_file(filename):
+            raise ObjectStorageFileNotFoundError
+
+        answers = await llm_service.abatch_query(request.queries, signed_url)
+
+        results = []
+        for query, answer in zip(request.queries, answers):
+            if isinstance(answer, Exception):
+                results.append(
+                    ExtractBatchResult(
+                        query=query,
+                        error_code=answer.__class__.__name__,
+                        detail=get_traceback_str(answer, debug=app_config.debug),
+                    )
+                )
+            else:
+                results.append(ExtractBatchResult(query=query, response=answer))
+
+        return ExtractBatchResponse(
+            signed_url=signed_url, filename=filename, results=results
+        )
+    except ObjectStorageFileNotFoundError as err:
+        logger.error(
+            f"Abort extract operation as file {filename} does not exist on the object storage. "
+        )
+        raise err
+
+    except LlmError as err:
+        logger.exception(f"Abort extract operation due to problem with LLM backend")
+        raise err
+
+    except Exception as err:
+        logger.exception(f"Abort extract operation due to unexpected problem")
+        raise APIError from err
+
+
+@router.post("/extract/stream")
+async def extract_stream(request: ExtractRequest) -> StreamingResponse:
+    """
+    Streaming version of extract endpoint. The response is sent as Server-Sent Events.
+    For more information, please refer to README
+
+    Args:
+        - query: query text
+        - signed_url:  the document to be used as context
+
+    Returns:
+        - StreamingResponse of metadata, token, and done (or error) events
+
+    Raises:
+        - ObjectStorageFileNotFoundError if file does not exist
+        - LlmError if there is problem with llm service during retrieval
+        - ApiError for unexepected error
+    """
+
+    query = request.query
+    signed_url = request.signed_url
+
+    try:
+        filename = get_filename_from_signed_url(signed_url)
+        logger.info(f"Got streaming extract request for file {filename}")
+
+        if not await object_storage_service.acontains_file(filename):
+            raise ObjectStorageFileNotFoundError
+
+        # the context is retrieved here, so errors of retrieval are returned as error response.
+        # The stream starts before LLM is called, and errors of LLM are sent as error event
+        pieces = await llm_service.astream_query(query, signed_url)
+
+    except ObjectStorageFileNotFoundError as err:
+        logger.error(
+            f"Abort extract operation as file {filename} does not exist on the object storage. "
+        )
+        raise err
+
+    except LlmError as err:
+        logger.exception(f"Abort extract operation due to problem with LLM backend")
+        raise err
+
+    except Exception as err:
+        logger.exception(f"Abort extract operation due to unexpected problem")
+        raise APIError from err
+
+    metadata = ExtractStreamMetadata(
+        query=query, signed_url=signed_url, filename=filename
+    )
+
+    return StreamingResponse(
+        _iter_extract_events(metadata, pieces),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _iter_extract_events(
+    metadata: ExtractStreamMetadata, pieces: AsyncIterator[str]
+) -> AsyncIterator[str]:
+    """
+    Private function to produce SSE messages of the streaming extract endpoint.
+    Errors after the response has started are sent as error event because HTTP status cannot be changed anymore
+    """
+    yield format_sse_event("metadata", metadata.model_dump_json())
+
+    try:
+        async for piece in pieces:
+            yield format_sse_event(
+                "token", json.dumps(dict(token=piece), ensure_ascii=False)
+            )
+
+    except Exception as err:
+        logger.exception(f"Abort extract streaming due to problem with LLM backend")
+
+        error = err if isinstance(err, LlmError) else APIError()
+        content = dict(
+            error_code=error.__class__.__name__,
+            detail=get_traceback_str(error, debug=app_config.debug),
+        )
+        yield format_sse_event("error", json.dumps(content, ensure_ascii=False))
+        return
+
+    yield format_sse_event("done", "{}")
+
+
 @router.get("/health")
 async def health_check() -> JSONResponse:
     """
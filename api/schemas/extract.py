@@ -1,4 +1,6 @@
-from pydantic import BaseModel
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
 
 
 class ExtractRequest(BaseModel):
@@ -19,3 +21,43 @@ class ExtractResponse(BaseModel):
     signed_url: str
     filename: str
     response: str
+
+
+class ExtractStreamMetadata(BaseModel):
+    """
+    First event of the streaming extract endpoint. For more information, please refer to README.
+    """
+
+    query: str
+    signed_url: str
+    filename: str
+
+
+class ExtractBatchRequest(BaseModel):
+    """
+    Request payload for batch extract endpoint. For more information, please refer to README.
+    """
+
+    queries: List[str] = Field(min_length=1, max_length=100)
+    signed_url: str
+
+
+class ExtractBatchResult(BaseModel):
+    """
+    Result of one query in batch extract response. Either response or error fields are set
+    """
+
+    query: str
+    response: Optional[str] = None
+    error_code: Optional[str] = None
+    detail: Optional[str] = None
+
+
+class ExtractBatchResponse(BaseModel):
+    """
+    Response payload for batch extract endpoint. For more information, please refer to README.
+    """
+
+    signed_url: str
+    filename: str
+    results: List[ExtractBatchResult]
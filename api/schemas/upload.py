@@ -1,14 +1,17 @@
-from pydantic import BaseModel
-from typing import List
+from pydantic import BaseModel, Field
+from typing import List, Optional
 
 
 class UploadResponse(BaseModel):
     """
-    Response payload for upload endpoint. For more information, please refer to README.
+    Result of one file in upload response. Either signed_url or error fields are set.
+    For more information, please refer to README.
     """
 
     filename: str
     signed_url: str | None
+    error_code: Optional[str] = None
+    detail: Optional[str] = None
 
 
 class UploadListResponse(BaseModel):
@@ -17,3 +20,43 @@ class UploadListResponse(BaseModel):
     """
 
     upload_results: List[UploadResponse]
+
+
+class PresignedUploadRequest(BaseModel):
+    """
+    Request payload for presigned upload endpoint. For more information, please refer to README.
+    """
+
+    filename: str
+    content_type: str
+    file_length_in_bytes: int = Field(gt=0, le=5 * 1024**4)
+
+
+class PresignedUploadResponse(BaseModel):
+    """
+    Response payload for presigned upload endpoint. For more information, please refer to README.
+    """
+
+    filename: str
+    stored_filename: str
+    upload_id: str
+    part_size_in_bytes: int
+    part_urls: List[str]
+    uploaded_parts: List[int] = []
+
+
+class ResumeUploadRequest(BaseModel):
+    """
+    Request payload for resume endpoint of presigned upload. For more information, please refer to README.
+    """
+
+    upload_id: str
+
+
+class FinalizeUploadRequest(BaseModel):
+    """
+    Request payload for finalize endpoint of presigned upload. For more information, please refer to README.
+    """
+
+    stored_filename: str
+    upload_id: str
@@ -3,7 +3,7 @@ import os
 from langchain_community.document_loaders.json_loader import JSONLoader
 from langchain_core.documents import Document
 from abc import ABC, abstractmethod
-from typing import List
+from typing import AsyncIterator, Iterator, List, Union
 
 
 # Define the metadata extraction function.
@@ -79,28 +79,70 @@ class LLMService(ABC):
         pass
 
     @abstractmethod
-    def _split_texts(self, docs: List[Document], **kwargs) -> List[Document]:
+    async def aquery(self, query_string: str, filename: str) -> str:
         """
-        Private function to split original document to smaller chunks
+        Async version of query function. It does not block the event loop while waiting for vector db and LLM
+
         Args:
-            - docs: list of Documents
+            - query_string: input query
+            - filename: the target filename
 
         Returns:
-            - list of spliited documents
+            - string response from LLM
+
+        Raises:
+            - LLMError family if there is problem with the openai or langchain
         """
         pass
 
     @abstractmethod
-    def _get_retriever(self, filename: str, top_k=1) -> List[Document]:
+    async def astream_query(
+        self, query_string: str, filename: str
+    ) -> AsyncIterator[str]:
         """
-        Private function to get vector db retriever with filename filtering
+        Streaming version of aquery function. Awaiting it retrieves the context of the query,
+        then the returned iterator yields the response piece by piece while LLM is generating it
 
         Args:
             - query_string: input query
             - filename: the target filename
-            - top_k (optional): the number of the top-k most relevant documents to be retrieved
 
         Returns:
-            - retriever for the target file
+            - async iterator of response pieces
+
+        Raises:
+            - LLMError family if there is problem with the openai or langchain (also raised by the iterator)
+        """
+        pass
+
+    @abstractmethod
+    async def abatch_query(
+        self, queries: List[str], filename: str
+    ) -> List[Union[str, Exception]]:
+        """
+        Function to answer many queries against the same file.
+        Queries are embedded and searched together, then answered concurrently
+
+        Args:
+            - queries: list of input queries
+            - filename: the target filename
+
+        Returns:
+            - list of string response or LLMError (if the query failed) in the same order as the queries
+
+        Raises:
+            - LLMError family if embedding or vector search failed (for all queries)
+        """
+        pass
+
+    @abstractmethod
+    def _split_texts(self, docs: List[Document], **kwargs) -> Iterator[Document]:
+        """
+        Private function to split original document to smaller chunks
+        Args:
+            - docs: list of Documents
+
+        Returns:
+            - iterator of spliited documents. Chunks are produced lazily
         """
         pass
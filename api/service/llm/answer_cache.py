@@ -0,0 +1,207 @@
+import logging
+from threading import Lock
+from typing import Dict, NamedTuple, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from api.common.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class CachedAnswer(NamedTuple):
+    # normalized embedding of the query
+    query_vector: np.ndarray
+
+    # ids of the retrieved chunks used as the context of the answer
+    chunk_ids: Tuple[str, ...]
+
+    answer: str
+
+
+def normalize_query(query: str) -> str:
+    """
+    Function to normalize the query for exact matching (whitespaces are collapsed)
+    """
+    return " ".join(query.split())
+
+
+class AnswerCache:
+    """
+    Thread-safe cache of LLM answers per source document.
+
+    An answer is returned for
+    - exact match: the same (normalized) query against the same source. The cached query embedding is returned,
+      so the query is not embedded again. The caller should check that the retrieved chunks are still the same
+    - semantic match: cosine similarity between the query embeddings is above the threshold
+      and the retrieved chunks are the same as the ones used for the cached answer
+
+    Answers without context (no chunks retrieved) are not cached, since the content may be imported later.
+    Entries are evicted by LRU and TTL. The entries of a source should be invalidated when the source is re-imported.
+
+    Args:
+        - max_size: maximum number of cached answers. 0 disables the cache
+        - ttl_seconds: lifetime of a cached answer. 0 disables the cache
+        - similarity_threshold: minimum cosine similarity of the query embeddings for semantic match
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1000,
+        ttl_seconds: float = 3600,
+        similarity_threshold: float = 0.95,
+    ) -> None:
+        self.max_size = max_size
+        self.similarity_threshold = similarity_threshold
+
+        # (source, normalized query) -> CachedAnswer
+        self._entries = TTLCache(max_size, ttl_seconds)
+
+        # source -> keys of its entries. Keys of evicted entries are removed lazily
+        self._keys_by_source: Dict[str, Set[Tuple[str, str]]] = {}
+        self._lock = Lock()
+
+    def get(self, source: str, query: str) -> Optional[CachedAnswer]:
+        """
+        Get the cached answer of the exact query with its query embedding and context
+
+        Args:
+            - source: the target filename
+            - query: input query
+
+        Returns:
+            - cached answer or None
+        """
+        return self._entries.get((source, normalize_query(query)))
+
+    def find_similar(
+        self, source: str, query_vector: Sequence[float], chunk_ids: Sequence[str]
+    ) -> Optional[str]:
+        """
+        Get the cached answer of the most similar query which used the same context
+
+        Args:
+            - source: the target filename
+            - query_vector: embedding of the query
+            - chunk_ids: ids of the retrieved chunks for the query
+
+        Returns:
+            - cached answer or None
+        """
+        vector = self._normalize_vector(query_vector)
+        chunk_ids = tuple(chunk_ids)
+
+        with self._lock:
+            keys = list(self._keys_by_source.get(source, ()))
+
+        best_answer = None
+        best_similarity = self.similarity_threshold
+        for key in keys:
+            entry: Optional[CachedAnswer] = self._entries.get(key)
+            if entry is None:
+                self._discard_key(source, key)
+                continue
+
+            if entry.chunk_ids != chunk_ids:
+                continue
+
+            similarity = float(np.dot(vector, entry.query_vector))
+            if similarity >= best_similarity:
+                best_similarity = similarity
+                best_answer = entry.answer
+
+        return best_answer
+
+    def put(
+        self,
+        source: str,
+        query: str,
+        query_vector: Sequence[float],
+        chunk_ids: Sequence[str],
+        answer: str,
+    ) -> None:
+        """
+        Store the answer in the cache
+
+        Args:
+            - source: the target filename
+            - query: input query
+            - query_vector: embedding of the query
+            - chunk_ids: ids of the retrieved chunks used as the context
+            - answer: answer from LLM
+        """
+        if self.max_size <= 0 or len(chunk_ids) == 0:
+            return
+
+        key = (source, normalize_query(query))
+        entry = CachedAnswer(
+            query_vector=self._normalize_vector(query_vector),
+            chunk_ids=tuple(chunk_ids),
+            answer=answer,
+        )
+        self._entries.put(key, entry)
+
+        with self._lock:
+            self._keys_by_source.setdefault(source, set()).add(key)
+            tracked = sum(len(keys) for keys in self._keys_by_source.values())
+
+        if tracked > 2 * self.max_size:
+            self._prune()
+
+    def invalidate(self, source: str) -> None:
+        """
+        Remove all cached answers of the source
+
+        Args:
+            - source: the target filename
+        """
+        with self._lock:
+            keys = self._keys_by_source.pop(source, set())
+
+        for key in keys:
+            self._entries.pop(key)
+
+        if keys:
+            logger.info(f"Invalidated {len(keys)} cached answers of {source}")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._keys_by_source.clear()
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _discard_key(self, source: str, key: Tuple[str, str]) -> None:
+        with self._lock:
+            keys = self._keys_by_source.get(source)
+            if keys is None:
+                return
+
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_source[source]
+
+    def _prune(self) -> None:
+        """
+        Private function to forget the keys of evicted or expired entries
+        """
+        with self._lock:
+            items = [
+                (source, key)
+                for source, keys in self._keys_by_source.items()
+                for key in keys
+            ]
+
+        for source, key in items:
+            if key not in self._entries:
+                self._discard_key(source, key)
+
+    @staticmethod
+    def _normalize_vector(vector: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return vector
+
+        return vector / norm
@@ -0,0 +1,151 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore, Lock
+from typing import Any, Callable, Iterable, Iterator, List, Optional
+
+import openai
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+
+class BatchedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that packs texts into token-budgeted batches and embeds several batches concurrently.
+    When the wrapped embeddings raise RateLimitError, the batch size is halved and the failed batch is retried
+    in smaller pieces after a backoff. The batch size grows back gradually after successful requests.
+
+    Args:
+        - embeddings: the wrapped embeddings. Each call of embed_documents should be one api request
+        - max_batch_tokens: maximum number of tokens in one request
+        - max_batch_size: maximum number of texts in one request
+        - max_concurrency: maximum number of requests in flight. It is shared by all callers of this instance
+          (e.g. the embedding workers of the import pipeline), so nested concurrency does not multiply it
+        - max_retries: maximum number of retries of a batch after RateLimitError
+        - retry_wait_seconds: initial backoff. It is doubled after every retry of the same batch
+        - length_function: function to count tokens of a text. Default is number of characters
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        max_batch_tokens: int = 50000,
+        max_batch_size: int = 512,
+        max_concurrency: int = 4,
+        max_retries: int = 6,
+        retry_wait_seconds: float = 1.0,
+        length_function: Callable[[str], int] = len,
+    ) -> None:
+        self.embeddings = embeddings
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max_retries
+        self.retry_wait_seconds = retry_wait_seconds
+        self.length_function = length_function
+
+        self._lock = Lock()
+        self._request_slots = BoundedSemaphore(self.max_concurrency)
+        self.batch_size = max_batch_size
+
+    def pack_batches(
+        self, items: Iterable[Any], get_text: Optional[Callable[[Any], str]] = None
+    ) -> Iterator[List[Any]]:
+        """
+        Pack texts into batches limited by the current batch size and the token budget.
+        The input is consumed lazily and the order is preserved.
+
+        Args:
+            - items: texts to be embedded, or any objects containing the texts
+            - get_text: function to get text from an item. If None, items are texts
+
+        Returns:
+            - iterator of batches
+        """
+        batch = []
+        batch_tokens = 0
+        for item in items:
+            text = item if get_text is None else get_text(item)
+            tokens = self.length_function(text)
+
+            if batch and (
+                len(batch) >= self.batch_size
+                or batch_tokens + tokens > self.max_batch_tokens
+            ):
+                yield batch
+                batch = []
+                batch_tokens = 0
+
+            batch.append(item)
+            batch_tokens += tokens
+
+        if batch:
+            yield batch
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        batches = list(self.pack_batches(texts))
+        if len(batches) <= 1:
+            return [vector for batch in batches for vector in self.embed_batch(batch)]
+
+        with ThreadPoolExecutor(
+            max_workers=min(self.max_concurrency, len(batches))
+        ) as executor:
+            results = executor.map(self.embed_batch, batches)
+            return [vector for vectors in results for vector in vectors]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.embeddings.aembed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        # like aembed_query, async requests (queries) are sent directly without batching
+        return await self.embeddings.aembed_documents(texts)
+
+    def embed_batch(self, texts: List[str], attempt: int = 0) -> List[List[float]]:
+        """
+        Embed one batch. On RateLimitError, the batch is splitted by the reduced batch size and retried
+
+        Args:
+            - texts: batch of texts
+            - attempt: number of retries of this batch so far
+
+        Returns:
+            - list of vectors
+
+        Raises:
+            - openai.RateLimitError if the batch still fails after max_retries
+        """
+        try:
+            with self._request_slots:
+                vectors = self.embeddings.embed_documents(texts)
+
+        except openai.RateLimitError:
+            if attempt >= self.max_retries:
+                raise
+
+            with self._lock:
+                self.batch_size = max(1, min(self.batch_size, len(texts)) // 2)
+                batch_size = self.batch_size
+
+            wait_seconds = self.retry_wait_seconds * (2**attempt)
+            logger.warning(
+                f"Embedding api is rate limited. Retry in {wait_seconds}s with batch size {batch_size}"
+            )
+            time.sleep(wait_seconds)
+
+            vectors = []
+            for i in range(0, len(texts), batch_size):
+                vectors.extend(self.embed_batch(texts[i : i + batch_size], attempt + 1))
+
+            return vectors
+
+        with self._lock:
+            if self.batch_size < self.max_batch_size:
+                self.batch_size = min(
+                    self.max_batch_size, self.batch_size + max(1, self.batch_size // 8)
+                )
+
+        return vectors
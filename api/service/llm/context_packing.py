@@ -0,0 +1,122 @@
+import logging
+from itertools import groupby
+from typing import Callable, List
+
+from langchain_core.documents import Document
+
+from api.service.llm.reranking import trim_to_token_budget
+
+logger = logging.getLogger(__name__)
+
+# shortest overlap of adjacent chunks that is removed when they are merged.
+# Shorter matches (e.g. a shared punctuation mark) are likely accidental
+MIN_OVERLAP_CHARS = 8
+
+# separator of adjacent chunks without overlap and of the passages in the context
+CHUNK_SEPARATOR = "\n"
+PASSAGE_SEPARATOR = "\n\n"
+
+
+def get_overlap_length(
+    previous: str, text: str, min_overlap: int = MIN_OVERLAP_CHARS
+) -> int:
+    """
+    Function to get the length of the longest suffix of the previous chunk that is a prefix of the text.
+    The text splitter starts each chunk with the last pieces of the previous chunk (chunk overlap)
+
+    Args:
+        - previous: text of the previous chunk
+        - text: text of the next chunk
+        - min_overlap: shortest overlap in characters
+
+    Returns:
+        - number of overlapping characters, 0 if there is no overlap
+    """
+    if min(len(previous), len(text)) < min_overlap:
+        return 0
+
+    head = text[:min_overlap]
+    start = previous.find(head, max(len(previous) - len(text), 0))
+    while start >= 0:
+        # the earliest match is the longest overlap
+        if text.startswith(previous[start:]):
+            return len(previous) - start
+
+        start = previous.find(head, start + 1)
+
+    return 0
+
+
+def merge_adjacent_chunks(docs: List[Document]) -> List[Document]:
+    """
+    Function to merge the retrieved chunks that are adjacent in their original document into one passage.
+    The duplicated overlap of adjacent chunks is removed. Chunks without content_hash and chunk_index metadata
+    (e.g. imported by older versions) are kept as they are
+
+    Args:
+        - docs: retrieved chunks ordered by relevance
+
+    Returns:
+        - passages ordered by their most relevant chunk. Each passage has the metadata of its first chunk
+    """
+    ranked_passages = []
+    chunks = {}
+    for rank, doc in enumerate(docs):
+        content_hash = doc.metadata.get("content_hash")
+        chunk_index = doc.metadata.get("chunk_index")
+        if content_hash is None or chunk_index is None:
+            ranked_passages.append((rank, doc))
+        else:
+            chunks.setdefault((content_hash, chunk_index), (rank, doc))
+
+    # consecutive chunk indices of the same document minus their position form one run
+    ordered_keys = sorted(chunks)
+    for _, run in groupby(
+        enumerate(ordered_keys), key=lambda item: (item[1][0], item[1][1] - item[0])
+    ):
+        run = [chunks[key] for _, key in run]
+        text = run[0][1].page_content
+        for _, doc in run[1:]:
+            overlap = get_overlap_length(text, doc.page_content)
+            if overlap > 0:
+                text += doc.page_content[overlap:]
+            else:
+                text += CHUNK_SEPARATOR + doc.page_content
+
+        passage = run[0][1]
+        if len(run) > 1:
+            passage = Document(page_content=text, metadata=dict(passage.metadata))
+
+        ranked_passages.append((min(rank for rank, _ in run), passage))
+
+    ranked_passages.sort(key=lambda item: item[0])
+    return [passage for _, passage in ranked_passages]
+
+
+def pack_context(
+    docs: List[Document], max_tokens: int, length_function: Callable[[str], int]
+) -> List[Document]:
+    """
+    Function to pack the retrieved chunks into the passages of the prompt context.
+    Adjacent chunks are merged and the passages exceeding the token budget are dropped (least relevant first)
+
+    Args:
+        - docs: retrieved chunks ordered by relevance
+        - max_tokens: token budget of the passages. 0 means no limit
+        - length_function: function to count tokens of a text
+
+    Returns:
+        - passages ordered by relevance
+    """
+    passages = merge_adjacent_chunks(docs)
+    if max_tokens > 0:
+        passages = trim_to_token_budget(passages, max_tokens, length_function)
+
+    return passages
+
+
+def format_context(passages: List[Document]) -> str:
+    """
+    Function to format the passages as the context of the prompt (texts only, without metadata)
+    """
+    return PASSAGE_SEPARATOR.join(passage.page_content for passage in passages)
@@ -0,0 +1,282 @@
+import logging
+import re
+from abc import ABC, abstractmethod
+from functools import lru_cache, partial
+from hashlib import blake2b
+from typing import Callable, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+
+from api.service.llm.splitter import count_tokens
+from api.service.llm.vector_db_config import get_vector_size
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_BACKENDS = ["openai", "local", "hash"]
+
+
+class EmbeddingBackend(ABC):
+    """
+    Backend that produces the embeddings of documents and queries.
+    The embeddings are wrapped by BatchedEmbeddings and CachedEmbeddings in the llm service,
+    so a backend only has to embed one batch of texts per embed_documents call
+    """
+
+    # name of the backend. It is part of the embedding cache key and collection name (except openai)
+    name: str
+
+    # maximum number of embedding calls worth running concurrently. None means no limit of the backend
+    max_concurrency: Optional[int] = None
+
+    @abstractmethod
+    def get_vector_size(self, embedding_model: str, dimensions: int = 0) -> int:
+        """
+        Function to get the number of dimensions of the embeddings
+
+        Args:
+            - embedding_model: name of the embedding model
+            - dimensions: number of output dimensions. 0 means the native dimensions of the model
+
+        Returns:
+            - vector size
+
+        Raises:
+            - ValueError if the dimensions are not supported by the model
+        """
+        pass
+
+    @abstractmethod
+    def create_embeddings(
+        self, embedding_model: str, dimensions: int = 0
+    ) -> Embeddings:
+        """
+        Function to create the embeddings of the model
+
+        Args:
+            - embedding_model: name of the embedding model
+            - dimensions: number of output dimensions. 0 means the native dimensions of the model
+
+        Returns:
+            - langchain embeddings
+        """
+        pass
+
+    def get_length_function(self, embedding_model: str) -> Callable[[str], int]:
+        """
+        Function to get the function measuring the size of a text for packing embedding batches.
+        Default is number of characters
+        """
+        return len
+
+
+class OpenAIEmbeddingBackend(EmbeddingBackend):
+    """
+    Embedding backend calling OpenAI embedding api
+
+    Args:
+        - api_key: OpenAI API key
+    """
+
+    name = "openai"
+
+    def __init__(self, api_key: str) -> None:
+        self.api_key = api_key
+
+    def get_vector_size(self, embedding_model: str, dimensions: int = 0) -> int:
+        return get_vector_size(embedding_model, dimensions)
+
+    def create_embeddings(
+        self, embedding_model: str, dimensions: int = 0
+    ) -> Embeddings:
+        return OpenAIEmbeddings(
+            model=embedding_model, dimensions=dimensions or None, api_key=self.api_key
+        )
+
+    def get_length_function(self, embedding_model: str) -> Callable[[str], int]:
+        # batches are limited by the token limit of the api
+        return partial(count_tokens, model_name=embedding_model)
+
+
+@lru_cache(maxsize=None)
+def get_sentence_transformer(model_name: str, device: str = "cpu"):
+    """
+    Function to load sentence-transformers model. The model is loaded only once per process
+
+    Args:
+        - model_name: name of the model on huggingface hub or path of the local model
+        - device: torch device
+
+    Returns:
+        - SentenceTransformer model
+
+    Raises:
+        - ImportError if sentence-transformers is not installed
+    """
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError as e:
+        raise ImportError(
+            "Local embedding backend requires sentence-transformers. Install it with `pip install sentence-transformers`"
+        ) from e
+
+    logger.info(f"Loading embedding model {model_name} on {device}")
+    return SentenceTransformer(model_name, device=device)
+
+
+def normalize_vectors(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class LocalEmbeddings(Embeddings):
+    """
+    Embeddings computed on the local CPU by a sentence-transformers model.
+    torch runs one encode call on all cores, so batches should be embedded one by one
+
+    Args:
+        - model_name: name of the model on huggingface hub or path of the local model
+        - dimensions: number of output dimensions. Embeddings are truncated to the first dimensions and
+          normalized again (for models trained with matryoshka loss). 0 means the native dimensions
+        - encode_batch_size: number of texts in one forward pass of the model
+    """
+
+    def __init__(
+        self, model_name: str, dimensions: int = 0, encode_batch_size: int = 32
+    ) -> None:
+        self.model_name = model_name
+        self.dimensions = dimensions
+        self.encode_batch_size = encode_batch_size
+        self.model = get_sentence_transformer(model_name)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+
+        vectors = self.model.encode(
+            texts,
+            batch_size=self.encode_batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=self.dimensions <= 0,
+        )
+        if self.dimensions > 0:
+            vectors = normalize_vectors(vectors[:, : self.dimensions])
+
+        return vectors.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class LocalEmbeddingBackend(EmbeddingBackend):
+    """
+    Embedding backend running sentence-transformers model on the local CPU (optional dependency)
+    """
+
+    name = "local"
+    max_concurrency = 1
+
+    def get_vector_size(self, embedding_model: str, dimensions: int = 0) -> int:
+        native_dimensions = get_sentence_transformer(
+            embedding_model
+        ).get_sentence_embedding_dimension()
+
+        if dimensions <= 0:
+            return native_dimensions
+
+        if dimensions > native_dimensions:
+            raise ValueError(
+                f"Embedding model {embedding_model} has at most {native_dimensions} dimensions"
+            )
+
+        return dimensions
+
+    def create_embeddings(
+        self, embedding_model: str, dimensions: int = 0
+    ) -> Embeddings:
+        return LocalEmbeddings(embedding_model, dimensions)
+
+
+class HashEmbeddings(Embeddings):
+    """
+    Deterministic embeddings of hashed word and character bigram counts (feature hashing).
+    Texts sharing words get similar vectors, so retrieval works without network, e.g. in tests
+
+    Args:
+        - dimensions: number of dimensions
+    """
+
+    TOKEN_PATTERN = re.compile(r"\w+")
+
+    def __init__(self, dimensions: int = 256) -> None:
+        self.dimensions = dimensions
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._get_features(text):
+                digest = blake2b(feature.encode(), digest_size=8).digest()
+                index = int.from_bytes(digest[:4], "big") % self.dimensions
+                sign = 1.0 if digest[4] & 1 else -1.0
+                vectors[row, index] += sign
+
+        return normalize_vectors(vectors).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def _get_features(self, text: str) -> List[str]:
+        features = []
+        for word in self.TOKEN_PATTERN.findall(text.lower()):
+            features.append(word)
+            # japanese text has no spaces, so character bigrams are used as well
+            features.extend(word[i : i + 2] for i in range(len(word) - 1))
+
+        return features
+
+
+class HashEmbeddingBackend(EmbeddingBackend):
+    """
+    Embedding backend of deterministic hash embeddings. The embedding model name is ignored
+    """
+
+    name = "hash"
+
+    DEFAULT_DIMENSIONS = 256
+
+    def get_vector_size(self, embedding_model: str, dimensions: int = 0) -> int:
+        return dimensions if dimensions > 0 else self.DEFAULT_DIMENSIONS
+
+    def create_embeddings(
+        self, embedding_model: str, dimensions: int = 0
+    ) -> Embeddings:
+        return HashEmbeddings(self.get_vector_size(embedding_model, dimensions))
+
+
+def get_embedding_backend(name: str, api_key: str = "") -> EmbeddingBackend:
+    """
+    Function to get the embedding backend by name
+
+    Args:
+        - name: "openai", "local" (sentence-transformers on CPU) or "hash" (deterministic, without network)
+        - api_key: OpenAI API key (used by openai backend only)
+
+    Returns:
+        - embedding backend
+
+    Raises:
+        - ValueError if the backend is unknown
+    """
+    if name == "openai":
+        return OpenAIEmbeddingBackend(api_key)
+
+    if name == "local":
+        return LocalEmbeddingBackend()
+
+    if name == "hash":
+        return HashEmbeddingBackend()
+
+    raise ValueError(
+        f"Unknown embedding backend {name}. Supported backends are {EMBEDDING_BACKENDS}"
+    )
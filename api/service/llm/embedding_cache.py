@@ -0,0 +1,194 @@
+import logging
+import os
+import sqlite3
+from array import array
+from hashlib import sha256
+from threading import Lock
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from api.common.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+def get_embedding_cache_key(model_name: str, text: str) -> str:
+    """
+    Function to generate content-addressed cache key for an embedding
+
+    Args:
+        - model_name: name of the embedding model
+        - text: embedded text
+
+    Returns:
+        - cache key in "<model_name>:<sha256 of the text>" format
+    """
+    return f"{model_name}:{sha256(text.encode()).hexdigest()}"
+
+
+class SqliteEmbeddingStore:
+    """
+    Persistent key-value store of embedding vectors backed by a local SQLite file.
+    Vectors are stored as float32 blobs (the same precision used by the vector database).
+
+    Args:
+        - path: path of the SQLite database file. Parent directory is created if it does not exist
+    """
+
+    def __init__(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS embedding (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """
+        Get stored vectors of the input keys
+
+        Args:
+            - keys: list of cache keys
+
+        Returns:
+            - dictionary of the found keys and their vectors
+        """
+        result = {}
+
+        # sqlite limits the number of host parameters in a statement
+        batch_size = 500
+        with self._lock:
+            for i in range(0, len(keys), batch_size):
+                batch = keys[i : i + batch_size]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._connection.execute(
+                    f"SELECT key, vector FROM embedding WHERE key IN ({placeholders})",
+                    batch,
+                )
+
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    result[key] = vector.tolist()
+
+        return result
+
+    def put_many(self, items: Dict[str, List[float]]) -> None:
+        """
+        Store the vectors in the database
+
+        Args:
+            - items: dictionary of cache keys and vectors
+        """
+        rows = [(key, array("f", vector).tobytes()) for key, vector in items.items()]
+
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embedding (key, vector) VALUES (?, ?)", rows
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that caches document embeddings by (model, sha256(text)).
+    Lookup order is in-memory LRU cache, then the persistent store (if configured), then the wrapped embeddings.
+
+    Args:
+        - embeddings: the wrapped embeddings (e.g., OpenAIEmbeddings)
+        - model_name: name of the embedding model. It is part of the cache key
+        - store: optional persistent store. If None, only in-memory cache is used
+        - memory_cache_size: maximum number of vectors kept in memory
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model_name: str,
+        store: Optional[SqliteEmbeddingStore] = None,
+        memory_cache_size: int = 10000,
+    ) -> None:
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.store = store
+        self.memory_cache = LRUCache(memory_cache_size)
+
+        self._counter_lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [get_embedding_cache_key(self.model_name, text) for text in texts]
+        vectors: Dict[str, List[float]] = {}
+
+        for key in set(keys):
+            vector = self.memory_cache.get(key)
+            if vector is not None:
+                vectors[key] = vector
+
+        if self.store is not None:
+            not_in_memory = [key for key in set(keys) if key not in vectors]
+            if not_in_memory:
+                for key, vector in self.store.get_many(not_in_memory).items():
+                    self.memory_cache.put(key, vector)
+                    vectors[key] = vector
+
+        # identical texts in the same request are embedded only once
+        missing_texts: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing_texts[key] = text
+
+        with self._counter_lock:
+            self.hits += len(texts) - len(missing_texts)
+            self.misses += len(missing_texts)
+
+        if missing_texts:
+            new_vectors = self.embeddings.embed_documents(list(missing_texts.values()))
+            new_items = dict(zip(missing_texts.keys(), new_vectors))
+
+            for key, vector in new_items.items():
+                self.memory_cache.put(key, vector)
+                vectors[key] = vector
+
+            if self.store is not None:
+                self.store.put_many(new_items)
+
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.embeddings.aembed_query(text)
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed several queries by one request of the wrapped embeddings.
+        Like aembed_query, queries are not cached and not counted in the cache stats
+        """
+        return await self.embeddings.aembed_documents(texts)
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        Get cache counters
+
+        Returns:
+            - dictionary with number of hits, misses and vectors in memory
+        """
+        with self._counter_lock:
+            return dict(
+                hits=self.hits,
+                misses=self.misses,
+                memory_size=len(self.memory_cache),
+            )
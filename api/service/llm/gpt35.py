@@ -1,21 +1,79 @@
+import asyncio
 import logging
+import multiprocessing
+import re
+import time
+from itertools import groupby
+from threading import Lock
+from weakref import WeakValueDictionary
 import openai
+from contextlib import contextmanager
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from hashlib import sha256
+from uuid import NAMESPACE_URL, uuid5
 import qdrant_client
 import qdrant_client.http
 import qdrant_client.http.exceptions
-from qdrant_client.http.models import Distance, VectorParams
+from qdrant_client.http.models import (
+    CreateAlias,
+    CreateAliasOperation,
+    DeleteAlias,
+    DeleteAliasOperation,
+    Distance,
+    FieldCondition,
+    Filter,
+    MatchValue,
+    NamedSparseVector,
+    PayloadSchemaType,
+    PointStruct,
+    ScoredPoint,
+    SearchRequest,
+    SparseVector,
+    SparseVectorParams,
+    VectorParams,
+)
 from langchain_core.exceptions import LangChainException
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
-from langchain_core.vectorstores import VectorStoreRetriever
 from langchain.vectorstores.qdrant import Qdrant
 from langchain_core.documents import Document
-from langchain_core.runnables import RunnablePassthrough
 from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
 from langchain_core.output_parsers.string import StrOutputParser
-from typing import List
+from typing import (
+    AsyncIterator,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+from api.common.cache import LRUCache
 from api.service.llm import LLMService
+from api.common.utils import StageTimer
+from api.service.llm.answer_cache import AnswerCache, CachedAnswer
+from api.service.llm.context_packing import format_context, pack_context
+from api.service.llm.batch_embedding import BatchedEmbeddings
+from api.service.llm.embedding_backend import EmbeddingBackend, get_embedding_backend
+from api.service.llm.embedding_cache import CachedEmbeddings, SqliteEmbeddingStore
+from api.service.llm.hybrid_search import (
+    SPARSE_VECTOR_NAME,
+    get_document_sparse_vectors,
+    get_query_sparse_vector,
+    reciprocal_rank_fusion,
+)
+from api.service.llm.pipeline import ImportPipeline
+from api.service.llm.reranking import CrossEncoderReranker, maximal_marginal_relevance
+from api.service.llm.vector_db_config import (
+    get_hnsw_config,
+    get_quantization_config,
+    get_search_params,
+)
+from api.service.llm.splitter import (
+    ParallelTextSplitter,
+    get_encoding,
+    get_text_splitter,
+)
 from api.common.error import (
     LlmError,
     LlmOpenAiAPIConnectionError,
@@ -33,7 +91,24 @@ logger = logging.getLogger(__name__)
 
 class Gpt35LLMService(LLMService):
 
-    VECTOR_DIMENSIONS = 1536
+    # prefix of the content fingerprints. It was the embedding model name when the model was not configurable.
+    # The embedding migration keeps the fingerprints of the chunks, so the prefix does not depend on the model
+    CONTENT_HASH_PREFIX = "text-embedding-ada-002"
+
+    # metadata fields used in the filters of retrieval and deduplication. They have keyword payload index
+    PAYLOAD_INDEX_FIELDS = ["source", "content_hash"]
+
+    # metadata key of the sparse vector of a chunk during import. It is removed before writing the payload
+    SPARSE_VECTOR_METADATA_KEY = "_sparse_vector"
+
+    # suffix of the alias of a partition whose collection has the name of the alias (created before the embedding
+    # model was configurable). Aliases cannot have the name of a collection
+    LEGACY_ALIAS_SUFFIX = "_current"
+
+    PROMPT_TEMPLATE = """Answer the question based only on the following context:
+                {context}
+                Question: {question}
+                """
 
     def __init__(
         self,
@@ -43,93 +118,503 @@ class Gpt35LLMService(LLMService):
         text_split_chunk_size: int,
         text_split_chunk_overlap: int,
         vector_search_top_k: int,
+        embedding_backend: str = "openai",
+        embedding_model: str = "text-embedding-ada-002",
+        embedding_dimensions: int = 0,
+        embedding_cache_path: str | None = None,
+        embedding_cache_memory_size: int = 10000,
+        embedding_batch_max_tokens: int = 50000,
+        embedding_batch_max_size: int = 512,
+        embedding_max_concurrency: int = 4,
+        import_queue_depth: int = 8,
+        text_split_workers: int = 0,
+        answer_cache_size: int = 1000,
+        answer_cache_ttl_seconds: float = 3600,
+        answer_cache_similarity_threshold: float = 0.95,
+        batch_query_max_concurrency: int = 8,
+        vector_db_partitions: int = 1,
+        vector_on_disk: bool = False,
+        hnsw_m: int = 0,
+        hnsw_ef_construct: int = 0,
+        quantization: str = "none",
+        quantization_always_ram: bool = True,
+        quantization_rescore: bool = True,
+        quantization_oversampling: float = 2.0,
+        vector_search_mode: str = "dense",
+        hybrid_search_candidates: int = 20,
+        retrieval_candidates: int = 0,
+        mmr_lambda: float = 0.5,
+        reranker_model: str = "",
+        retrieval_max_tokens: int = 0,
     ) -> None:
         self.key = openai_api_key
-        self.embedding = OpenAIEmbeddings(api_key=self.key)
+
+        # the vector size of the collections is derived from the embedding model and dimensions
+        self.embedding_backend = get_embedding_backend(embedding_backend, self.key)
+        self.embedding_model = embedding_model
+        self.embedding_dimensions = embedding_dimensions
+        self.vector_dimensions = self.embedding_backend.get_vector_size(
+            embedding_model, embedding_dimensions
+        )
+
+        self.embedding_batch_options = dict(
+            max_batch_tokens=embedding_batch_max_tokens,
+            max_batch_size=embedding_batch_max_size,
+        )
+        self.embedding_max_concurrency = embedding_max_concurrency
+        self.embedding_store = None
+        if embedding_cache_path:
+            self.embedding_store = SqliteEmbeddingStore(embedding_cache_path)
+        self.embedding_cache_memory_size = embedding_cache_memory_size
+
+        self.embedding = self._create_embeddings(
+            self.embedding_backend, embedding_model, embedding_dimensions
+        )
+        self.batched_embedding = self.embedding.embeddings
+
+        self.vector_db_url = vector_db_url
         self.qdrant_client = qdrant_client.QdrantClient(vector_db_url)
 
+        # in-memory async client would be a separate database, so the sync client is used for ":memory:"
+        self.async_qdrant_client = None
+        if vector_db_url != ":memory:":
+            self.async_qdrant_client = qdrant_client.AsyncQdrantClient(vector_db_url)
+
         self.text_split_chunk_size = text_split_chunk_size
         self.text_split_chunk_overlap = text_split_chunk_overlap
+        self.text_split_workers = text_split_workers
+        self._text_split_executor: Executor | None = None
 
         self.vector_search_top_k = vector_search_top_k
 
-        if not self.qdrant_client.collection_exists(
-            collection_name=vector_db_collection_name
-        ):
+        # retrieval over-fetches candidates for MMR, then optionally reranks the chunks
+        self.retrieval_candidates = max(retrieval_candidates, vector_search_top_k)
+        self.mmr_lambda = mmr_lambda
+        self.reranker = None
+        if reranker_model:
+            self.reranker = CrossEncoderReranker(reranker_model)
+
+        # token budget of the context built from the retrieved chunks (0 means no limit)
+        self.retrieval_max_tokens = retrieval_max_tokens
+        self.batch_query_max_concurrency = batch_query_max_concurrency
+        self.import_pipeline = ImportPipeline(
+            embed_function=self.embedding.embed_documents,
+            upsert_function=self._upsert_documents,
+            embedding_workers=self.batched_embedding.max_concurrency,
+            queue_depth=import_queue_depth,
+        )
+        # chunks are written with the same payload format as langchain Qdrant
+        self.content_payload_key = Qdrant.CONTENT_KEY
+        self.metadata_payload_key = Qdrant.METADATA_KEY
+        # sources of the imported content are updated by read-modify-write, so the update is serialized per content
+        self._content_locks = WeakValueDictionary()
+        self._content_locks_lock = Lock()
+
+        # storage and index settings are applied when the collection is created
+        self.vector_on_disk = vector_on_disk
+        self.quantization_config = get_quantization_config(
+            quantization, quantization_always_ram
+        )
+        self.hnsw_config = get_hnsw_config(hnsw_m, hnsw_ef_construct)
+        self.search_params = get_search_params(
+            quantization, quantization_rescore, quantization_oversampling
+        )
+
+        # documents are routed to one of the partition collections by the hash of their source,
+        # so import and query work on the partition of the document only.
+        # The configured names are aliases of the collections storing the vectors of the embedding model.
+        # They are resolved again by each import, so the writes follow the switch of the embedding migration
+        self.collection_name = vector_db_collection_name
+        self.vector_db_partitions = max(1, vector_db_partitions)
+        if self.vector_db_partitions == 1:
+            self.collection_aliases = [vector_db_collection_name]
+        else:
+            self.collection_aliases = [
+                f"{vector_db_collection_name}_{i}"
+                for i in range(self.vector_db_partitions)
+            ]
+        self.collection_names = [
+            self._get_or_create_collection(alias) for alias in self.collection_aliases
+        ]
+
+        # chunks are also written as sparse (BM25 keyword) vectors to the collections supporting them.
+        # Hybrid search fuses the dense and keyword search results by reciprocal rank fusion
+        self.vector_search_mode = vector_search_mode
+        self.hybrid_search_candidates = max(
+            hybrid_search_candidates, vector_search_top_k
+        )
+        self.sparse_collection_names = {
+            collection_name
+            for collection_name in self.collection_names
+            if self._has_sparse_vectors(collection_name)
+        }
+        if vector_search_mode == "hybrid":
+            for collection_name in self.collection_names:
+                if collection_name not in self.sparse_collection_names:
+                    logger.warning(
+                        f"Collection {collection_name} has no sparse vectors, so it is searched by dense vectors only. "
+                        "Run the embedding migration to rebuild it with sparse vectors"
+                    )
+
+        # prompt, chat model (with its connection pool) and chain are shared by all queries.
+        # Retrieval of the target file is done by _retrieve and _aretrieve
+        self.prompt = ChatPromptTemplate.from_template(self.PROMPT_TEMPLATE)
+        self.llm = ChatOpenAI(model_name="gpt-3.5-turbo", api_key=self.key)
+
+        # retrieval is done explicitly before the answer chain, so that the answer cache can be checked in between
+        self.answer_chain = self.prompt | self.llm | StrOutputParser()
+        self.answer_cache = AnswerCache(
+            max_size=answer_cache_size,
+            ttl_seconds=answer_cache_ttl_seconds,
+            similarity_threshold=answer_cache_similarity_threshold,
+        )
+
+    def import_docs_to_vector_store(self, docs: List[Document]):
+        with self._handle_llm_errors():
             try:
-                self.qdrant_client.create_collection(
-                    vector_db_collection_name,
-                    vectors_config=VectorParams(
-                        size=self.VECTOR_DIMENSIONS, distance=Distance.COSINE
-                    ),
+                self._refresh_collection_names()
+                self._import_docs(docs)
+
+                # the migration switched the aliases during the import, so the documents may have been written
+                # to the old collections only. They are imported again (chunks already copied are found by the content hash)
+                if self._refresh_collection_names():
+                    self._import_docs(docs)
+
+            finally:
+                # cached answers of this process may refer to the old content of the sources.
+                # Other processes notice the new content when the retrieved chunks differ from the cached ones
+                for source in {doc.metadata.get("source") for doc in docs}:
+                    self.answer_cache.invalidate(source)
+
+    def query(self, query: str, filename: str) -> str:
+        with self._handle_llm_errors():
+            cached = self.answer_cache.get(filename, query)
+            if cached is None:
+                query_vector, docs = self._retrieve(query, filename)
+            else:
+                query_vector = cached.query_vector.tolist()
+                docs = self._search_batch([query_vector], filename, [query])[0]
+
+            chunk_ids = self._get_chunk_ids(docs)
+            answer = self._get_cached_answer(filename, cached, query_vector, chunk_ids)
+            if answer is None:
+                answer = self.answer_chain.invoke(
+                    dict(question=query, context=self._build_context(docs))
                 )
-            except:
-                pass
 
-            logger.info("Created a collection in vector database")
+            self.answer_cache.put(filename, query, query_vector, chunk_ids, answer)
+            return answer
+
+    async def aquery(self, query: str, filename: str) -> str:
+        with self._handle_llm_errors():
+            cached = self.answer_cache.get(filename, query)
+            if cached is None:
+                query_vector, docs = await self._aretrieve(query, filename)
+            else:
+                query_vector = cached.query_vector.tolist()
+                docs = (await self._asearch_batch([query_vector], filename, [query]))[0]
+
+            chunk_ids = self._get_chunk_ids(docs)
+            answer = self._get_cached_answer(filename, cached, query_vector, chunk_ids)
+            if answer is None:
+                answer = await self.answer_chain.ainvoke(
+                    dict(question=query, context=self._build_context(docs))
+                )
+
+            self.answer_cache.put(filename, query, query_vector, chunk_ids, answer)
+            return answer
+
+    async def astream_query(self, query: str, filename: str) -> AsyncIterator[str]:
+        with self._handle_llm_errors():
+            cached = self.answer_cache.get(filename, query)
+            if cached is None:
+                query_vector, docs = await self._aretrieve(query, filename)
+            else:
+                query_vector = cached.query_vector.tolist()
+                docs = (await self._asearch_batch([query_vector], filename, [query]))[0]
+
+            chunk_ids = self._get_chunk_ids(docs)
+            answer = self._get_cached_answer(filename, cached, query_vector, chunk_ids)
+
+        if answer is not None:
+            return self._aiter_answer(answer)
+
+        return self._astream_answer(query, filename, query_vector, chunk_ids, docs)
+
+    async def _aiter_answer(self, answer: str) -> AsyncIterator[str]:
+        yield answer
+
+    async def _astream_answer(
+        self,
+        query: str,
+        filename: str,
+        query_vector: List[float],
+        chunk_ids: List[str],
+        docs: List[Document],
+    ) -> AsyncIterator[str]:
+        """
+        Private function to stream the answer of LLM from the retrieved chunks and cache the complete answer
+        """
+        with self._handle_llm_errors():
+            pieces = []
+            async for piece in self.answer_chain.astream(
+                dict(question=query, context=self._build_context(docs))
+            ):
+                pieces.append(piece)
+                yield piece
+
+            # only the complete answer is cached (not the one interrupted by the client)
+            self.answer_cache.put(
+                filename, query, query_vector, chunk_ids, "".join(pieces)
+            )
+
+    async def abatch_query(
+        self, queries: List[str], filename: str
+    ) -> List[Union[str, LlmError]]:
+        with self._handle_llm_errors():
+            cached_answers = [
+                self.answer_cache.get(filename, query) for query in queries
+            ]
+
+            # the queries without cached answer are embedded by one request.
+            # All queries are searched by one vector db request
+            query_vectors = [
+                None if cached is None else cached.query_vector.tolist()
+                for cached in cached_answers
+            ]
+            missing = [i for i, cached in enumerate(cached_answers) if cached is None]
+            if missing:
+                missing_vectors = await self.embedding.aembed_queries(
+                    [queries[i] for i in missing]
+                )
+                for i, query_vector in zip(missing, missing_vectors):
+                    query_vectors[i] = query_vector
+
+            docs_list = await self._asearch_batch(query_vectors, filename, queries)
+
+        semaphore = asyncio.Semaphore(self.batch_query_max_concurrency)
+
+        async def answer(
+            query: str,
+            cached: Optional[CachedAnswer],
+            query_vector: List[float],
+            docs: List[Document],
+        ) -> Union[str, LlmError]:
+            chunk_ids = self._get_chunk_ids(docs)
+            result = self._get_cached_answer(filename, cached, query_vector, chunk_ids)
+            if result is None:
+                try:
+                    with self._handle_llm_errors():
+                        async with semaphore:
+                            result = await self.answer_chain.ainvoke(
+                                dict(question=query, context=self._build_context(docs))
+                            )
+
+                except LlmError as err:
+                    logger.warning(f"Could not answer query in batch: {err}")
+                    return err
+
+            self.answer_cache.put(filename, query, query_vector, chunk_ids, result)
+            return result
 
-        self.vector_store: Qdrant = Qdrant(
-            client=self.qdrant_client,
-            collection_name=vector_db_collection_name,
-            embeddings=self.embedding,
+        return list(
+            await asyncio.gather(
+                *[
+                    answer(query, cached, query_vector, docs)
+                    for query, cached, query_vector, docs in zip(
+                        queries, cached_answers, query_vectors, docs_list
+                    )
+                ]
+            )
         )
 
-    def import_docs_to_vector_store(self, docs: List[Document]):
-        try:
-            logger.debug("Splitting document")
-            docs = self._split_texts(docs)
+    def _get_cached_answer(
+        self,
+        filename: str,
+        cached: Optional[CachedAnswer],
+        query_vector: List[float],
+        chunk_ids: List[str],
+    ) -> Optional[str]:
+        """
+        Private function to get the cached answer whose context is the same as the retrieved chunks.
+        The cached answer of the same query is checked against the retrieved chunks too, because the file may be
+        re-imported by another process (e.g. celery worker), which cannot invalidate the answer cache of this process
 
-            logger.debug("Adding the splitted document to vector db")
-            self.vector_store.add_documents(docs)
+        Args:
+            - filename: the target filename
+            - cached: cached answer of the same query, if any
+            - query_vector: embedding of the query
+            - chunk_ids: ids of the retrieved chunks for the query
 
-        except openai.APIConnectionError as err:
-            raise LlmOpenAiAPIConnectionError from err
+        Returns:
+            - cached answer or None
+        """
+        if cached is not None and cached.chunk_ids == tuple(chunk_ids):
+            logger.info("Answer cache hit (same query)")
+            return cached.answer
 
-        except openai.BadRequestError as err:
-            raise LlmOpenAiBadRequestError from err
+        answer = self.answer_cache.find_similar(filename, query_vector, chunk_ids)
+        if answer is not None:
+            logger.info("Answer cache hit (similar query)")
 
-        except openai.AuthenticationError as err:
-            raise LlmOpenAiAuthenticationError from err
+        return answer
 
-        except openai.PermissionDeniedError as err:
-            raise LlmOpenAiPermissionError from err
+    def migrate_embeddings(
+        self,
+        embedding_model: str,
+        embedding_dimensions: int = 0,
+        embedding_backend: Optional[str] = None,
+        batch_size: int = 256,
+    ) -> List[str]:
+        """
+        Function to re-embed the stored chunks with another embedding model or dimensions.
+        The chunks are written to new collections, then all aliases are switched to them in one operation,
+        so queries never see a half-migrated collection. The old collections are kept for rollback
 
-        except openai.RateLimitError as err:
-            raise LlmOpenAiRateLimitError from err
+        Args:
+            - embedding_model: name of the new embedding model
+            - embedding_dimensions: number of dimensions of the new embeddings. 0 means the native dimensions
+            - embedding_backend: name of the new embedding backend. None means the current backend
+            - batch_size: number of chunks read and embedded at once
 
-        except openai.APIError as err:
-            raise LlmOpenAiServiceError from err
+        Returns:
+            - names of the new collections (in the order of the partitions)
 
-        except LangChainException as err:
-            raise LlmError(
-                "(LangChain) There is problem with our llm service. Please report the issue to developer"
-            ) from err
+        Raises:
+            - ValueError if the dimensions are not supported by the model
+            - LLMError family if there is problem with the openai or vector db
+        """
+        backend = self.embedding_backend
+        if embedding_backend is not None:
+            backend = get_embedding_backend(embedding_backend, self.key)
 
-        except Exception as err:
-            raise LlmError(
-                "Encountered unexpected error from LLM service. Please report the issue to developer"
-            ) from err
+        vector_size = backend.get_vector_size(embedding_model, embedding_dimensions)
+        embedding = self._create_embeddings(
+            backend, embedding_model, embedding_dimensions
+        )
+        suffix = self._get_collection_suffix(backend, embedding_model, vector_size)
+        suffix = f"{suffix}_{int(time.time())}"
 
-    def query(self, query: str, filename: str) -> str:
-        try:
-            retriever: VectorStoreRetriever = self._get_retriever(filename)
+        with self._handle_llm_errors():
+            aliases = self._get_collection_aliases()
+            sources = {
+                alias: self._resolve_alias(alias, aliases) or alias
+                for alias in self.collection_aliases
+            }
+            targets = {alias: f"{alias}_{suffix}" for alias in self.collection_aliases}
 
-            template = """Answer the question based only on the following context:
-                {context}
-                Question: {question}
-                """
+            for alias in self.collection_aliases:
+                self._create_collection(targets[alias], vector_size)
+                count = self._reembed_collection(
+                    sources[alias], targets[alias], embedding, batch_size
+                )
+                logger.info(
+                    f"Re-embedded {count} chunks of {sources[alias]} to {targets[alias]}"
+                )
+
+            # chunks imported (or sources attached) while the collections were re-embedded
+            for alias in self.collection_aliases:
+                count = self._reembed_collection(
+                    sources[alias],
+                    targets[alias],
+                    embedding,
+                    batch_size,
+                    only_changed=True,
+                )
+                logger.info(f"Updated {count} changed chunks in {targets[alias]}")
 
-            prompt = ChatPromptTemplate.from_template(template)
-            llm = ChatOpenAI(model_name="gpt-3.5-turbo", api_key=self.key)
+            self._switch_collection_aliases(targets)
 
-            chain = (
-                {"question": RunnablePassthrough(), "context": retriever}
-                | prompt
-                | llm
-                | StrOutputParser()
+            # chunks written by imports that resolved the aliases before the switch
+            for alias in self.collection_aliases:
+                count = self._reembed_collection(
+                    sources[alias],
+                    targets[alias],
+                    embedding,
+                    batch_size,
+                    only_changed=True,
+                )
+                logger.info(
+                    f"Updated {count} chunks changed during the switch in {targets[alias]}"
+                )
+
+        logger.info(
+            f"Switched collections to embedding model {embedding_model} ({vector_size} dimensions)"
+        )
+        return [targets[alias] for alias in self.collection_aliases]
+
+    def _import_docs(self, docs: List[Document]) -> None:
+        """
+        Private function to deduplicate, split, embed and write the documents to vector db
+        """
+        stats_before = self.embedding.get_stats()
+
+        new_docs = []
+        for doc in docs:
+            content_hash = self._get_content_hash(doc.page_content)
+            source = doc.metadata.get("source")
+            collection_name = self._get_collection_name(source)
+            imported_sources = self._find_sources_by_content_hash(
+                content_hash, collection_name
+            )
+
+            if imported_sources is None:
+                if self._copy_content(content_hash, source, collection_name):
+                    continue
+
+                metadata = dict(doc.metadata, content_hash=content_hash)
+                new_docs.append(
+                    Document(page_content=doc.page_content, metadata=metadata)
+                )
+
+            elif source not in imported_sources:
+                logger.info(
+                    "The same content was already imported. Attaching the new source to the existing vectors"
+                )
+                self._attach_source(content_hash, source, collection_name)
+
+        if len(new_docs) == 0:
+            logger.info("All documents were already imported")
+            return
+
+        # chunks are splitted, embedded and written to vector db batch by batch
+        chunk_counts = {}
+        chunks = self._number_chunks(self._split_texts(new_docs), chunk_counts)
+        if self.sparse_collection_names:
+            chunks = self._add_sparse_vectors(chunks)
+
+        batches = self.batched_embedding.pack_batches(
+            chunks, get_text=lambda doc: doc.page_content
+        )
+        self.import_pipeline.run(batches)
+
+        # the chunk count marks the content as completely imported.
+        # Content without it (e.g. the import failed halfway) is imported again by the next import
+        for doc in new_docs:
+            content_hash = doc.metadata["content_hash"]
+            self.qdrant_client.set_payload(
+                self._get_collection_name(doc.metadata.get("source")),
+                payload=dict(chunk_count=chunk_counts[content_hash]),
+                points=self._get_content_hash_filter(content_hash),
+                key=self.metadata_payload_key,
             )
 
-            return chain.invoke(query)
+        stats = self.embedding.get_stats()
+        logger.info(
+            f"Embedding cache: {stats['hits'] - stats_before['hits']} hits, "
+            f"{stats['misses'] - stats_before['misses']} misses"
+        )
+
+    @contextmanager
+    def _handle_llm_errors(self):
+        """
+        Private context manager that converts errors from openai, langchain and qdrant to LLMError family
+        """
+        try:
+            yield
+        except LlmError:
+            raise
+
         except openai.APIConnectionError as err:
             raise LlmOpenAiAPIConnectionError from err
 
@@ -154,26 +639,1002 @@ class Gpt35LLMService(LLMService):
             ) from err
 
         except qdrant_client.http.exceptions.ApiException as err:
-            raise LlmVectorStoreError
+            raise LlmVectorStoreError from err
 
         except Exception as err:
             raise LlmError(
                 "Encountered unexpected error from LLM service. Please report the issue to developer"
             ) from err
 
-    def _split_texts(self, docs: List[Document]) -> List[Document]:
+    def _split_texts(self, docs: List[Document]) -> Iterator[Document]:
+
+        if self.text_split_workers > 0:
+            # the pool is created once and reused by the following imports.
+            # Daemon processes (e.g. celery prefork pool) cannot start child processes, so threads are used there.
+            # Tokenization of tiktoken releases the GIL, so the threads still split in parallel
+            if self._text_split_executor is None:
+                if multiprocessing.current_process().daemon:
+                    logger.info(
+                        "Splitting documents with threads because the worker is a daemon process"
+                    )
+                    self._text_split_executor = ThreadPoolExecutor(
+                        max_workers=self.text_split_workers
+                    )
+                else:
+                    self._text_split_executor = ProcessPoolExecutor(
+                        max_workers=self.text_split_workers
+                    )
+
+            text_splitter = ParallelTextSplitter(
+                self._text_split_executor,
+                "gpt-3.5-turbo",
+                self.text_split_chunk_size,
+                self.text_split_chunk_overlap,
+            )
+            return text_splitter.split_documents(docs)
+
+        text_splitter = get_text_splitter(
+            "gpt-3.5-turbo", self.text_split_chunk_size, self.text_split_chunk_overlap
+        )
+
+        return text_splitter.iter_split_documents(docs)
+
+    def _upsert_documents(
+        self,
+        docs: List[Document],
+        vectors: List[List[float]],
+        batch_size: int = 64,
+    ) -> None:
+        """
+        Private function to write embedded documents to vector db using the same payload format as langchain Qdrant.
+        Each document is written to the partition of its source
+        """
+        points_by_collection = {}
+        for doc, vector in zip(docs, vectors):
+            collection_name = self._get_collection_name(doc.metadata.get("source"))
+            sparse_vector = doc.metadata.pop(self.SPARSE_VECTOR_METADATA_KEY, None)
+            if (
+                sparse_vector is not None
+                and collection_name in self.sparse_collection_names
+            ):
+                vector = {"": vector, SPARSE_VECTOR_NAME: sparse_vector}
+
+            points_by_collection.setdefault(collection_name, []).append(
+                PointStruct(
+                    id=self._get_point_id(doc),
+                    vector=vector,
+                    payload={
+                        self.content_payload_key: doc.page_content,
+                        self.metadata_payload_key: doc.metadata,
+                    },
+                )
+            )
+
+        for collection_name, points in points_by_collection.items():
+            for i in range(0, len(points), batch_size):
+                self.qdrant_client.upsert(
+                    collection_name, points=points[i : i + batch_size]
+                )
+
+    def _get_collection_name(self, source: str) -> str:
+        """
+        Private function to get the partition collection of the source.
+        The partition is chosen by sha256 of the source, so it is the same in all processes
+        """
+        if self.vector_db_partitions == 1:
+            return self.collection_names[0]
+
+        digest = sha256(str(source).encode()).digest()
+        return self.collection_names[
+            int.from_bytes(digest[:8], "big") % self.vector_db_partitions
+        ]
+
+    def _get_content_hash(self, content: str) -> str:
+        """
+        Private function to compute fingerprint of the document content.
+        The splitting parameters are part of the hash because they determine the stored chunks.
+        """
+        settings = f"{self.CONTENT_HASH_PREFIX}:{self.text_split_chunk_size}:{self.text_split_chunk_overlap}:"
+        return sha256((settings + content).encode()).hexdigest()
+
+    def _find_sources_by_content_hash(
+        self, content_hash: str, collection_name: str
+    ) -> Optional[List[str]]:
+        """
+        Private function to look up the sources of the completely imported content in vector db.
+        The content is complete when it has the chunk count marker and all of the counted chunks are stored
+
+        Args:
+            - content_hash: fingerprint of the document content
+            - collection_name: the partition collection to look up
+
+        Returns:
+            - list of sources attached to the content or None if the content has not been (completely) imported yet
+        """
+        content_hash_filter = self._get_content_hash_filter(content_hash)
+        points, _ = self.qdrant_client.scroll(
+            collection_name,
+            scroll_filter=content_hash_filter,
+            limit=1,
+            with_payload=True,
+            with_vectors=False,
+        )
+
+        if len(points) == 0:
+            return None
+
+        metadata = points[0].payload[self.metadata_payload_key]
+        chunk_count = metadata.get("chunk_count")
+        if (
+            chunk_count is None
+            or self.qdrant_client.count(
+                collection_name, count_filter=content_hash_filter, exact=True
+            ).count
+            < chunk_count
+        ):
+            logger.warning(
+                f"The content was not completely imported in {collection_name}. It is imported again"
+            )
+            return None
+
+        source = metadata.get("source")
+        if isinstance(source, list):
+            return source
+
+        return [source]
+
+    def _attach_source(
+        self,
+        content_hash: str,
+        source: str,
+        collection_name: str,
+        max_attempts: int = 3,
+    ) -> None:
+        """
+        Private function to add the source to the sources of all chunks of the imported content.
+        Filtering by any of the sources matches the chunks because qdrant matches array payload by its elements.
+
+        Qdrant has no atomic update of array payload, so the sources are read and written under the lock of the content.
+        The lock serializes the imports of this process. The write is verified and retried with the merged sources,
+        so the source written by an import of another process at the same time is not lost
+
+        Args:
+            - content_hash: fingerprint of the document content
+            - source: the new source of the content
+            - collection_name: the partition collection of the content
+            - max_attempts: number of times the sources are read and written before giving up
+
+        Raises:
+            - LlmVectorStoreError: if the source could not be attached
+        """
+        with self._get_content_lock(content_hash):
+            for _ in range(max_attempts):
+                sources = self._find_sources_by_content_hash(
+                    content_hash, collection_name
+                )
+                if sources is None:
+                    break
+
+                if source in sources:
+                    return
+
+                self.qdrant_client.set_payload(
+                    collection_name,
+                    payload=dict(source=sources + [source]),
+                    points=self._get_content_hash_filter(content_hash),
+                    key=self.metadata_payload_key,
+                )
+
+        raise LlmVectorStoreError(
+            f"Failed to attach the source {source} to the imported content"
+        )
+
+    def _get_content_lock(self, content_hash: str) -> Lock:
+        """
+        Private function to get the lock of the content. The lock is dropped when no import holds it
+        """
+        with self._content_locks_lock:
+            lock = self._content_locks.get(content_hash)
+            if lock is None:
+                lock = Lock()
+                self._content_locks[content_hash] = lock
+
+            return lock
+
+    def _copy_content(
+        self,
+        content_hash: str,
+        source: str,
+        collection_name: str,
+        batch_size: int = 256,
+    ) -> bool:
+        """
+        Private function to copy the chunks of content imported in another partition to the partition of the source.
+        The stored vectors are reused, so the content is not splitted and embedded again
+
+        Args:
+            - content_hash: fingerprint of the document content
+            - source: the new source of the content
+            - collection_name: the partition collection of the source
+
+        Returns:
+            - True if the completely imported content was found and copied. Otherwise, False
+        """
+        for other_collection_name in self.collection_names:
+            if other_collection_name == collection_name:
+                continue
+
+            # partially imported content is not copied
+            if (
+                self._find_sources_by_content_hash(content_hash, other_collection_name)
+                is None
+            ):
+                continue
+
+            copied = 0
+            offset = None
+            while True:
+                points, offset = self.qdrant_client.scroll(
+                    other_collection_name,
+                    scroll_filter=self._get_content_hash_filter(content_hash),
+                    limit=batch_size,
+                    offset=offset,
+                    with_payload=True,
+                    with_vectors=True,
+                )
+
+                if points:
+                    copies = []
+                    for point in points:
+                        metadata = dict(
+                            point.payload[self.metadata_payload_key], source=source
+                        )
+                        copies.append(
+                            PointStruct(
+                                id=point.id,
+                                vector=point.vector,
+                                payload={
+                                    self.content_payload_key: point.payload[
+                                        self.content_payload_key
+                                    ],
+                                    self.metadata_payload_key: metadata,
+                                },
+                            )
+                        )
+
+                    self.qdrant_client.upsert(collection_name, points=copies)
+                    copied += len(copies)
+
+                if offset is None:
+                    break
+
+            if copied > 0:
+                logger.info(
+                    f"The same content was imported in {other_collection_name}. Copied {copied} chunks to {collection_name}"
+                )
+                return True
+
+        return False
+
+    def _get_content_hash_filter(self, content_hash: str) -> Filter:
+        return self._get_metadata_filter("content_hash", content_hash)
+
+    def _get_metadata_filter(self, field: str, value: str) -> Filter:
+        return Filter(
+            must=[
+                FieldCondition(
+                    key=f"{self.metadata_payload_key}.{field}",
+                    match=MatchValue(value=value),
+                )
+            ]
+        )
+
+    def _number_chunks(
+        self, docs: Iterable[Document], chunk_counts: Dict[str, int]
+    ) -> Iterator[Document]:
+        """
+        Private function to store the position of each chunk in its original document as chunk_index metadata.
+        The number of chunks of each content is counted to chunk_counts
+        """
+        for doc in docs:
+            content_hash = doc.metadata["content_hash"]
+            chunk_index = chunk_counts.get(content_hash, 0)
+            chunk_counts[content_hash] = chunk_index + 1
+
+            doc.metadata["chunk_index"] = chunk_index
+            yield doc
+
+    def _add_sparse_vectors(self, docs: Iterable[Document]) -> Iterator[Document]:
+        """
+        Private function to compute the sparse vectors of the chunks document by document.
+        Term statistics are counted over the chunks of each document, so only its chunks are held in memory
+        """
+        for _, document_chunks in groupby(
+            docs, key=lambda doc: doc.metadata["content_hash"]
+        ):
+            document_chunks = list(document_chunks)
+            sparse_vectors = get_document_sparse_vectors(
+                [doc.page_content for doc in document_chunks]
+            )
+            for doc, sparse_vector in zip(document_chunks, sparse_vectors):
+                doc.metadata[self.SPARSE_VECTOR_METADATA_KEY] = sparse_vector
+                yield doc
+
+    def _get_point_id(self, doc: Document) -> str:
+        """
+        Private function to generate deterministic point id from content hash and chunk position.
+        Importing the same content twice (e.g. concurrent tasks) overwrites the points instead of duplicating them.
+        """
+        content_hash = doc.metadata["content_hash"]
+        chunk_index = doc.metadata["chunk_index"]
+        return str(uuid5(NAMESPACE_URL, f"{content_hash}/{chunk_index}"))
+
+    def _retrieve(
+        self, query: str, filename: str
+    ) -> Tuple[List[float], List[Document]]:
+        """
+        Private function to embed the query and search for the relevant chunks of the target file
+
+        Returns:
+            - tuple of query embedding and retrieved documents
+        """
+        timer = StageTimer()
+        with timer.stage("embed"):
+            query_vector = self.embedding.embed_query(query)
+
+        docs = self._search_batch([query_vector], filename, [query], timer)[0]
+        logger.info(f"Retrieval stages: {timer}")
+
+        return query_vector, docs
+
+    async def _aretrieve(
+        self, query: str, filename: str
+    ) -> Tuple[List[float], List[Document]]:
+        """
+        Async version of _retrieve
+        """
+        timer = StageTimer()
+        with timer.stage("embed"):
+            query_vector = await self.embedding.aembed_query(query)
+
+        docs = await self._asearch_batch([query_vector], filename, [query], timer)
+        logger.info(f"Retrieval stages: {timer}")
+
+        return query_vector, docs[0]
+
+    def _search_batch(
+        self,
+        query_vectors: List[List[float]],
+        filename: str,
+        queries: Optional[List[str]] = None,
+        timer: Optional[StageTimer] = None,
+    ) -> List[List[Document]]:
+        """
+        Private function to search for the relevant chunks of the target file for many queries in one request.
+        In hybrid search mode, dense and keyword searches of all queries are sent in the same request.
+        The candidates are then selected by MMR and reranked (if configured)
+
+        Args:
+            - query_vectors: embeddings of the queries
+            - filename: the target filename
+            - queries: texts of the queries for keyword search and reranking. None means dense search only
+            - timer: timer of the retrieval stages
+
+        Returns:
+            - retrieved documents of each query (same format as the vector store retriever)
+        """
+        timer = timer or StageTimer()
+        collection_name = self._get_collection_name(filename)
+
+        with timer.stage("search"):
+            results = self.qdrant_client.search_batch(
+                collection_name,
+                requests=self._get_search_requests(
+                    collection_name, query_vectors, filename, queries
+                ),
+            )
+            results = self._fuse_results(results, len(query_vectors))
+
+        return self._select_documents_batch(
+            queries, query_vectors, results, collection_name, timer
+        )
+
+    async def _asearch_batch(
+        self,
+        query_vectors: List[List[float]],
+        filename: str,
+        queries: Optional[List[str]] = None,
+        timer: Optional[StageTimer] = None,
+    ) -> List[List[Document]]:
+        """
+        Async version of _search_batch. Reranking runs in a thread, so it does not block the event loop
+        """
+        if self.async_qdrant_client is None:
+            return self._search_batch(query_vectors, filename, queries, timer)
+
+        timer = timer or StageTimer()
+        collection_name = self._get_collection_name(filename)
+
+        with timer.stage("search"):
+            results = await self.async_qdrant_client.search_batch(
+                collection_name,
+                requests=self._get_search_requests(
+                    collection_name, query_vectors, filename, queries
+                ),
+            )
+            results = self._fuse_results(results, len(query_vectors))
+
+        if self.reranker is not None:
+            return await asyncio.to_thread(
+                self._select_documents_batch,
+                queries,
+                query_vectors,
+                results,
+                collection_name,
+                timer,
+            )
+
+        return self._select_documents_batch(
+            queries, query_vectors, results, collection_name, timer
+        )
+
+    def _get_search_requests(
+        self,
+        collection_name: str,
+        query_vectors: List[List[float]],
+        filename: str,
+        queries: Optional[List[str]] = None,
+    ) -> List[SearchRequest]:
+        """
+        Private function to get the dense search requests of the queries,
+        followed by the keyword search requests in hybrid search mode.
+        Vectors of the candidates are returned only if they are needed for MMR
+        """
+        source_filter = self._get_metadata_filter("source", filename)
+
+        hybrid = queries is not None and self._is_hybrid_search(collection_name)
+        limit = self.retrieval_candidates
+        if hybrid:
+            limit = max(limit, self.hybrid_search_candidates)
+
+        with_vectors = self.retrieval_candidates > self.vector_search_top_k
+
+        requests = [
+            SearchRequest(
+                vector=query_vector,
+                filter=source_filter,
+                limit=limit,
+                params=self.search_params,
+                with_payload=True,
+                with_vector=with_vectors,
+            )
+            for query_vector in query_vectors
+        ]
+        if hybrid:
+            requests.extend(
+                SearchRequest(
+                    vector=NamedSparseVector(
+                        name=SPARSE_VECTOR_NAME, vector=get_query_sparse_vector(query)
+                    ),
+                    filter=source_filter,
+                    limit=limit,
+                    with_payload=True,
+                    with_vector=with_vectors,
+                )
+                for query in queries
+            )
+
+        return requests
+
+    def _fuse_results(
+        self, results: List[List[ScoredPoint]], query_count: int
+    ) -> List[List[ScoredPoint]]:
+        """
+        Private function to fuse the dense and keyword search results of each query (hybrid search mode)
+        """
+        if len(results) == query_count:
+            return results
+
+        return [
+            reciprocal_rank_fusion(
+                [dense_points, sparse_points], limit=self.retrieval_candidates
+            )
+            for dense_points, sparse_points in zip(
+                results[:query_count], results[query_count:]
+            )
+        ]
+
+    def _select_documents_batch(
+        self,
+        queries: Optional[List[str]],
+        query_vectors: List[List[float]],
+        results: List[List[ScoredPoint]],
+        collection_name: str,
+        timer: StageTimer,
+    ) -> List[List[Document]]:
+        """
+        Private function to select the documents of each query from its search candidates
+        """
+        if queries is None:
+            queries = [None] * len(query_vectors)
+
+        return [
+            self._select_documents(query, query_vector, points, collection_name, timer)
+            for query, query_vector, points in zip(queries, query_vectors, results)
+        ]
+
+    def _select_documents(
+        self,
+        query: Optional[str],
+        query_vector: List[float],
+        points: List[ScoredPoint],
+        collection_name: str,
+        timer: StageTimer,
+    ) -> List[Document]:
+        """
+        Private function to select the top-k chunks from the search candidates:
+        MMR removes near-duplicates (e.g. overlapping neighbour chunks) and the cross-encoder reorders the selected chunks.
+        In hybrid search mode, the fused score is the relevance of MMR, so the keyword matches are kept
+        """
+        if len(points) > self.vector_search_top_k:
+            with timer.stage("mmr"):
+                vectors = [
+                    point.vector[""] if isinstance(point.vector, dict) else point.vector
+                    for point in points
+                ]
+                relevance = None
+                if query is not None and self._is_hybrid_search(collection_name):
+                    relevance = [point.score for point in points]
+
+                indices = maximal_marginal_relevance(
+                    query_vector,
+                    vectors,
+                    self.vector_search_top_k,
+                    self.mmr_lambda,
+                    relevance=relevance,
+                )
+                points = [points[i] for i in indices]
+
+        docs = self._to_documents([points], collection_name)[0]
+
+        if self.reranker is not None and query is not None:
+            with timer.stage("rerank"):
+                docs = self.reranker.rerank(query, docs)
+
+        return docs
+
+    def _is_hybrid_search(self, collection_name: str) -> bool:
+        return (
+            self.vector_search_mode == "hybrid"
+            and collection_name in self.sparse_collection_names
+        )
+
+    def _has_sparse_vectors(self, collection_name: str) -> bool:
+        sparse_vectors_config = self.qdrant_client.get_collection(
+            collection_name
+        ).config.params.sparse_vectors
+        return SPARSE_VECTOR_NAME in (sparse_vectors_config or {})
+
+    def _to_documents(
+        self, results: List[List[ScoredPoint]], collection_name: str
+    ) -> List[List[Document]]:
+        return [
+            [
+                Qdrant._document_from_scored_point(
+                    point,
+                    collection_name,
+                    self.content_payload_key,
+                    self.metadata_payload_key,
+                )
+                for point in points
+            ]
+            for points in results
+        ]
+
+    def _create_embeddings(
+        self,
+        backend: EmbeddingBackend,
+        embedding_model: str,
+        embedding_dimensions: int,
+    ) -> CachedEmbeddings:
+        """
+        Private function to create the embeddings of the model.
+        Cache is in front of batching, so only cache misses are sent to the embedding backend
+        """
+        max_concurrency = self.embedding_max_concurrency
+        if backend.max_concurrency is not None:
+            max_concurrency = min(max_concurrency, backend.max_concurrency)
+
+        batched_embedding = BatchedEmbeddings(
+            backend.create_embeddings(embedding_model, embedding_dimensions),
+            **self.embedding_batch_options,
+            max_concurrency=max_concurrency,
+            length_function=backend.get_length_function(embedding_model),
+        )
+
+        # embeddings of the same text with different backends or dimensions must not share the cache entry
+        model_name = embedding_model
+        if backend.name != "openai":
+            model_name = f"{backend.name}:{embedding_model}"
+        if embedding_dimensions > 0:
+            model_name = f"{model_name}:{embedding_dimensions}"
+
+        return CachedEmbeddings(
+            batched_embedding,
+            model_name=model_name,
+            store=self.embedding_store,
+            memory_cache_size=self.embedding_cache_memory_size,
+        )
+
+    def _get_or_create_collection(self, alias: str) -> str:
+        """
+        Private function to get the collection of the alias. If the alias does not exist,
+        a collection for the embedding model and the alias to it are created.
+        Collections created before the embedding model was configurable are named like the alias and used directly
+        until the embedding migration switches their legacy alias
+
+        Raises:
+            - LlmVectorStoreError if the collection stores vectors of another size
+        """
+        collection_name = self._resolve_alias(alias, self._get_collection_aliases())
+        if collection_name is None:
+            if self.qdrant_client.collection_exists(collection_name=alias):
+                collection_name = alias
+
+            else:
+                suffix = self._get_collection_suffix(
+                    self.embedding_backend, self.embedding_model, self.vector_dimensions
+                )
+                collection_name = f"{alias}_{suffix}"
+                self._create_collection(collection_name, self.vector_dimensions)
+
+                try:
+                    self.qdrant_client.update_collection_aliases(
+                        change_aliases_operations=[
+                            CreateAliasOperation(
+                                create_alias=CreateAlias(
+                                    collection_name=collection_name, alias_name=alias
+                                )
+                            )
+                        ]
+                    )
+                except qdrant_client.http.exceptions.ApiException:
+                    # another process created the alias first
+                    collection_name = self._get_collection_aliases()[alias]
+
+        vectors_config = self.qdrant_client.get_collection(
+            collection_name
+        ).config.params.vectors
+        if vectors_config.size != self.vector_dimensions:
+            raise LlmVectorStoreError(
+                f"Collection {collection_name} stores vectors of {vectors_config.size} dimensions, "
+                f"but embedding model {self.embedding_model} produces {self.vector_dimensions} dimensions. "
+                "Run the embedding migration before changing the embedding model"
+            )
+
+        return collection_name
+
+    def _refresh_collection_names(self) -> bool:
+        """
+        Private function to resolve the aliases of the partitions again.
+        Collections switched to by the embedding migration are used if they store the embeddings of this service
+
+        Returns:
+            - True if the collections of the partitions changed
+
+        Raises:
+            - LlmVectorStoreError if the aliases were switched to collections of another embedding model
+        """
+        aliases = self._get_collection_aliases()
+        collection_names = [
+            self._resolve_alias(alias, aliases) or collection_name
+            for alias, collection_name in zip(
+                self.collection_aliases, self.collection_names
+            )
+        ]
+        if collection_names == self.collection_names:
+            return False
+
+        suffix = self._get_collection_suffix(
+            self.embedding_backend, self.embedding_model, self.vector_dimensions
+        )
+        for alias, collection_name in zip(self.collection_aliases, collection_names):
+            if (
+                collection_name != f"{alias}_{suffix}"
+                and not collection_name.startswith(f"{alias}_{suffix}_")
+            ):
+                raise LlmVectorStoreError(
+                    f"The embedding migration switched {alias} to collection {collection_name}, "
+                    f"which does not store the embeddings of {self.embedding_model}. "
+                    "Restart with the embedding model of the migration"
+                )
+
+        self.sparse_collection_names = {
+            collection_name
+            for collection_name in collection_names
+            if self._has_sparse_vectors(collection_name)
+        }
+        self.collection_names = collection_names
+        logger.info(f"Switched to the migrated collections {collection_names}")
+        return True
+
+    def _get_collection_suffix(
+        self, backend: EmbeddingBackend, embedding_model: str, vector_size: int
+    ) -> str:
+        """
+        Private function to get the part of the collection name identifying the embeddings.
+        Characters not allowed in collection names (e.g. "/" of huggingface model names) are replaced
+        """
+        model_name = embedding_model
+        if backend.name != "openai":
+            model_name = f"{backend.name}-{embedding_model}"
+
+        return f"{re.sub(r'[^A-Za-z0-9_.-]', '-', model_name)}_{vector_size}"
+
+    def _create_collection(self, collection_name: str, vector_size: int) -> None:
+        """
+        Private function to create the collection with the storage and index settings (if it does not exist)
+        """
+        if not self.qdrant_client.collection_exists(collection_name=collection_name):
+            try:
+                self.qdrant_client.create_collection(
+                    collection_name,
+                    vectors_config=VectorParams(
+                        size=vector_size,
+                        distance=Distance.COSINE,
+                        on_disk=self.vector_on_disk or None,
+                    ),
+                    sparse_vectors_config={SPARSE_VECTOR_NAME: SparseVectorParams()},
+                    hnsw_config=self.hnsw_config,
+                    quantization_config=self.quantization_config,
+                )
+            except:
+                pass
+
+            logger.info(f"Created a collection {collection_name} in vector database")
+
+        # local mode ignores payload indexes
+        if self.vector_db_url != ":memory:":
+            self._create_payload_indexes(collection_name)
+
+    def _get_collection_aliases(self) -> dict:
+        return {
+            alias.alias_name: alias.collection_name
+            for alias in self.qdrant_client.get_aliases().aliases
+        }
+
+    def _reembed_collection(
+        self,
+        source_collection_name: str,
+        target_collection_name: str,
+        embedding: CachedEmbeddings,
+        batch_size: int,
+        only_changed: bool = False,
+    ) -> int:
+        """
+        Private function to write the chunks of the source collection with new embeddings to the target collection.
+        Point ids, payloads and sparse vectors are kept. Sparse vectors missing in the source are computed
+
+        Args:
+            - source_collection_name: collection to be read
+            - target_collection_name: collection to be written
+            - embedding: embeddings of the new model
+            - batch_size: number of chunks read and embedded at once
+            - only_changed: write only chunks missing in the target or with different payload.
+              Chunks with different payload reuse the vectors in the target
+
+        Returns:
+            - number of written chunks
+        """
+        source_has_sparse_vectors = self._has_sparse_vectors(source_collection_name)
+        # sparse vectors computed for the chunks of a content (by content hash)
+        sparse_vector_cache = LRUCache(1000)
+
+        written = 0
+        offset = None
+        while True:
+            points, offset = self.qdrant_client.scroll(
+                source_collection_name,
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=(
+                    [SPARSE_VECTOR_NAME] if source_has_sparse_vectors else False
+                ),
+            )
+
+            vectors = {}
+            if only_changed and points:
+                existing_points = self.qdrant_client.retrieve(
+                    target_collection_name,
+                    ids=[point.id for point in points],
+                    with_payload=True,
+                    with_vectors=True,
+                )
+                existing_points = {point.id: point for point in existing_points}
+
+                changed_points = []
+                for point in points:
+                    existing_point = existing_points.get(point.id)
+                    if existing_point is None:
+                        changed_points.append(point)
+                    elif existing_point.payload != point.payload:
+                        changed_points.append(point)
+                        vectors[point.id] = existing_point.vector
+
+                points = changed_points
+
+            missing_points = [point for point in points if point.id not in vectors]
+            if missing_points:
+                embeddings = embedding.embed_documents(
+                    [
+                        point.payload[self.content_payload_key]
+                        for point in missing_points
+                    ]
+                )
+                for point, vector in zip(missing_points, embeddings):
+                    sparse_vector = (point.vector or {}).get(SPARSE_VECTOR_NAME)
+                    if sparse_vector is None:
+                        sparse_vector = self._get_content_sparse_vectors(
+                            source_collection_name,
+                            point.payload[self.metadata_payload_key]["content_hash"],
+                            sparse_vector_cache,
+                        )[point.id]
+
+                    vectors[point.id] = {"": vector, SPARSE_VECTOR_NAME: sparse_vector}
+
+            if points:
+                self.qdrant_client.upsert(
+                    target_collection_name,
+                    points=[
+                        PointStruct(
+                            id=point.id, vector=vectors[point.id], payload=point.payload
+                        )
+                        for point in points
+                    ],
+                )
+                written += len(points)
+
+            if offset is None:
+                break
+
+        return written
+
+    def _get_content_sparse_vectors(
+        self, collection_name: str, content_hash: str, cache: LRUCache
+    ) -> Dict[str, SparseVector]:
+        """
+        Private function to compute the sparse vectors of all chunks of the content (point id to sparse vector)
+        """
+        sparse_vectors = cache.get(content_hash)
+        if sparse_vectors is None:
+            points = []
+            offset = None
+            while True:
+                page, offset = self.qdrant_client.scroll(
+                    collection_name,
+                    scroll_filter=self._get_content_hash_filter(content_hash),
+                    limit=256,
+                    offset=offset,
+                    with_payload=True,
+                    with_vectors=False,
+                )
+                points.extend(page)
+                if offset is None:
+                    break
+
+            sparse_vectors = dict(
+                zip(
+                    [point.id for point in points],
+                    get_document_sparse_vectors(
+                        [point.payload[self.content_payload_key] for point in points]
+                    ),
+                )
+            )
+            cache.put(content_hash, sparse_vectors)
+
+        return sparse_vectors
+
+    def _switch_collection_aliases(self, targets: dict) -> None:
+        """
+        Private function to point the aliases to the target collections in one operation.
+        A partition whose collection was created before the embedding model was configurable has the name of the alias.
+        Qdrant aliases cannot have the name of a collection, so the legacy alias of the partition is switched instead
+        and the old collection is kept like the other old collections
+        """
+        aliases = self._get_collection_aliases()
+
+        operations = []
+        for alias, collection_name in targets.items():
+            if alias not in aliases and self.qdrant_client.collection_exists(alias):
+                alias = self._get_legacy_alias(alias)
 
-        text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-            model_name="gpt-3.5-turbo",
-            chunk_size=self.text_split_chunk_size,
-            chunk_overlap=self.text_split_chunk_overlap,
+            if alias in aliases:
+                operations.append(
+                    DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=alias))
+                )
+
+            operations.append(
+                CreateAliasOperation(
+                    create_alias=CreateAlias(
+                        collection_name=collection_name, alias_name=alias
+                    )
+                )
+            )
+
+        self.qdrant_client.update_collection_aliases(
+            change_aliases_operations=operations
         )
 
-        return text_splitter.split_documents(docs)
+    def _resolve_alias(self, alias: str, aliases: dict) -> Optional[str]:
+        """
+        Private function to get the collection of the alias, or of its legacy alias, from the aliases of vector db
+        """
+        collection_name = aliases.get(alias)
+        if collection_name is None:
+            collection_name = aliases.get(self._get_legacy_alias(alias))
+
+        return collection_name
+
+    def _get_legacy_alias(self, alias: str) -> str:
+        return f"{alias}{self.LEGACY_ALIAS_SUFFIX}"
+
+    def _create_payload_indexes(self, collection_name: str) -> None:
+        """
+        Private function to create keyword payload indexes of the filtered metadata fields.
+        Without the index, filtered search scans the payloads as the collection grows. Existing indexes are kept
+        """
+        try:
+            payload_schema = self.qdrant_client.get_collection(
+                collection_name
+            ).payload_schema
+
+            for field in self.PAYLOAD_INDEX_FIELDS:
+                field_name = f"{self.metadata_payload_key}.{field}"
+                if field_name in payload_schema:
+                    continue
 
-    def _get_retriever(self, filename: str) -> List[Document]:
-        retriever: VectorStoreRetriever = self.vector_store.as_retriever(
-            search_kwargs=dict(k=self.vector_search_top_k, filter=dict(source=filename))
+                self.qdrant_client.create_payload_index(
+                    collection_name,
+                    field_name=field_name,
+                    field_schema=PayloadSchemaType.KEYWORD,
+                )
+                logger.info(
+                    f"Created payload index of {field_name} in {collection_name}"
+                )
+
+        except qdrant_client.http.exceptions.ApiException:
+            logger.exception("Could not create payload index in vector database")
+
+    def _build_context(self, docs: List[Document]) -> str:
+        """
+        Private function to build the prompt context from the retrieved chunks.
+        Adjacent chunks are merged without their duplicated overlap, passages exceeding the token budget are dropped
+        and only the texts (not the metadata) are sent to the LLM
+
+        Args:
+            - docs: retrieved chunks ordered by relevance
+
+        Returns:
+            - context text
+        """
+        # the context strings are different for every query, so they are not kept in the memoized length function
+        encoding = get_encoding(self.llm.model_name)
+
+        def length_function(text: str) -> int:
+            return len(encoding.encode_ordinary(text))
+
+        passages = pack_context(docs, self.retrieval_max_tokens, length_function)
+        context = format_context(passages)
+
+        retrieved_tokens = length_function(format_context(docs))
+        context_tokens = length_function(context)
+        logger.info(
+            f"Packed {len(docs)} chunks into {len(passages)} passages: {context_tokens} tokens "
+            f"(saved {retrieved_tokens - context_tokens} tokens)"
         )
 
-        return retriever
+        return context
+
+    def _get_chunk_ids(self, docs: List[Document]) -> List[str]:
+        return [str(doc.metadata.get("_id")) for doc in docs]
@@ -0,0 +1,182 @@
+import math
+import re
+import unicodedata
+from collections import Counter
+from hashlib import blake2b
+from typing import Dict, List
+
+from qdrant_client.http.models import ScoredPoint, SparseVector
+
+# name of the sparse (keyword) vector in the collection. The dense vector is the unnamed default vector
+SPARSE_VECTOR_NAME = "text"
+
+KANJI_DIGITS = {
+    "〇": 0,
+    "一": 1,
+    "二": 2,
+    "三": 3,
+    "四": 4,
+    "五": 5,
+    "六": 6,
+    "七": 7,
+    "八": 8,
+    "九": 9,
+}
+KANJI_UNITS = {"十": 10, "百": 100, "千": 1000}
+NUMBER = "[0-9〇一二三四五六七八九十百千]+"
+
+# article references of legal text, e.g. 第十二条の二, 第3項
+ARTICLE_PATTERN = re.compile(f"第({NUMBER})([編章節款条項号])((?:の{NUMBER})*)")
+BRANCH_PATTERN = re.compile(f"の({NUMBER})")
+
+# latin words and numbers, or runs of japanese characters (hiragana, katakana and kanji)
+WORD_PATTERN = re.compile(r"[a-z0-9]+|[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff々]+")
+
+
+def parse_number(text: str) -> int:
+    """
+    Function to parse arabic or kanji number (e.g. "12", "十二", "百五")
+
+    Args:
+        - text: number text
+
+    Returns:
+        - integer value
+    """
+    if text.isdigit():
+        return int(text)
+
+    total = 0
+    current = 0
+    for char in text:
+        if char in KANJI_DIGITS:
+            current = current * 10 + KANJI_DIGITS[char]
+        else:
+            total += (current or 1) * KANJI_UNITS[char]
+            current = 0
+
+    return total + current
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Function to split japanese (and latin) text into keyword tokens.
+    Japanese text has no spaces, so runs of japanese characters are split into character bigrams.
+    Article references are normalized to single tokens with arabic numbers (第十二条の二 -> 第12条, 第12条の2),
+    so that kanji and arabic notations match exactly
+
+    Args:
+        - text: input text
+
+    Returns:
+        - list of tokens (with duplicates)
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+
+    tokens = []
+    for match in ARTICLE_PATTERN.finditer(text):
+        article = f"第{parse_number(match.group(1))}{match.group(2)}"
+        tokens.append(article)
+
+        for branch in BRANCH_PATTERN.findall(match.group(3)):
+            article = f"{article}の{parse_number(branch)}"
+            tokens.append(article)
+
+    for word in WORD_PATTERN.findall(text):
+        if word.isascii() or len(word) == 1:
+            tokens.append(word)
+        else:
+            tokens.extend(word[i : i + 2] for i in range(len(word) - 1))
+
+    return tokens
+
+
+def get_token_index(token: str) -> int:
+    """
+    Function to get the sparse vector index (32 bit hash) of the token
+    """
+    return int.from_bytes(blake2b(token.encode(), digest_size=4).digest(), "big")
+
+
+def get_document_sparse_vectors(
+    texts: List[str], k1: float = 1.2, b: float = 0.75
+) -> List[SparseVector]:
+    """
+    Function to compute BM25 weights of the chunks of one document as sparse vectors.
+    Retrieval is always filtered by the document, so document frequencies are counted over its chunks
+    and the dot product with the query sparse vector is the BM25 score of the chunk
+
+    Args:
+        - texts: texts of all chunks of the document
+        - k1: term frequency saturation
+        - b: document length normalization
+
+    Returns:
+        - sparse vector of each chunk
+    """
+    token_counts = [Counter(map(get_token_index, tokenize(text))) for text in texts]
+    lengths = [sum(counts.values()) for counts in token_counts]
+    average_length = max(sum(lengths) / max(len(lengths), 1), 1.0)
+
+    document_frequencies = Counter()
+    for counts in token_counts:
+        document_frequencies.update(counts.keys())
+
+    vectors = []
+    for counts, length in zip(token_counts, lengths):
+        norm = k1 * (1 - b + b * length / average_length)
+        weights = {
+            index: math.log(
+                1
+                + (len(texts) - document_frequencies[index] + 0.5)
+                / (document_frequencies[index] + 0.5)
+            )
+            * count
+            * (k1 + 1)
+            / (count + norm)
+            for index, count in counts.items()
+        }
+        vectors.append(to_sparse_vector(weights))
+
+    return vectors
+
+
+def get_query_sparse_vector(text: str) -> SparseVector:
+    """
+    Function to get the sparse vector of the query. Each distinct token has weight 1
+    """
+    return to_sparse_vector({get_token_index(token): 1.0 for token in tokenize(text)})
+
+
+def to_sparse_vector(weights: Dict[int, float]) -> SparseVector:
+    indices = sorted(weights)
+    return SparseVector(indices=indices, values=[weights[i] for i in indices])
+
+
+def reciprocal_rank_fusion(
+    results: List[List[ScoredPoint]], limit: int, k: int = 60
+) -> List[ScoredPoint]:
+    """
+    Function to fuse ranked search results by reciprocal rank fusion: score = sum of 1 / (k + rank).
+    Only ranks are used, so scores of different scales (cosine similarity and BM25) can be fused
+
+    Args:
+        - results: ranked results of each retriever
+        - limit: number of fused results
+        - k: rank constant. Larger value gives lower ranks more weight
+
+    Returns:
+        - fused results with the fused score, best first
+    """
+    scores = {}
+    points = {}
+    for points_of_retriever in results:
+        for rank, point in enumerate(points_of_retriever, start=1):
+            scores[point.id] = scores.get(point.id, 0.0) + 1.0 / (k + rank)
+            points.setdefault(point.id, point)
+
+    ranked_ids = sorted(scores, key=scores.get, reverse=True)[:limit]
+    return [
+        points[point_id].model_copy(update=dict(score=scores[point_id]))
+        for point_id in ranked_ids
+    ]
@@ -0,0 +1,134 @@
+import logging
+import time
+from queue import Queue
+from threading import Event, Thread
+from typing import Callable, Iterable, List
+
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+# marks the end of the stream in the stage queues
+_END = object()
+
+
+class ImportPipeline:
+    """
+    Streaming pipeline for importing documents to vector db.
+    Batches of splitted documents flow through embedding workers and an upsert worker connected by bounded queues,
+    so splitting, embedding and writing overlap and the memory usage is bounded by the queue depth.
+
+    Args:
+        - embed_function: function to embed a list of texts
+        - upsert_function: function to write a batch of documents and their vectors to vector db
+        - embedding_workers: number of batches embedded concurrently
+        - queue_depth: maximum number of batches waiting in each queue
+    """
+
+    def __init__(
+        self,
+        embed_function: Callable[[List[str]], List[List[float]]],
+        upsert_function: Callable[[List[Document], List[List[float]]], None],
+        embedding_workers: int = 4,
+        queue_depth: int = 8,
+    ) -> None:
+        self.embed_function = embed_function
+        self.upsert_function = upsert_function
+        self.embedding_workers = max(1, embedding_workers)
+        self.queue_depth = max(1, queue_depth)
+
+    def run(self, batches: Iterable[List[Document]]) -> int:
+        """
+        Run the pipeline until all batches are written to vector db
+
+        Args:
+            - batches: iterable of document batches. It is consumed lazily
+
+        Returns:
+            - number of imported documents
+
+        Raises:
+            - the first exception raised by any stage
+        """
+        embed_queue = Queue(maxsize=self.queue_depth)
+        upsert_queue = Queue(maxsize=self.queue_depth)
+        failed = Event()
+        errors: List[BaseException] = []
+        imported = [0]
+        start = time.perf_counter()
+
+        def record_error(err: BaseException) -> None:
+            if not failed.is_set():
+                errors.append(err)
+                failed.set()
+
+        def embed_worker() -> None:
+            while True:
+                batch = embed_queue.get()
+                if batch is _END:
+                    return
+
+                # keep draining the queue after a failure so that the producer is not blocked
+                if failed.is_set():
+                    continue
+
+                try:
+                    vectors = self.embed_function([doc.page_content for doc in batch])
+                    upsert_queue.put((batch, vectors))
+                except BaseException as err:
+                    record_error(err)
+
+        def upsert_worker() -> None:
+            while True:
+                item = upsert_queue.get()
+                if item is _END:
+                    return
+
+                if failed.is_set():
+                    continue
+
+                try:
+                    batch, vectors = item
+                    self.upsert_function(batch, vectors)
+
+                    if imported[0] == 0:
+                        logger.info(
+                            f"First batch is searchable after {time.perf_counter() - start:.2f}s"
+                        )
+                    imported[0] += len(batch)
+                except BaseException as err:
+                    record_error(err)
+
+        embed_threads = [
+            Thread(target=embed_worker, daemon=True)
+            for _ in range(self.embedding_workers)
+        ]
+        upsert_thread = Thread(target=upsert_worker, daemon=True)
+        for thread in embed_threads + [upsert_thread]:
+            thread.start()
+
+        try:
+            for batch in batches:
+                if failed.is_set():
+                    break
+                embed_queue.put(batch)
+
+        except BaseException as err:
+            record_error(err)
+
+        finally:
+            for _ in embed_threads:
+                embed_queue.put(_END)
+            for thread in embed_threads:
+                thread.join()
+
+            upsert_queue.put(_END)
+            upsert_thread.join()
+
+        if errors:
+            raise errors[0]
+
+        logger.info(
+            f"Imported {imported[0]} chunks in {time.perf_counter() - start:.2f}s"
+        )
+        return imported[0]
@@ -0,0 +1,147 @@
+import logging
+from functools import lru_cache
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+
+def maximal_marginal_relevance(
+    query_vector: Sequence[float],
+    vectors: Sequence[Sequence[float]],
+    k: int,
+    lambda_mult: float = 0.5,
+    relevance: Optional[Sequence[float]] = None,
+) -> List[int]:
+    """
+    Function to select diverse relevant vectors by maximal marginal relevance.
+    Each step selects the candidate maximizing lambda * relevance - (1 - lambda) * similarity to
+    the most similar selected candidate, so near-duplicates of selected chunks (e.g. overlapping neighbours) are skipped.
+    Similarities to the selected candidates are updated incrementally, so the cost is O(k * candidates * dimensions)
+
+    Args:
+        - query_vector: embedding of the query
+        - vectors: embeddings of the candidates (ordered by relevance)
+        - k: number of selected candidates
+        - lambda_mult: 1 means relevance only, 0 means diversity only
+        - relevance: scores of the candidates (e.g. fused scores of hybrid search) used instead of
+          the similarity to the query. They are scaled to [0, 1] to be comparable with the similarities of the candidates
+
+    Returns:
+        - indices of the selected candidates in the order of selection
+    """
+    if len(vectors) == 0 or k <= 0:
+        return []
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    query_vector = np.asarray(query_vector, dtype=np.float32)
+    query_vector /= max(float(np.linalg.norm(query_vector)), 1e-12)
+
+    if relevance is None:
+        relevance = vectors @ query_vector
+    else:
+        relevance = np.asarray(relevance, dtype=np.float32)
+        relevance = (relevance - relevance.min()) / max(
+            float(relevance.max() - relevance.min()), 1e-12
+        )
+
+    selected = [int(np.argmax(relevance))]
+    max_similarity = vectors @ vectors[selected[0]]
+
+    while len(selected) < min(k, len(vectors)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        scores[selected] = -np.inf
+
+        best = int(np.argmax(scores))
+        selected.append(best)
+        np.maximum(max_similarity, vectors @ vectors[best], out=max_similarity)
+
+    return selected
+
+
+@lru_cache(maxsize=None)
+def get_cross_encoder(model_name: str, device: str = "cpu"):
+    """
+    Function to load sentence-transformers cross-encoder. The model is loaded only once per process
+
+    Args:
+        - model_name: name of the model on huggingface hub or path of the local model
+        - device: torch device
+
+    Returns:
+        - CrossEncoder model
+
+    Raises:
+        - ImportError if sentence-transformers is not installed
+    """
+    try:
+        from sentence_transformers import CrossEncoder
+    except ImportError as e:
+        raise ImportError(
+            "Reranking requires sentence-transformers. Install it with `pip install sentence-transformers`"
+        ) from e
+
+    logger.info(f"Loading reranker model {model_name} on {device}")
+    return CrossEncoder(model_name, device=device)
+
+
+class CrossEncoderReranker:
+    """
+    Reranker scoring (query, chunk) pairs with a local cross-encoder model (optional dependency)
+
+    Args:
+        - model_name: name of the model on huggingface hub or path of the local model
+        - batch_size: number of pairs in one forward pass of the model
+    """
+
+    def __init__(self, model_name: str, batch_size: int = 32) -> None:
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.model = get_cross_encoder(model_name)
+
+    def rerank(self, query: str, docs: List[Document]) -> List[Document]:
+        """
+        Function to order the documents by the cross-encoder score, best first
+
+        Args:
+            - query: input query
+            - docs: retrieved documents
+
+        Returns:
+            - reordered documents
+        """
+        if len(docs) < 2:
+            return docs
+
+        scores = self.model.predict(
+            [(query, doc.page_content) for doc in docs], batch_size=self.batch_size
+        )
+        order = np.argsort(-np.asarray(scores), kind="stable")
+        return [docs[i] for i in order]
+
+
+def trim_to_token_budget(
+    docs: List[Document], max_tokens: int, length_function: Callable[[str], int]
+) -> List[Document]:
+    """
+    Function to keep the leading documents fitting in the token budget. The first document is always kept
+
+    Args:
+        - docs: documents ordered by relevance
+        - max_tokens: token budget of the documents
+        - length_function: function to count tokens of a text
+
+    Returns:
+        - leading documents within the budget
+    """
+    total_tokens = 0
+    for i, doc in enumerate(docs):
+        total_tokens += length_function(doc.page_content)
+        if total_tokens > max_tokens and i > 0:
+            logger.info(f"Dropped {len(docs) - i} chunks exceeding {max_tokens} tokens")
+            return docs[:i]
+
+    return docs
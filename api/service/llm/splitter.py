@@ -0,0 +1,407 @@
+import copy
+import logging
+import re
+from concurrent.futures import Executor
+from functools import lru_cache
+from typing import Iterable, Iterator, List
+
+import tiktoken
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+from langchain_text_splitters.character import _split_text_with_regex
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model_name: str) -> tiktoken.Encoding:
+    """
+    Function to get tiktoken encoding of the model. The encoding is loaded only once per process
+
+    Args:
+        - model_name: name of the openai model
+
+    Returns:
+        - tiktoken encoding
+    """
+    return tiktoken.encoding_for_model(model_name)
+
+
+class TokenLengthFunction:
+    """
+    Memoized token counting function.
+    Text splitting measures the same pieces many times, so the counts are cached.
+    prime() counts many texts with a single (multi-threaded) encode_ordinary_batch call.
+
+    Args:
+        - encoding: tiktoken encoding
+        - cache_size: maximum number of memoized texts. The memo is cleared when it is full
+    """
+
+    def __init__(self, encoding: tiktoken.Encoding, cache_size: int = 100000) -> None:
+        self.encoding = encoding
+        self.cache_size = cache_size
+        self._lengths = {}
+
+    def __call__(self, text: str) -> int:
+        length = self._lengths.get(text)
+        if length is None:
+            length = len(self.encoding.encode_ordinary(text))
+            self._remember(text, length)
+
+        return length
+
+    def prime(self, texts: List[str]) -> None:
+        """
+        Count tokens of the texts in one batch call and memoize the results
+
+        Args:
+            - texts: list of texts
+        """
+        missing = list({text for text in texts if text not in self._lengths})
+        if not missing:
+            return
+
+        for text, tokens in zip(missing, self.encoding.encode_ordinary_batch(missing)):
+            self._remember(text, len(tokens))
+
+    def update(self, texts: List[str], lengths: List[int]) -> None:
+        """
+        Memoize token counts computed elsewhere (e.g. in worker processes)
+
+        Args:
+            - texts: list of texts
+            - lengths: number of tokens of each text
+        """
+        for text, length in zip(texts, lengths):
+            self._remember(text, length)
+
+    def _remember(self, text: str, length: int) -> None:
+        if len(self._lengths) >= self.cache_size:
+            self._lengths.clear()
+
+        self._lengths[text] = length
+
+
+@lru_cache(maxsize=None)
+def get_token_length_function(model_name: str) -> TokenLengthFunction:
+    """
+    Function to get the shared token counting function of the model
+
+    Args:
+        - model_name: name of the openai model
+
+    Returns:
+        - memoized token counting function
+    """
+    return TokenLengthFunction(get_encoding(model_name))
+
+
+def count_tokens(text: str, model_name: str) -> int:
+    """
+    Function to count tokens of the text with the tokenizer of the model
+    """
+    return get_token_length_function(model_name)(text)
+
+
+def count_tokens_batch(texts: List[str], model_name: str) -> List[int]:
+    """
+    Function to count tokens of many texts with one batch tokenizer call
+    """
+    length_function = get_token_length_function(model_name)
+    length_function.prime(texts)
+    return [length_function(text) for text in texts]
+
+
+@lru_cache(maxsize=32)
+def get_text_splitter(
+    model_name: str, chunk_size: int, chunk_overlap: int
+) -> "StreamingRecursiveCharacterTextSplitter":
+    """
+    Function to get text splitter measuring length in tokens of the model.
+    The splitter is built once per configuration and shared by all tasks in the process
+
+    Args:
+        - model_name: name of the openai model
+        - chunk_size: maximum number of tokens in a chunk
+        - chunk_overlap: number of overlapping tokens between consecutive chunks
+
+    Returns:
+        - text splitter
+    """
+    return StreamingRecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=get_token_length_function(model_name),
+    )
+
+
+class StreamingRecursiveCharacterTextSplitter(RecursiveCharacterTextSplitter):
+    """
+    RecursiveCharacterTextSplitter that yields chunks lazily.
+    The produced chunks are identical to RecursiveCharacterTextSplitter with the same parameters,
+    but the first chunk is available without splitting the whole document first.
+    """
+
+    # number of pieces counted by one batch tokenizer call
+    PRIME_WINDOW = 4096
+
+    def split_text(self, text: str) -> List[str]:
+        return list(self.iter_split_text(text))
+
+    def iter_split_text(self, text: str) -> Iterator[str]:
+        """
+        Split text and yield chunks one by one
+
+        Args:
+            - text: input text
+
+        Returns:
+            - iterator of chunks
+        """
+        return self._iter_split_text(text, self._separators)
+
+    def iter_split_documents(self, documents: Iterable[Document]) -> Iterator[Document]:
+        """
+        Split documents and yield chunks one by one. Metadata of the original document is copied to each chunk
+
+        Args:
+            - documents: input documents
+
+        Returns:
+            - iterator of splitted documents
+        """
+        for doc in documents:
+            for chunk in self.iter_split_text(doc.page_content):
+                yield Document(page_content=chunk, metadata=copy.deepcopy(doc.metadata))
+
+    def _select_separator(self, text: str, separators: List[str]):
+        """
+        Private function to select the first separator found in the text (same rule as RecursiveCharacterTextSplitter)
+
+        Returns:
+            - tuple of (separator, remaining separators for recursive splitting)
+        """
+        separator = separators[-1]
+        new_separators = []
+        for i, _s in enumerate(separators):
+            _separator = _s if self._is_separator_regex else re.escape(_s)
+            if _s == "":
+                separator = _s
+                break
+            if re.search(_separator, text):
+                separator = _s
+                new_separators = separators[i + 1 :]
+                break
+
+        return separator, new_separators
+
+    def _iter_split_text(self, text: str, separators: List[str]) -> Iterator[str]:
+        separator, new_separators = self._select_separator(text, separators)
+
+        _separator = separator if self._is_separator_regex else re.escape(separator)
+        splits = _split_text_with_regex(text, _separator, self._keep_separator)
+
+        # count tokens of the pieces in batches instead of one tokenizer call per piece
+        prime_lengths = isinstance(self._length_function, TokenLengthFunction)
+
+        # merge small splits, recursively split the long ones
+        _good_splits = []
+        _separator = "" if self._keep_separator else separator
+        for i, s in enumerate(splits):
+            if prime_lengths and i % self.PRIME_WINDOW == 0:
+                self._length_function.prime(splits[i : i + self.PRIME_WINDOW])
+
+            if self._length_function(s) < self._chunk_size:
+                _good_splits.append(s)
+            else:
+                if _good_splits:
+                    yield from self._iter_merge_splits(_good_splits, _separator)
+                    _good_splits = []
+                if not new_separators:
+                    yield s
+                else:
+                    yield from self._iter_split_text(s, new_separators)
+
+        if _good_splits:
+            yield from self._iter_merge_splits(_good_splits, _separator)
+
+    def _iter_merge_splits(
+        self, splits: Iterable[str], separator: str
+    ) -> Iterator[str]:
+        separator_len = self._length_function(separator)
+
+        current_doc: List[str] = []
+        total = 0
+        for d in splits:
+            _len = self._length_function(d)
+            if (
+                total + _len + (separator_len if len(current_doc) > 0 else 0)
+                > self._chunk_size
+            ):
+                if total > self._chunk_size:
+                    logger.warning(
+                        f"Created a chunk of size {total}, which is longer than the specified {self._chunk_size}"
+                    )
+                if len(current_doc) > 0:
+                    doc = self._join_docs(current_doc, separator)
+                    if doc is not None:
+                        yield doc
+
+                    # drop chunks from the beginning until the remaining part fits in the overlap
+                    while total > self._chunk_overlap or (
+                        total + _len + (separator_len if len(current_doc) > 0 else 0)
+                        > self._chunk_size
+                        and total > 0
+                    ):
+                        total -= self._length_function(current_doc[0]) + (
+                            separator_len if len(current_doc) > 1 else 0
+                        )
+                        current_doc = current_doc[1:]
+
+            current_doc.append(d)
+            total += _len + (separator_len if len(current_doc) > 1 else 0)
+
+        doc = self._join_docs(current_doc, separator)
+        if doc is not None:
+            yield doc
+
+
+def _count_tokens_job(model_name: str, texts: List[str]) -> List[int]:
+    return count_tokens_batch(texts, model_name)
+
+
+def _split_text_job(
+    model_name: str,
+    chunk_size: int,
+    chunk_overlap: int,
+    text: str,
+    separators: List[str],
+) -> List[str]:
+    splitter = get_text_splitter(model_name, chunk_size, chunk_overlap)
+    return list(splitter._iter_split_text(text, separators))
+
+
+class ParallelTextSplitter:
+    """
+    Text splitter that fans the CPU-bound work out to a process pool and produces
+    the same chunks as the serial splitter from get_text_splitter.
+
+    The document is cut into top-level pieces by the first separator found in the text (same rule as the serial splitter).
+    Token counts of the pieces are computed by the workers. Then the pieces are sharded at the long pieces (>= chunk_size),
+    because the serial splitter flushes its merge window there: a long piece is splitted recursively on its own and
+    the runs of short pieces between them are merged independently. So the shards need no overlap stitching and
+    the concatenated result is identical to the serial path.
+    Long pieces are splitted by the workers, the runs of short pieces are merged by the caller using the counts from the workers.
+
+    Args:
+        - executor: process pool executor
+        - model_name: name of the openai model used for counting tokens
+        - chunk_size: maximum number of tokens in a chunk
+        - chunk_overlap: number of overlapping tokens between consecutive chunks
+        - count_batch_size: number of pieces counted by one worker job
+    """
+
+    def __init__(
+        self,
+        executor: Executor,
+        model_name: str,
+        chunk_size: int,
+        chunk_overlap: int,
+        count_batch_size: int = 2048,
+    ) -> None:
+        self.executor = executor
+        self.model_name = model_name
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.count_batch_size = count_batch_size
+        self.splitter = get_text_splitter(model_name, chunk_size, chunk_overlap)
+
+    def split_documents(self, documents: Iterable[Document]) -> Iterator[Document]:
+        """
+        Split documents in parallel and yield chunks in the same order as the serial splitter.
+        Metadata of the original document is copied to each chunk
+
+        Args:
+            - documents: input documents
+
+        Returns:
+            - iterator of splitted documents
+        """
+        for doc in documents:
+            for chunk in self.split_text(doc.page_content):
+                yield Document(page_content=chunk, metadata=copy.deepcopy(doc.metadata))
+
+    def split_text(self, text: str) -> Iterator[str]:
+        """
+        Split text in parallel
+
+        Args:
+            - text: input text
+
+        Returns:
+            - iterator of chunks
+        """
+        splitter = self.splitter
+        separator, new_separators = splitter._select_separator(
+            text, splitter._separators
+        )
+        _separator = separator if splitter._is_separator_regex else re.escape(separator)
+        splits = _split_text_with_regex(text, _separator, splitter._keep_separator)
+
+        lengths = self._count_tokens(splits)
+        splitter._length_function.update(splits, lengths)
+
+        merge_separator = "" if splitter._keep_separator else separator
+
+        # shards in document order: ("merge", short pieces), ("chunks", chunks) or ("future", future of chunks)
+        shards = []
+        good_splits = []
+        for split, length in zip(splits, lengths):
+            if length < self.chunk_size:
+                good_splits.append(split)
+                continue
+
+            if good_splits:
+                shards.append(("merge", good_splits))
+                good_splits = []
+
+            if not new_separators:
+                shards.append(("chunks", [split]))
+            else:
+                future = self.executor.submit(
+                    _split_text_job,
+                    self.model_name,
+                    self.chunk_size,
+                    self.chunk_overlap,
+                    split,
+                    new_separators,
+                )
+                shards.append(("future", future))
+
+        if good_splits:
+            shards.append(("merge", good_splits))
+
+        for kind, shard in shards:
+            if kind == "future":
+                yield from shard.result()
+            elif kind == "chunks":
+                yield from shard
+            else:
+                yield from splitter._iter_merge_splits(shard, merge_separator)
+
+    def _count_tokens(self, texts: List[str]) -> List[int]:
+        futures = [
+            self.executor.submit(
+                _count_tokens_job,
+                self.model_name,
+                texts[i : i + self.count_batch_size],
+            )
+            for i in range(0, len(texts), self.count_batch_size)
+        ]
+
+        lengths = []
+        for future in futures:
+            lengths.extend(future.result())
+
+        return lengths
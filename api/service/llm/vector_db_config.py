@@ -0,0 +1,146 @@
+from typing import Optional
+
+from qdrant_client.http.models import (
+    BinaryQuantization,
+    BinaryQuantizationConfig,
+    HnswConfigDiff,
+    QuantizationConfig,
+    QuantizationSearchParams,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    SearchParams,
+)
+
+QUANTIZATION_TYPES = ["none", "scalar", "binary"]
+
+# native output dimensions of the openai embedding models
+EMBEDDING_MODEL_DIMENSIONS = {
+    "text-embedding-ada-002": 1536,
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+}
+
+# models which can return shortened embeddings (dimensions parameter of the embedding api)
+REDUCIBLE_EMBEDDING_MODELS = ["text-embedding-3-small", "text-embedding-3-large"]
+
+
+def get_vector_size(embedding_model: str, dimensions: int = 0) -> int:
+    """
+    Function to get the vector size of a collection storing embeddings of the model
+
+    Args:
+        - embedding_model: name of the openai embedding model
+        - dimensions: number of output dimensions. 0 means the native dimensions of the model
+
+    Returns:
+        - vector size
+
+    Raises:
+        - ValueError if the dimensions are not supported by the model
+    """
+    native_dimensions = EMBEDDING_MODEL_DIMENSIONS.get(embedding_model)
+    if dimensions <= 0:
+        if native_dimensions is None:
+            raise ValueError(
+                f"Unknown dimensions of embedding model {embedding_model}. Set the dimensions explicitly"
+            )
+        return native_dimensions
+
+    if native_dimensions is not None:
+        if (
+            dimensions != native_dimensions
+            and embedding_model not in REDUCIBLE_EMBEDDING_MODELS
+        ):
+            raise ValueError(
+                f"Embedding model {embedding_model} does not support reduced dimensions"
+            )
+
+        if dimensions > native_dimensions:
+            raise ValueError(
+                f"Embedding model {embedding_model} has at most {native_dimensions} dimensions"
+            )
+
+    return dimensions
+
+
+def get_quantization_config(
+    quantization: str, always_ram: bool = True
+) -> Optional[QuantizationConfig]:
+    """
+    Function to get quantization config of a collection
+
+    Args:
+        - quantization: "none", "scalar" (int8, 4x smaller) or "binary" (1 bit per dimension, 32x smaller)
+        - always_ram: keep the quantized vectors in RAM even if the original vectors are on disk
+
+    Returns:
+        - quantization config or None if quantization is disabled
+
+    Raises:
+        - ValueError if the quantization type is unknown
+    """
+    if quantization == "none":
+        return None
+
+    if quantization == "scalar":
+        return ScalarQuantization(
+            scalar=ScalarQuantizationConfig(
+                type=ScalarType.INT8, quantile=0.99, always_ram=always_ram
+            )
+        )
+
+    if quantization == "binary":
+        return BinaryQuantization(
+            binary=BinaryQuantizationConfig(always_ram=always_ram)
+        )
+
+    raise ValueError(
+        f"Unknown quantization type {quantization}. Supported types are {QUANTIZATION_TYPES}"
+    )
+
+
+def get_hnsw_config(m: int = 0, ef_construct: int = 0) -> Optional[HnswConfigDiff]:
+    """
+    Function to get HNSW index config of a collection. 0 means the default value of qdrant
+
+    Args:
+        - m: number of edges per node in the index graph. Larger value is more accurate but uses more memory
+        - ef_construct: number of neighbours considered while building the index. Larger value is more accurate but slower to build
+
+    Returns:
+        - HNSW config or None if all values are default
+    """
+    if m <= 0 and ef_construct <= 0:
+        return None
+
+    return HnswConfigDiff(
+        m=m if m > 0 else None,
+        ef_construct=ef_construct if ef_construct > 0 else None,
+    )
+
+
+def get_search_params(
+    quantization: str, rescore: bool = True, oversampling: float = 2.0
+) -> Optional[SearchParams]:
+    """
+    Function to get search params for a quantized collection.
+    With rescoring, qdrant selects oversampling * top_k candidates by the quantized vectors
+    and re-ranks them by the original vectors
+
+    Args:
+        - quantization: quantization type of the collection
+        - rescore: re-rank the candidates by the original vectors
+        - oversampling: ratio of candidates to top_k
+
+    Returns:
+        - search params or None if quantization is disabled
+    """
+    if quantization == "none":
+        return None
+
+    return SearchParams(
+        quantization=QuantizationSearchParams(
+            rescore=rescore, oversampling=oversampling if rescore else None
+        )
+    )
@@ -1,7 +1,38 @@
 import os
 from uuid import uuid4
 from abc import ABC, abstractmethod
-from typing import BinaryIO
+from typing import AsyncIterable, BinaryIO, List
+
+
+class PresignedUpload:
+    """
+    Presigned upload of one file. The client uploads the parts of the file directly to the object storage
+    (HTTP PUT of each part to its url in order, the last part can be smaller) and then completes the upload
+
+    Args:
+        - filename: original filename
+        - stored_filename: filename in the object storage
+        - upload_id: id of the multipart upload
+        - part_size_in_bytes: size of the parts (except the last part)
+        - part_urls: presigned urls of the parts in order (part number is index + 1)
+        - uploaded_parts: numbers of the parts that are already uploaded (resumed upload)
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        stored_filename: str,
+        upload_id: str,
+        part_size_in_bytes: int,
+        part_urls: List[str],
+        uploaded_parts: List[int] = None,
+    ) -> None:
+        self.filename = filename
+        self.stored_filename = stored_filename
+        self.upload_id = upload_id
+        self.part_size_in_bytes = part_size_in_bytes
+        self.part_urls = part_urls
+        self.uploaded_parts = uploaded_parts or []
 
 
 class ObjectStorage(ABC):
@@ -26,7 +57,8 @@ class ObjectStorage(ABC):
             - append_uuid_to_filename: Default value is True. It means the uuid is attached to the stored filename to prevent collision in object storage.
 
         Returns:
-            - signed URL of the uploaded file
+            - signed URL of the uploaded file. With generated (uuid) filename, the implementation can store
+              the file as a metadata-only reference to its content stored once (deduplication)
 
         Raises:
             - ObjectStorageError if there is problem with the object storage service or connection
@@ -58,8 +90,184 @@ class ObjectStorage(ABC):
         """
         pass
 
+    @abstractmethod
+    async def aupload(
+        self,
+        filename: str,
+        file_pointer: BinaryIO,
+        file_length_in_bytes: int = -1,
+        part_size_in_bytes: int = 10 * 1024 * 1024,
+        append_uuid_to_filename: bool = True,
+    ) -> str:
+        """
+        Async version of upload function. It does not block the event loop during the upload.
+        file_pointer can also be an object with async read method (e.g. FastAPI UploadFile)
+
+        Returns:
+            - signed URL of the uploaded file
+
+        Raises:
+            - ObjectStorageError if there is problem with the object storage service or connection
+        """
+        pass
+
+    @abstractmethod
+    async def aupload_stream(
+        self,
+        filename: str,
+        chunks: AsyncIterable[bytes],
+        part_size_in_bytes: int = 16 * 1024 * 1024,
+        append_uuid_to_filename: bool = True,
+    ) -> str:
+        """
+        Async function to upload a file of unknown size from a stream of chunks (e.g. streamed request body).
+        The chunks are collected into parts of fixed size which are uploaded one by one (multipart upload),
+        so memory usage is bounded by the part size and nothing is written to local disk
+
+        Args:
+            - filename: the name of the file to be stored in object storage
+            - chunks: async iterator of the file data
+            - part_size_in_bytes: size of the uploaded parts (at least 5MB). Default value is 16MB
+            - append_uuid_to_filename: Default value is True. It means the uuid is attached to the stored filename to prevent collision in object storage.
+
+        Returns:
+            - signed URL of the uploaded file
+
+        Raises:
+            - ObjectStorageError if there is problem with the object storage service or connection,
+              or the part size is less than 5MB
+        """
+        pass
+
+    @abstractmethod
+    async def acreate_presigned_upload(
+        self,
+        filename: str,
+        file_length_in_bytes: int,
+        part_size_in_bytes: int = 16 * 1024 * 1024,
+        expires_in_seconds: int = 3600,
+        append_uuid_to_filename: bool = True,
+    ) -> PresignedUpload:
+        """
+        Async function to start an upload that the client sends directly to the object storage with presigned urls,
+        so the file data does not pass through the API
+
+        Args:
+            - filename: the name of the file to be stored in object storage
+            - file_length_in_bytes: file size in bytes
+            - part_size_in_bytes: size of the parts (at least 5MB). It is increased if the file has too many parts
+            - expires_in_seconds: lifetime of the presigned urls
+            - append_uuid_to_filename: Default value is True. It means the uuid is attached to the stored filename to prevent collision in object storage.
+
+        Returns:
+            - PresignedUpload with the presigned urls of the parts
+
+        Raises:
+            - ObjectStorageError if there is problem with the object storage service or connection,
+              or the part size is less than 5MB
+        """
+        pass
+
+    @abstractmethod
+    async def aresume_presigned_upload(
+        self, upload_id: str, expires_in_seconds: int = 3600
+    ) -> PresignedUpload:
+        """
+        Async function to continue an interrupted presigned upload. The client uploads only the parts
+        that are not in uploaded_parts of the result, instead of restarting the whole upload
+
+        Args:
+            - upload_id: id of the upload (see acreate_presigned_upload)
+            - expires_in_seconds: lifetime of the renewed presigned urls
+
+        Returns:
+            - PresignedUpload with renewed presigned urls of all parts and the numbers of the uploaded parts
+
+        Raises:
+            - ObjectStorageFileNotFoundError if the upload does not exist (e.g. it is already completed)
+            - ObjectStorageError if there is problem with the object storage service or connection
+        """
+        pass
+
+    @abstractmethod
+    async def acomplete_presigned_upload(
+        self, stored_filename: str, upload_id: str
+    ) -> str:
+        """
+        Async function to complete the presigned upload after the client uploaded all parts
+
+        Args:
+            - stored_filename: the filename in the object storage
+            - upload_id: id of the upload (see acreate_presigned_upload)
+
+        Returns:
+            - signed URL of the uploaded file
+
+        Raises:
+            - IncompleteUploadError if not all parts are uploaded
+            - ObjectStorageFileNotFoundError if the upload does not exist (e.g. it is already completed)
+            - ObjectStorageError if there is problem with the object storage service or connection
+        """
+        pass
+
+    @abstractmethod
+    async def aread_range(
+        self, stored_filename: str, offset: int, length: int
+    ) -> bytes:
+        """
+        Async function to read a byte range of the file (e.g. the first bytes to detect the file type)
+
+        Args:
+            - stored_filename: the filename in the object storage
+            - offset: position of the first byte
+            - length: maximum number of bytes
+
+        Returns:
+            - the bytes. Shorter than length if the file ends before
+
+        Raises:
+            - ObjectStorageFileNotFoundError if the file does not exist
+            - ObjectStorageError if there is problem with the object storage service or connection
+        """
+        pass
+
+    @abstractmethod
+    async def acontains_file(self, stored_filename: str) -> bool:
+        """
+        Async version of contains_file function
+
+        Args:
+            - stored_filename: input filename
+
+        Returns:
+            - True if it exits. Otherwise, False is retruned.
+        """
+        pass
+
+    @abstractmethod
+    async def adelete(self, stored_filename: str) -> bool:
+        """
+        Async version of delete function
+            - stored_filename: the filename in the object storage
+
+        Returns:
+            True if operation is success. Otherwise, False is returned
+        """
+        pass
+
 
 def prepend_unique_id_to_filename(data: str):
     basename = os.path.basename(data)
     uuid = uuid4()
     return f"{uuid}_{basename}"
+
+
+def get_original_filename(stored_filename: str) -> str:
+    """
+    Function to get the original filename from the stored filename with prepended uuid
+    """
+    prefix, separator, filename = stored_filename.partition("_")
+    if separator and len(prefix) == 36:
+        return filename
+
+    return stored_filename
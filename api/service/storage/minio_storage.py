@@ -1,21 +1,187 @@
+import asyncio
+import hashlib
+import inspect
+import io
+import json
 import logging
-from typing import BinaryIO
+import httpx
+from contextlib import contextmanager
+from typing import (
+    AsyncIterable,
+    AsyncIterator,
+    BinaryIO,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+from weakref import WeakKeyDictionary
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
 from minio import Minio
+from minio.commonconfig import ComposeSource
+from api.common.cache import TTLCache
 from urllib3.exceptions import MaxRetryError
 from api.common.error import (
+    IncompleteUploadError,
     ObjectStorageConnectionError,
     ObjectStorageError,
     ObjectStorageFileNotFoundError,
 )
-from api.service.storage import ObjectStorage, prepend_unique_id_to_filename
+from api.service.storage import (
+    ObjectStorage,
+    PresignedUpload,
+    prepend_unique_id_to_filename,
+)
 from base64 import b64encode
 from datetime import timedelta
 
 logger = logging.getLogger(__name__)
 
 
+async def _iter_file(file_data, chunk_size: int) -> AsyncIterator[bytes]:
+    """
+    Read the file in chunks. Async read (e.g. UploadFile) is awaited, blocking read is run in a thread
+    """
+    while True:
+        if inspect.iscoroutinefunction(file_data.read):
+            chunk = await file_data.read(chunk_size)
+        else:
+            chunk = await asyncio.to_thread(file_data.read, chunk_size)
+
+        if not chunk:
+            return
+
+        yield chunk
+
+
+class _ContentHash:
+    """
+    sha256 and size of the data passed through update
+    """
+
+    def __init__(self) -> None:
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def update(self, data: bytes) -> None:
+        self.sha256.update(data)
+        self.size += len(data)
+
+    def hexdigest(self) -> str:
+        return self.sha256.hexdigest()
+
+
+async def _iter_hashed(
+    chunks: AsyncIterable[bytes], content_hash: _ContentHash
+) -> AsyncIterator[bytes]:
+    async for chunk in chunks:
+        content_hash.update(chunk)
+        yield chunk
+
+
+class _HashingReader:
+    """
+    Wrapper of file that computes sha256 of the data while it is read by the upload
+    """
+
+    def __init__(self, file_data: BinaryIO) -> None:
+        self._file_data = file_data
+        self.content_hash = _ContentHash()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._file_data.read(size)
+        self.content_hash.update(data)
+        return data
+
+
+def _hash_file(
+    file_data: BinaryIO, chunk_size: int = 1024 * 1024
+) -> Optional[_ContentHash]:
+    """
+    Compute sha256 of the rest of the file. The position is restored, so the file can be uploaded afterwards
+
+    Returns:
+        - sha256 and size of the file. None if the file is not seekable (e.g. stream)
+    """
+    seekable = getattr(file_data, "seekable", None)
+    if seekable is None or not seekable():
+        return None
+
+    position = file_data.tell()
+    content_hash = _ContentHash()
+    for chunk in iter(lambda: file_data.read(chunk_size), b""):
+        content_hash.update(chunk)
+
+    file_data.seek(position)
+    return content_hash
+
+
+async def _iter_parts(
+    chunks: AsyncIterable[bytes], part_size: int
+) -> AsyncIterator[bytes]:
+    """
+    Collect the chunks into parts of part_size bytes. Only the last part can be smaller
+    """
+    buffer = bytearray()
+    async for chunk in chunks:
+        buffer += chunk
+        while len(buffer) >= part_size:
+            with memoryview(buffer) as view:
+                part = bytes(view[:part_size])
+            del buffer[:part_size]
+            yield part
+
+    if buffer:
+        yield bytes(buffer)
+
+
+async def _iter_once(data: bytes) -> AsyncIterator[bytes]:
+    yield data
+
+
+async def _chain(head: List[bytes], rest: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    for item in head:
+        yield item
+
+    async for item in rest:
+        yield item
+
+
 class MinioStorage(ObjectStorage):
 
+    # maximum object size of single PUT request. Larger files are uploaded by multipart upload
+    MAX_SINGLE_PUT_SIZE = 5 * 1024 * 1024 * 1024
+
+    # minimum size of the parts of multipart upload (except the last part)
+    MIN_PART_SIZE = 5 * 1024 * 1024
+
+    # maximum number of parts of multipart upload
+    MAX_PARTS = 10000
+
+    # objects of the content index, the upload states and the temporary objects. Stored filenames do not contain "/",
+    # so these objects cannot collide with them, and contains_file, delete and aread_range do not accept them
+    INDEX_PREFIX = "index/"
+
+    # content of deduplicated uploads, keyed by sha256. The stored files of the content are metadata-only references
+    CONTENT_PREFIX = "index/content/"
+
+    # empty object per stored file of the content (<sha256>/<stored filename>), so the references can be counted
+    REFERENCE_PREFIX = "index/references/"
+
+    # parameters of presigned uploads by upload id
+    UPLOAD_STATE_PREFIX = "index/uploads/"
+
+    # uploaded data before it is hashed (streams and presigned uploads) and backups of content being deleted
+    TEMPORARY_PREFIX = "index/tmp/"
+
+    # size of the chunks read when the stored file is hashed after presigned upload
+    HASH_CHUNK_SIZE = 1024 * 1024
+
+    # expiration of the presigned urls of the requests sent by this service. They are used immediately
+    REQUEST_URL_EXPIRATION = timedelta(minutes=15)
+
     def __init__(
         self,
         endpoint: str,
@@ -23,8 +189,24 @@ class MinioStorage(ObjectStorage):
         access_key: str,
         secret_key: str,
         secure: bool = False,
+        existence_cache_size: int = 10000,
+        existence_cache_ttl_seconds: float = 60.0,
+        deduplicate_uploads: bool = True,
     ) -> None:
         self.bucket_name = bucket_name
+
+        # the content of uploads with generated (uuid) filename is stored once under its sha256, and the stored files
+        # are metadata-only references to it
+        self.deduplicate_uploads = deduplicate_uploads
+
+        # results of existence checks (both found and not found) are cached for a short time.
+        # Entries are invalidated by upload and delete of this instance
+        self._existence_cache = TTLCache(
+            existence_cache_size, existence_cache_ttl_seconds
+        )
+
+        # async http clients are bound to the event loop which created them
+        self._http_clients: WeakKeyDictionary = WeakKeyDictionary()
         self.client = Minio(
             endpoint,
             access_key=access_key,
@@ -55,44 +237,78 @@ class MinioStorage(ObjectStorage):
     ) -> str:
 
         metadata = dict(encoded_original_filename=b64encode(filename.encode()).decode())
-
-        if append_uuid_to_filename:
-            stored_filename = prepend_unique_id_to_filename(filename)
-        else:
-            stored_filename = filename
+        stored_filename = self._get_stored_filename(filename, append_uuid_to_filename)
 
         try:
-            if file_length_in_bytes == -1:
-                self.client.put_object(
-                    self.bucket_name,
+            if not (self.deduplicate_uploads and append_uuid_to_filename):
+                self._put_object(
                     stored_filename,
                     file_data,
-                    length=file_length_in_bytes,
-                    part_size=part_size_in_bytes,
-                    metadata=metadata,
+                    file_length_in_bytes,
+                    part_size_in_bytes,
+                    metadata,
                 )
-            else:
-                self.client.put_object(
-                    self.bucket_name,
+                self._existence_cache.pop(stored_filename)
+                return self._get_signed_url(stored_filename)
+
+            # the file is hashed before it is stored, so the content is not sent if it is already stored
+            content_hash = _hash_file(file_data)
+            if content_hash is not None:
+                self._store_content(
+                    content_hash,
                     stored_filename,
-                    file_data,
+                    filename,
+                    lambda content_object: self._put_object(
+                        content_object,
+                        file_data,
+                        file_length_in_bytes,
+                        part_size_in_bytes,
+                    ),
+                )
+
+            else:
+                # stream is hashed while it is uploaded to a temporary object
+                temporary_object = self.TEMPORARY_PREFIX + stored_filename
+                hashing_reader = _HashingReader(file_data)
+                self._put_object(
+                    temporary_object,
+                    hashing_reader,
                     file_length_in_bytes,
-                    metadata=metadata,
+                    part_size_in_bytes,
+                )
+                self._store_temporary_object(
+                    hashing_reader.content_hash,
+                    stored_filename,
+                    filename,
+                    temporary_object,
                 )
 
+            self._existence_cache.pop(stored_filename)
             return self._get_signed_url(stored_filename)
 
         except MaxRetryError as err:
             logger.exception("Could not connect to object storage")
             raise ObjectStorageConnectionError from err
 
+        except ObjectStorageError:
+            logger.exception("Got error from object storage")
+            raise
+
         except Exception as err:
             logger.exception("Got exception from object storage")
             raise ObjectStorageError from err
 
     def contains_file(self, stored_filename: str) -> bool:
+        if self._is_index_object(stored_filename):
+            return False
+
+        cached = self._existence_cache.get(stored_filename)
+        if cached is not None:
+            return cached
+
         try:
             self.client.stat_object(self.bucket_name, stored_filename)
+            self._existence_cache.put(stored_filename, True)
             return True
 
         except MaxRetryError as err:
@@ -100,25 +316,980 @@ class MinioStorage(ObjectStorage):
 
         except Exception as err:
             if "NoSuchKey" in str(err):
+                self._existence_cache.put(stored_filename, False)
                 return False
 
             raise ObjectStorageFileNotFoundError
 
     def delete(self, stored_filename: str) -> bool:
+        self._existence_cache.pop(stored_filename)
+
         try:
             if not self.contains_file(stored_filename):
                 return False
 
+            content_sha256 = self._get_content_sha256(
+                self.client.stat_object(self.bucket_name, stored_filename).metadata
+            )
             self.client.remove_object(self.bucket_name, stored_filename)
+            self._existence_cache.pop(stored_filename)
+
+            # the content of deduplicated upload is deleted with its last stored file
+            if content_sha256 is not None:
+                self._release_content(content_sha256, stored_filename)
 
             return True
 
         except MaxRetryError as err:
             raise ObjectStorageConnectionError from err
 
+        except ObjectStorageError:
+            raise
+
+        except Exception as err:
+            raise ObjectStorageError from err
+
+    async def aupload(
+        self,
+        filename: str,
+        file_data: BinaryIO,
+        file_length_in_bytes: int = -1,
+        part_size_in_bytes: int = 10 * 1024 * 1024,
+        append_uuid_to_filename: bool = True,
+    ) -> str:
+
+        if file_length_in_bytes is None:
+            file_length_in_bytes = -1
+
+        if (
+            file_length_in_bytes < 0
+            or file_length_in_bytes > self.MAX_SINGLE_PUT_SIZE
+            or (self.deduplicate_uploads and append_uuid_to_filename)
+        ):
+            # unknown or very large size needs multipart upload, and deduplicated upload is hashed before it is stored.
+            # Both are done by the sync client
+            file_pointer = getattr(file_data, "file", file_data)
+            return await asyncio.to_thread(
+                self.upload,
+                filename,
+                file_pointer,
+                file_length_in_bytes,
+                part_size_in_bytes,
+                append_uuid_to_filename,
+            )
+
+        stored_filename = self._get_stored_filename(filename, append_uuid_to_filename)
+        headers = self._get_upload_headers(filename)
+
+        try:
+            url, headers = await self._aget_request_url("PUT", stored_filename, headers)
+            headers["Content-Length"] = str(file_length_in_bytes)
+
+            response = await self._get_http_client().put(
+                url, headers=headers, content=_iter_file(file_data, part_size_in_bytes)
+            )
+            if response.status_code != 200:
+                raise ObjectStorageError(
+                    f"Could not upload file to object storage (status: {response.status_code})"
+                )
+
+            self._existence_cache.pop(stored_filename)
+            return self._get_signed_url(stored_filename)
+
+        except httpx.TransportError as err:
+            logger.exception("Could not connect to object storage")
+            raise ObjectStorageConnectionError from err
+
+        except ObjectStorageError:
+            logger.exception("Got error response from object storage")
+            raise
+
+        except Exception as err:
+            logger.exception("Got exception from object storage")
+            raise ObjectStorageError from err
+
+    async def aupload_stream(
+        self,
+        filename: str,
+        chunks: AsyncIterable[bytes],
+        part_size_in_bytes: int = 16 * 1024 * 1024,
+        append_uuid_to_filename: bool = True,
+    ) -> str:
+
+        if part_size_in_bytes < self.MIN_PART_SIZE:
+            raise ObjectStorageError(
+                f"Part size should be at least {self.MIN_PART_SIZE} bytes"
+            )
+
+        stored_filename = self._get_stored_filename(filename, append_uuid_to_filename)
+        headers = self._get_upload_headers(filename)
+
+        # deduplicated upload is hashed while it is uploaded to a temporary object
+        content_hash = None
+        object_name = stored_filename
+        if self.deduplicate_uploads and append_uuid_to_filename:
+            content_hash = _ContentHash()
+            chunks = _iter_hashed(chunks, content_hash)
+            object_name = self.TEMPORARY_PREFIX + stored_filename
+
+        # errors of reading the chunks (e.g. malformed request body) are raised as they are
+        try:
+            parts = _iter_parts(chunks, part_size_in_bytes)
+            first_part = await anext(parts, b"")
+            second_part = await anext(parts, None)
+
+            if second_part is None:
+                # the whole file fits in one part, so single PUT request is enough
+                await self._asend_request(
+                    "PUT", object_name, headers=headers, content=first_part
+                )
+            else:
+                await self._amultipart_upload(
+                    object_name, headers, _chain([first_part, second_part], parts)
+                )
+
+            if content_hash is not None:
+                await asyncio.to_thread(
+                    self._store_temporary_object,
+                    content_hash,
+                    stored_filename,
+                    filename,
+                    object_name,
+                )
+
+            self._existence_cache.pop(stored_filename)
+
+        except ObjectStorageError:
+            logger.exception("Got error from object storage during streaming upload")
+            raise
+
+        return self._get_signed_url(stored_filename)
+
+    async def acreate_presigned_upload(
+        self,
+        filename: str,
+        file_length_in_bytes: int,
+        part_size_in_bytes: int = 16 * 1024 * 1024,
+        expires_in_seconds: int = 3600,
+        append_uuid_to_filename: bool = True,
+    ) -> PresignedUpload:
+
+        if part_size_in_bytes < self.MIN_PART_SIZE:
+            raise ObjectStorageError(
+                f"Part size should be at least {self.MIN_PART_SIZE} bytes"
+            )
+
+        # larger parts for files that would exceed the maximum number of parts
+        part_size_in_bytes = max(
+            part_size_in_bytes, -(-file_length_in_bytes // self.MAX_PARTS)
+        )
+        number_of_parts = max(1, -(-file_length_in_bytes // part_size_in_bytes))
+        stored_filename = self._get_stored_filename(filename, append_uuid_to_filename)
+
+        # deduplicated upload is uploaded to a temporary object, which is hashed on completion
+        deduplicate = self.deduplicate_uploads and append_uuid_to_filename
+        object_name = stored_filename
+        if deduplicate:
+            object_name = self.TEMPORARY_PREFIX + stored_filename
+
+        try:
+            # the object metadata is set when the upload is created, so the client only sends the data
+            upload_id = await self._acreate_multipart_upload(
+                object_name, self._get_upload_headers(filename)
+            )
+
+            # the parameters are saved, so the upload can be resumed and checked by its upload id only
+            state = dict(
+                filename=filename,
+                stored_filename=stored_filename,
+                file_length_in_bytes=file_length_in_bytes,
+                part_size_in_bytes=part_size_in_bytes,
+                deduplicate=deduplicate,
+                object_name=object_name,
+            )
+            await self._asend_request(
+                "PUT",
+                self.UPLOAD_STATE_PREFIX + upload_id,
+                content=json.dumps(state).encode(),
+            )
+
+            # signing is cpu work (and looks up the bucket region once), so it does not run in the event loop
+            part_urls = await asyncio.to_thread(
+                self._get_presigned_part_urls,
+                object_name,
+                upload_id,
+                number_of_parts,
+                expires_in_seconds,
+            )
+
+        except ObjectStorageError:
+            logger.exception(
+                "Got error from object storage while creating presigned upload"
+            )
+            raise
+
+        return PresignedUpload(
+            filename=filename,
+            stored_filename=stored_filename,
+            upload_id=upload_id,
+            part_size_in_bytes=part_size_in_bytes,
+            part_urls=part_urls,
+        )
+
+    async def aresume_presigned_upload(
+        self, upload_id: str, expires_in_seconds: int = 3600
+    ) -> PresignedUpload:
+
+        state = await self._aread_upload_state(upload_id)
+        if state is None:
+            raise ObjectStorageFileNotFoundError
+
+        stored_filename = state["stored_filename"]
+        object_name = state.get("object_name", stored_filename)
+        part_size_in_bytes = state["part_size_in_bytes"]
+        number_of_parts = max(
+            1, -(-state["file_length_in_bytes"] // part_size_in_bytes)
+        )
+
+        try:
+            parts = await self._alist_parts(object_name, upload_id)
+
+        except ObjectStorageFileNotFoundError:
+            # the upload was completed, aborted or removed as stale upload
+            await self._asend_request("DELETE", self.UPLOAD_STATE_PREFIX + upload_id)
+            raise
+
+        # the urls of the uploaded parts are renewed too, so a part can also be sent again
+        part_urls = await asyncio.to_thread(
+            self._get_presigned_part_urls,
+            object_name,
+            upload_id,
+            number_of_parts,
+            expires_in_seconds,
+        )
+
+        return PresignedUpload(
+            filename=state["filename"],
+            stored_filename=stored_filename,
+            upload_id=upload_id,
+            part_size_in_bytes=part_size_in_bytes,
+            part_urls=part_urls,
+            uploaded_parts=sorted(number for number, _, _ in parts),
+        )
+
+    async def acomplete_presigned_upload(
+        self, stored_filename: str, upload_id: str
+    ) -> str:
+
+        try:
+            state = await self._aread_upload_state(upload_id)
+
+            # the stored filename is sent by the client, so it has to be the file of the saved upload
+            if state is not None and state["stored_filename"] != stored_filename:
+                logger.warning(
+                    f"Upload {upload_id} is not the upload of {stored_filename}"
+                )
+                raise ObjectStorageFileNotFoundError
+
+            object_name = stored_filename
+            if state is not None:
+                object_name = state.get("object_name", stored_filename)
+
+            parts = sorted(await self._alist_parts(object_name, upload_id))
+            part_numbers = [number for number, _, _ in parts]
+            complete = bool(parts) and part_numbers == list(range(1, len(parts) + 1))
+
+            # uploads with saved state are also checked for missing parts at the end of the file
+            if state is not None:
+                complete = complete and state["file_length_in_bytes"] == sum(
+                    size for _, _, size in parts
+                )
+
+            if not complete:
+                raise IncompleteUploadError(
+                    f"Some parts of the file are not uploaded (uploaded parts: {len(parts)})"
+                )
+
+            await self._acomplete_multipart_upload(
+                object_name, upload_id, [etag for _, etag, _ in parts]
+            )
+
+            if state is not None:
+                await self._asend_request(
+                    "DELETE", self.UPLOAD_STATE_PREFIX + upload_id
+                )
+
+            # the data did not pass through the API, so the completed temporary object is read back to hash it
+            if object_name != stored_filename:
+                await asyncio.to_thread(
+                    self._store_temporary_object,
+                    await self._ahash_object(object_name),
+                    stored_filename,
+                    state["filename"],
+                    object_name,
+                )
+
+            self._existence_cache.pop(stored_filename)
+
+        except ObjectStorageFileNotFoundError:
+            raise
+
+        except ObjectStorageError:
+            logger.exception(
+                "Got error from object storage while completing presigned upload"
+            )
+            raise
+
+        return self._get_signed_url(stored_filename)
+
+    async def aread_range(
+        self, stored_filename: str, offset: int, length: int
+    ) -> bytes:
+        if self._is_index_object(stored_filename):
+            raise ObjectStorageFileNotFoundError
+
+        # the stored file of deduplicated upload is a reference to its content
+        content_object = stored_filename
+        content_sha256 = await self._aget_content_sha256(stored_filename)
+        if content_sha256 is not None:
+            content_object = self.CONTENT_PREFIX + content_sha256
+
+        response = await self._asend_request(
+            "GET",
+            content_object,
+            headers={"Range": f"bytes={offset}-{offset + length - 1}"},
+            accepted_status_codes=(200, 206, 416),
+        )
+
+        # the range is not satisfiable if the file is empty (or ends before the offset)
+        if response.status_code == 416:
+            return b""
+
+        # the whole file is returned if the object storage ignores the range
+        return (
+            response.content[:length]
+            if response.status_code == 200
+            else response.content
+        )
+
+    async def acontains_file(self, stored_filename: str) -> bool:
+        if self._is_index_object(stored_filename):
+            return False
+
+        cached = self._existence_cache.get(stored_filename)
+        if cached is not None:
+            return cached
+
+        try:
+            url, headers = await self._aget_request_url("HEAD", stored_filename)
+            response = await self._get_http_client().head(url, headers=headers)
+
+        except httpx.TransportError as err:
+            raise ObjectStorageConnectionError from err
+
+        except Exception as err:
+            raise ObjectStorageFileNotFoundError from err
+
+        if response.status_code == 200:
+            self._existence_cache.put(stored_filename, True)
+            return True
+
+        if response.status_code == 404:
+            self._existence_cache.put(stored_filename, False)
+            return False
+
+        raise ObjectStorageFileNotFoundError
+
+    async def adelete(self, stored_filename: str) -> bool:
+        self._existence_cache.pop(stored_filename)
+
+        if not await self.acontains_file(stored_filename):
+            return False
+
+        content_sha256 = await self._aget_content_sha256(stored_filename)
+        await self._asend_request("DELETE", stored_filename)
+        self._existence_cache.pop(stored_filename)
+
+        # the content of deduplicated upload is deleted with its last stored file
+        if content_sha256 is not None:
+            await asyncio.to_thread(
+                self._release_content, content_sha256, stored_filename
+            )
+
+        return True
+
+    async def _amultipart_upload(
+        self,
+        stored_filename: str,
+        headers: Dict[str, str],
+        parts: AsyncIterator[bytes],
+    ) -> None:
+        """
+        Private function to upload the parts by multipart upload.
+        The next part is collected while the previous one is uploaded (at most one part request in flight).
+        The upload is aborted on error, so the uploaded parts do not stay in the bucket
+
+        Args:
+            - stored_filename: filename in the bucket
+            - headers: headers of the object (content type and metadata)
+            - parts: iterator of the parts
+        """
+        upload_id = await self._acreate_multipart_upload(stored_filename, headers)
+
+        etags = []
+        pending = None
+        try:
+            async for part in parts:
+                if pending is not None:
+                    etags.append(await pending)
+
+                pending = asyncio.create_task(
+                    self._aupload_part(stored_filename, upload_id, len(etags) + 1, part)
+                )
+
+            etags.append(await pending)
+            pending = None
+
+            await self._acomplete_multipart_upload(stored_filename, upload_id, etags)
+
+        except BaseException:
+            if pending is not None:
+                pending.cancel()
+                await asyncio.gather(pending, return_exceptions=True)
+
+            try:
+                await self._asend_request(
+                    "DELETE", stored_filename, query_params={"uploadId": upload_id}
+                )
+            except ObjectStorageError:
+                logger.warning(f"Could not abort multipart upload of {stored_filename}")
+
+            raise
+
+    async def _acreate_multipart_upload(
+        self, stored_filename: str, headers: Dict[str, str]
+    ) -> str:
+        """
+        Private function to start multipart upload
+
+        Returns:
+            - upload id
+        """
+        response = await self._asend_request(
+            "POST", stored_filename, query_params={"uploads": ""}, headers=headers
+        )
+        upload_id = ElementTree.fromstring(response.content).findtext("{*}UploadId")
+        if not upload_id:
+            raise ObjectStorageError("Could not start multipart upload")
+
+        return upload_id
+
+    async def _acomplete_multipart_upload(
+        self, stored_filename: str, upload_id: str, etags: List[str]
+    ) -> None:
+        """
+        Private function to complete multipart upload from the etags of the parts (part number is index + 1)
+        """
+        parts_xml = "".join(
+            f"<Part><PartNumber>{number}</PartNumber><ETag>{escape(etag)}</ETag></Part>"
+            for number, etag in enumerate(etags, start=1)
+        )
+        body = f"<CompleteMultipartUpload>{parts_xml}</CompleteMultipartUpload>"
+        response = await self._asend_request(
+            "POST",
+            stored_filename,
+            query_params={"uploadId": upload_id},
+            headers={"Content-Type": "application/xml"},
+            content=body.encode(),
+        )
+
+        # completion can fail after the response status is sent, the error is in the body then
+        if b"<Error>" in response.content:
+            raise ObjectStorageError("Could not complete multipart upload")
+
+    async def _alist_parts(
+        self, stored_filename: str, upload_id: str
+    ) -> List[Tuple[int, str, int]]:
+        """
+        Private function to list the uploaded parts of multipart upload (all pages)
+
+        Returns:
+            - list of part number, etag and size ordered by part number
+        """
+        parts = []
+        query_params = {"uploadId": upload_id}
+        while True:
+            response = await self._asend_request(
+                "GET", stored_filename, query_params=query_params
+            )
+            result = ElementTree.fromstring(response.content)
+            for part in result.iterfind("{*}Part"):
+                parts.append(
+                    (
+                        int(part.findtext("{*}PartNumber")),
+                        part.findtext("{*}ETag"),
+                        int(part.findtext("{*}Size")),
+                    )
+                )
+
+            if result.findtext("{*}IsTruncated") != "true":
+                return parts
+
+            query_params = {
+                "uploadId": upload_id,
+                "part-number-marker": result.findtext("{*}NextPartNumberMarker"),
+            }
+
+    async def _aupload_part(
+        self, stored_filename: str, upload_id: str, part_number: int, part: bytes
+    ) -> str:
+        """
+        Private function to upload one part of multipart upload
+
+        Returns:
+            - etag of the part
+        """
+        response = await self._asend_request(
+            "PUT",
+            stored_filename,
+            query_params={"partNumber": str(part_number), "uploadId": upload_id},
+            content=part,
+        )
+        return response.headers["ETag"]
+
+    async def _asend_request(
+        self,
+        method: str,
+        stored_filename: str,
+        query_params: Dict[str, str] = None,
+        headers: Dict[str, str] = None,
+        content: bytes = None,
+        accepted_status_codes: Tuple[int, ...] = (200, 204, 206),
+    ) -> httpx.Response:
+        """
+        Private function to send signed request to the object in the bucket
+
+        Args:
+            - method: HTTP method
+            - stored_filename: filename in the bucket
+            - query_params: query parameters of the url (e.g. uploadId of multipart upload)
+            - headers: headers of the request
+            - content: body of the request
+            - accepted_status_codes: status codes of successful response
+
+        Returns:
+            - response with successful status
+
+        Raises:
+            - ObjectStorageConnectionError if the object storage cannot be reached
+            - ObjectStorageFileNotFoundError if the object (or multipart upload) does not exist
+            - ObjectStorageError if the response has error status
+        """
+        url, headers = await self._aget_request_url(
+            method, stored_filename, headers, query_params
+        )
+
+        if content is not None:
+            # httpx keeps the body of bytes content until its response is garbage collected
+            # (reference cycle), which would keep every uploaded part in memory.
+            # The body of iterator content is released as soon as it is sent
+            headers["Content-Length"] = str(len(content))
+            content = _iter_once(content)
+
+        try:
+            response = await self._get_http_client().request(
+                method, url, headers=headers, content=content
+            )
+        except httpx.TransportError as err:
+            raise ObjectStorageConnectionError from err
+
+        if response.status_code == 404:
+            raise ObjectStorageFileNotFoundError
+
+        if response.status_code not in accepted_status_codes:
+            raise ObjectStorageError(
+                f"Got error response from object storage (status: {response.status_code})"
+            )
+
+        return response
+
+    def _put_object(
+        self,
+        object_name: str,
+        file_data: BinaryIO,
+        file_length_in_bytes: int = -1,
+        part_size_in_bytes: int = 10 * 1024 * 1024,
+        metadata: Optional[Dict[str, str]] = None,
+    ) -> None:
+        """
+        Private function to upload the file by the sync client. Unknown size is uploaded by multipart upload
+        """
+        if file_length_in_bytes == -1:
+            self.client.put_object(
+                self.bucket_name,
+                object_name,
+                file_data,
+                length=file_length_in_bytes,
+                part_size=part_size_in_bytes,
+                metadata=metadata,
+            )
+        else:
+            self.client.put_object(
+                self.bucket_name,
+                object_name,
+                file_data,
+                file_length_in_bytes,
+                metadata=metadata,
+            )
+
+    def _store_content(
+        self,
+        content_hash: _ContentHash,
+        stored_filename: str,
+        filename: str,
+        put_content: Callable[[str], None],
+    ) -> None:
+        """
+        Private function to store the uploaded file as metadata-only reference to its content.
+        The reference is counted before the content is looked up, so the content is not deleted meanwhile.
+        Concurrent uploads of new content store the same data to the same object, so no conditional request is needed
+
+        Args:
+            - content_hash: sha256 and size of the uploaded file
+            - stored_filename: filename in the bucket
+            - filename: original filename (metadata of the reference)
+            - put_content: function storing the data of the uploaded file to the given object.
+              It is not called if the content is already stored
+
+        Raises:
+            - ObjectStorageConnectionError if the object storage cannot be reached
+            - ObjectStorageError if there is problem with the object storage service
+        """
+        sha256 = content_hash.hexdigest()
+        content_object = self.CONTENT_PREFIX + sha256
+
+        with self._handle_client_errors():
+            self._put_empty_object(f"{self.REFERENCE_PREFIX}{sha256}/{stored_filename}")
+
+        try:
+            with self._handle_client_errors():
+                if self._object_exists(content_object):
+                    logger.info(f"Content of {stored_filename} is already stored")
+                else:
+                    put_content(content_object)
+
+                # the size of the content is in the metadata, the reference itself is empty
+                self._put_empty_object(
+                    stored_filename,
+                    metadata={
+                        "encoded_original_filename": b64encode(
+                            filename.encode()
+                        ).decode(),
+                        "x-amz-meta-content-sha256": sha256,
+                        "x-amz-meta-content-length": str(content_hash.size),
+                    },
+                )
+
+        except BaseException:
+            try:
+                self._release_content(sha256, stored_filename)
+            except ObjectStorageError:
+                logger.warning(f"Could not release content of {stored_filename}")
+
+            raise
+
+    def _store_temporary_object(
+        self,
+        content_hash: _ContentHash,
+        stored_filename: str,
+        filename: str,
+        temporary_object: str,
+    ) -> None:
+        """
+        Private function to store the uploaded temporary object as the content of the stored file.
+        It is copied on the object storage server only if the content is not stored yet, and deleted afterwards
+        """
+        try:
+            self._store_content(
+                content_hash,
+                stored_filename,
+                filename,
+                lambda content_object: self._copy_object(
+                    temporary_object, content_object
+                ),
+            )
+
+        finally:
+            with self._handle_client_errors():
+                self.client.remove_object(self.bucket_name, temporary_object)
+
+    def _release_content(self, sha256: str, stored_filename: str) -> None:
+        """
+        Private function to remove the reference of the deleted stored file. The content is deleted with its last reference.
+        An upload which found the content before it was deleted refers to it afterwards,
+        so the content is backed up before it is deleted and restored if a reference was added meanwhile
+
+        Args:
+            - sha256: content hash of the stored file
+            - stored_filename: filename in the bucket
+
+        Raises:
+            - ObjectStorageConnectionError if the object storage cannot be reached
+            - ObjectStorageError if there is problem with the object storage service
+        """
+        content_object = self.CONTENT_PREFIX + sha256
+        backup_object = self.TEMPORARY_PREFIX + prepend_unique_id_to_filename(sha256)
+
+        with self._handle_client_errors():
+            self.client.remove_object(
+                self.bucket_name, f"{self.REFERENCE_PREFIX}{sha256}/{stored_filename}"
+            )
+            if self._has_references(sha256):
+                return
+
+            try:
+                self._copy_object(content_object, backup_object)
+            except ObjectStorageFileNotFoundError:
+                # the content was deleted by the release of other stored file
+                return
+
+            self.client.remove_object(self.bucket_name, content_object)
+            if self._has_references(sha256):
+                logger.info(f"Restored content {sha256} referred to by new upload")
+                self._copy_object(backup_object, content_object)
+
+            self.client.remove_object(self.bucket_name, backup_object)
+
+    async def _aget_content_sha256(self, stored_filename: str) -> Optional[str]:
+        """
+        Private function to get sha256 of the content of the stored file from its metadata
+
+        Returns:
+            - sha256. None if the file is not deduplicated upload (or does not exist)
+        """
+        try:
+            response = await self._asend_request("HEAD", stored_filename)
+        except ObjectStorageFileNotFoundError:
+            return None
+
+        return self._get_content_sha256(response.headers)
+
+    def _get_content_sha256(self, headers) -> Optional[str]:
+        return headers.get("x-amz-meta-content-sha256")
+
+    def _put_empty_object(
+        self, object_name: str, metadata: Optional[Dict[str, str]] = None
+    ) -> None:
+        self.client.put_object(
+            self.bucket_name, object_name, io.BytesIO(b""), 0, metadata=metadata
+        )
+
+    def _object_exists(self, object_name: str) -> bool:
+        """
+        Private function to check the object in the bucket without the existence cache (also for index objects)
+        """
+        try:
+            self.client.stat_object(self.bucket_name, object_name)
+        except Exception as err:
+            if "NoSuchKey" in str(err):
+                return False
+
+            raise
+
+        return True
+
+    def _has_references(self, sha256: str) -> bool:
+        """
+        Private function to check whether any stored file refers to the content
+        """
+        references = self.client.list_objects(
+            self.bucket_name, prefix=f"{self.REFERENCE_PREFIX}{sha256}/"
+        )
+        return next(iter(references), None) is not None
+
+    def _copy_object(self, source: str, target: str) -> None:
+        """
+        Private function to copy the object in the bucket on the object storage server.
+        Objects larger than the maximum size of single copy request are copied by multipart copy
+
+        Raises:
+            - ObjectStorageFileNotFoundError if the source object does not exist
+        """
+        with self._handle_client_errors():
+            self.client.compose_object(
+                self.bucket_name, target, [ComposeSource(self.bucket_name, source)]
+            )
+
+    @contextmanager
+    def _handle_client_errors(self):
+        """
+        Private context manager that converts errors of the sync client to ObjectStorageError family
+        """
+        try:
+            yield
+        except ObjectStorageError:
+            raise
+
+        except MaxRetryError as err:
+            raise ObjectStorageConnectionError from err
+
         except Exception as err:
+            if "NoSuchKey" in str(err):
+                raise ObjectStorageFileNotFoundError from err
+
             raise ObjectStorageError from err
 
+    async def _ahash_object(self, stored_filename: str) -> _ContentHash:
+        """
+        Private function to compute sha256 (and size) of the stored file. The file is streamed, so it is not kept in memory
+
+        Raises:
+            - ObjectStorageConnectionError if the object storage cannot be reached
+            - ObjectStorageError if the file cannot be read
+        """
+        url, headers = await self._aget_request_url("GET", stored_filename)
+        content_hash = _ContentHash()
+        try:
+            async with self._get_http_client().stream(
+                "GET", url, headers=headers
+            ) as response:
+                if response.status_code != 200:
+                    raise ObjectStorageError(
+                        f"Could not read file from object storage (status: {response.status_code})"
+                    )
+
+                async for chunk in response.aiter_bytes(self.HASH_CHUNK_SIZE):
+                    content_hash.update(chunk)
+
+        except httpx.TransportError as err:
+            raise ObjectStorageConnectionError from err
+
+        return content_hash
+
+    async def _aread_upload_state(self, upload_id: str) -> Optional[Dict]:
+        """
+        Private function to read the parameters of presigned upload saved by acreate_presigned_upload
+
+        Returns:
+            - dict of filename, stored_filename, file_length_in_bytes, part_size_in_bytes, deduplicate and
+              object_name (the uploaded object, a temporary object for deduplicated upload). None if the state does not exist (e.g. upload created by older version)
+        """
+        try:
+            response = await self._asend_request(
+                "GET", self.UPLOAD_STATE_PREFIX + upload_id
+            )
+        except ObjectStorageFileNotFoundError:
+            return None
+
+        return json.loads(response.content)
+
+    def _get_presigned_part_urls(
+        self,
+        stored_filename: str,
+        upload_id: str,
+        number_of_parts: int,
+        expires_in_seconds: int,
+    ) -> List[str]:
+        """
+        Private function to get the presigned PUT urls of the parts of multipart upload
+        """
+        return [
+            self.client.get_presigned_url(
+                "PUT",
+                self.bucket_name,
+                stored_filename,
+                expires=timedelta(seconds=expires_in_seconds),
+                extra_query_params={
+                    "partNumber": str(part_number),
+                    "uploadId": upload_id,
+                },
+            )
+            for part_number in range(1, number_of_parts + 1)
+        ]
+
+    def _get_stored_filename(self, filename: str, append_uuid_to_filename: bool) -> str:
+        """
+        Private function to get the filename in the bucket of the uploaded file
+
+        Raises:
+            - ObjectStorageError if the filename is reserved for the objects of the index
+        """
+        if append_uuid_to_filename:
+            return prepend_unique_id_to_filename(filename)
+
+        if self._is_index_object(filename):
+            raise ObjectStorageError(
+                f"Filename should not start with {self.INDEX_PREFIX}"
+            )
+
+        return filename
+
+    def _is_index_object(self, stored_filename: str) -> bool:
+        """
+        Private function to check whether the name is an object of the index (not a stored file)
+        """
+        return stored_filename.startswith(self.INDEX_PREFIX)
+
+    def _get_upload_headers(self, filename: str) -> Dict[str, str]:
+        """
+        Private function to get the headers of uploaded object. The original filename is stored as metadata
+        """
+        return {
+            "Content-Type": "application/octet-stream",
+            "x-amz-meta-encoded_original_filename": b64encode(
+                filename.encode()
+            ).decode(),
+        }
+
+    def _get_http_client(self) -> httpx.AsyncClient:
+        """
+        Private function to get the async http client (with connection pool) of the running event loop
+        """
+        loop = asyncio.get_running_loop()
+        client = self._http_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(timeout=httpx.Timeout(60.0, connect=10.0))
+            self._http_clients[loop] = client
+
+        return client
+
+    async def _aget_request_url(
+        self,
+        method: str,
+        stored_filename: str,
+        headers: Dict[str, str] = None,
+        query_params: Dict[str, str] = None,
+    ) -> Tuple[str, Dict[str, str]]:
+        """
+        Private function to get the presigned url of a request to the object in the bucket.
+        The url is presigned by the minio client in a thread, because it may look up the region of the bucket.
+        The payload is not signed, so the request body can be streamed.
+        The x-amz-* headers (e.g. metadata) are sent as query parameters, so they are covered by the signature
+
+        Args:
+            - method: HTTP method
+            - stored_filename: filename in the bucket
+            - headers: headers of the request
+            - query_params: query parameters of the url (e.g. uploadId of multipart upload)
+
+        Returns:
+            - tuple of url and the other headers
+        """
+        headers = dict(headers or {})
+        query_params = dict(query_params or {})
+        for name in [name for name in headers if name.lower().startswith("x-amz-")]:
+            query_params[name] = headers.pop(name)
+
+        url = await asyncio.to_thread(
+            self.client.get_presigned_url,
+            method,
+            self.bucket_name,
+            stored_filename,
+            expires=self.REQUEST_URL_EXPIRATION,
+            extra_query_params=query_params,
+        )
+        return url, headers
+
     def _get_signed_url(self, stored_filename: str) -> str:
         """
         Private function for getting dummy signed URL for the target file in the bucket
@@ -0,0 +1,84 @@
+"""
+Benchmark of embedding throughput during import (offline).
+
+It compares
+    - serial: one request per 64 chunks (the batching used by langchain Qdrant.add_documents)
+    - batched: BatchedEmbeddings with token-budgeted batches and concurrent requests
+
+Usage:
+    python -m benchmarks.bench_embedding --chunks 5000 --concurrency 4
+"""
+
+import argparse
+import time
+
+from api.service.llm.batch_embedding import BatchedEmbeddings
+from benchmarks.fake_embeddings import SimulatedEmbeddings
+
+
+def generate_chunks(total: int):
+    # roughly the size of a 128-token chunk of the japanese building code
+    return [
+        f"第{i}条 建築物の敷地、構造及び建築設備に関する基準。" * 6
+        for i in range(total)
+    ]
+
+
+def run_serial(embeddings: SimulatedEmbeddings, chunks, batch_size=64):
+    for i in range(0, len(chunks), batch_size):
+        embeddings.embed_documents(chunks[i : i + batch_size])
+
+
+def run_batched(embeddings: SimulatedEmbeddings, chunks, args):
+    batched = BatchedEmbeddings(
+        embeddings,
+        max_batch_tokens=args.max_batch_tokens,
+        max_batch_size=args.max_batch_size,
+        max_concurrency=args.concurrency,
+        retry_wait_seconds=0.1,
+    )
+    batched.embed_documents(chunks)
+    return batched
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--max-batch-tokens", type=int, default=50000)
+    parser.add_argument("--max-batch-size", type=int, default=512)
+    parser.add_argument("--server-max-concurrent-requests", type=int, default=8)
+    parser.add_argument("--server-max-texts-in-flight", type=int, default=1024)
+    args = parser.parse_args()
+
+    chunks = generate_chunks(args.chunks)
+
+    def new_server():
+        return SimulatedEmbeddings(
+            dimensions=1536,
+            latency_seconds=args.latency,
+            max_concurrent_requests=args.server_max_concurrent_requests,
+            max_texts_in_flight=args.server_max_texts_in_flight,
+        )
+
+    server = new_server()
+    start = time.perf_counter()
+    run_serial(server, chunks)
+    serial_seconds = time.perf_counter() - start
+    print(
+        f"serial : {serial_seconds:.2f}s, {len(chunks) / serial_seconds:.0f} chunks/s, {server.requests} requests"
+    )
+
+    server = new_server()
+    start = time.perf_counter()
+    batched = run_batched(server, chunks, args)
+    batched_seconds = time.perf_counter() - start
+    print(
+        f"batched: {batched_seconds:.2f}s, {len(chunks) / batched_seconds:.0f} chunks/s, {server.requests} requests, "
+        f"{server.rate_limited_requests} rate limited, final batch size {batched.batch_size}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Benchmark of filtered vector search with and without keyword payload index on the source field.
+
+It creates two collections with the same synthetic points (random vectors, metadata.source of one of many files)
+    - no_index: no payload index (the collection created before payload indexes were introduced)
+    - source_index: keyword payload index on metadata.source (the collection created by Gpt35LLMService)
+and measures latency of search filtered by a single source, one by one and as one search_batch request.
+
+Local mode (":memory:") ignores payload indexes, so it requires running Qdrant server (e.g. docker compose up qdrant).
+The collections are deleted at the end.
+
+Usage:
+    python -m benchmarks.bench_payload_index --url http://localhost:6333 --points 1000000 --sources 10000
+"""
+
+import argparse
+import statistics
+import time
+
+import numpy as np
+import qdrant_client
+from qdrant_client.http.models import (
+    Distance,
+    FieldCondition,
+    Filter,
+    MatchValue,
+    PayloadSchemaType,
+    SearchRequest,
+    VectorParams,
+)
+
+
+def create_collection(client, name, args, with_index):
+    if client.collection_exists(name):
+        client.delete_collection(name)
+
+    client.create_collection(
+        name,
+        vectors_config=VectorParams(size=args.dimensions, distance=Distance.COSINE),
+    )
+
+    if with_index:
+        client.create_payload_index(
+            name, field_name="metadata.source", field_schema=PayloadSchemaType.KEYWORD
+        )
+
+    rng = np.random.default_rng(0)
+    start = time.perf_counter()
+    for offset in range(0, args.points, args.upload_batch_size):
+        size = min(args.upload_batch_size, args.points - offset)
+        client.upload_collection(
+            name,
+            vectors=rng.random((size, args.dimensions), dtype=np.float32),
+            payload=[
+                dict(metadata=dict(source=f"file{(offset + i) % args.sources}"))
+                for i in range(size)
+            ],
+            ids=range(offset, offset + size),
+            batch_size=1024,
+            parallel=args.upload_parallel,
+            wait=True,
+        )
+
+    # wait until the optimizer has built the vector and payload indexes
+    while client.get_collection(name).status != "green":
+        time.sleep(1)
+
+    print(
+        f"{name}: uploaded {args.points} points in {time.perf_counter() - start:.1f}s"
+    )
+
+
+def source_filter(source):
+    return Filter(
+        must=[FieldCondition(key="metadata.source", match=MatchValue(value=source))]
+    )
+
+
+def benchmark_search(client, name, args):
+    rng = np.random.default_rng(1)
+    queries = rng.random((args.queries, args.dimensions), dtype=np.float32)
+    sources = [f"file{i}" for i in rng.integers(0, args.sources, args.queries)]
+
+    latencies = []
+    for vector, source in zip(queries, sources):
+        start = time.perf_counter()
+        client.search(
+            name,
+            query_vector=vector,
+            query_filter=source_filter(source),
+            limit=args.top_k,
+        )
+        latencies.append(time.perf_counter() - start)
+
+    # multi-query call against one file (like /v1/extract/batch)
+    start = time.perf_counter()
+    for i in range(0, args.queries, args.batch_size):
+        client.search_batch(
+            name,
+            requests=[
+                SearchRequest(
+                    vector=vector.tolist(),
+                    filter=source_filter(sources[i]),
+                    limit=args.top_k,
+                )
+                for vector in queries[i : i + args.batch_size]
+            ],
+        )
+    batch_seconds = time.perf_counter() - start
+
+    latencies.sort()
+    print(
+        f"{name}: single search p50 {statistics.median(latencies) * 1000:.1f}ms, "
+        f"p99 {latencies[int(0.99 * (len(latencies) - 1))] * 1000:.1f}ms, "
+        f"search_batch {batch_seconds / args.queries * 1000:.2f}ms per query"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:6333")
+    parser.add_argument("--points", type=int, default=1_000_000)
+    parser.add_argument("--sources", type=int, default=10000)
+    parser.add_argument("--dimensions", type=int, default=64)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--upload-batch-size", type=int, default=100000)
+    parser.add_argument("--upload-parallel", type=int, default=4)
+    args = parser.parse_args()
+
+    client = qdrant_client.QdrantClient(args.url, timeout=300)
+    collections = []
+
+    try:
+        collections = [("bench_no_index", False), ("bench_source_index", True)]
+
+        for name, with_index in collections:
+            create_collection(client, name, args, with_index)
+            benchmark_search(client, name, args)
+
+    finally:
+        for name, _ in collections:
+            if client.collection_exists(name):
+                client.delete_collection(name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Benchmark of recall and latency of vector db storage settings (quantization, on-disk vectors, HNSW parameters).
+
+The ground truth is exact search with the in-memory (":memory:") client, which always does brute force search.
+The same synthetic points are uploaded to a running Qdrant server with each quantization setting and
+recall@k of the filtered search (like the retrieval of the extract endpoint) and latency are measured.
+
+Points are clustered random vectors, so the neighbours are meaningful like text embeddings.
+The collections are deleted at the end.
+
+Usage:
+    python -m benchmarks.bench_quantization --points 100000 --quantization none scalar binary --on-disk
+"""
+
+import argparse
+import statistics
+import time
+
+import numpy as np
+import qdrant_client
+from qdrant_client.http.models import (
+    Distance,
+    FieldCondition,
+    Filter,
+    MatchValue,
+    VectorParams,
+)
+
+from api.service.llm.vector_db_config import (
+    QUANTIZATION_TYPES,
+    get_hnsw_config,
+    get_quantization_config,
+    get_search_params,
+)
+
+
+def generate_points(args):
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(args.clusters, args.dimensions))
+    assignments = rng.integers(0, args.clusters, args.points)
+    vectors = centers[assignments] + 0.5 * rng.normal(
+        size=(args.points, args.dimensions)
+    )
+    sources = [f"file{i % args.sources}" for i in range(args.points)]
+
+    query_centers = centers[rng.integers(0, args.clusters, args.queries)]
+    queries = query_centers + 0.5 * rng.normal(size=(args.queries, args.dimensions))
+    query_sources = [f"file{i}" for i in rng.integers(0, args.sources, args.queries)]
+
+    return (
+        vectors.astype(np.float32),
+        sources,
+        queries.astype(np.float32),
+        query_sources,
+    )
+
+
+def source_filter(source):
+    return Filter(
+        must=[FieldCondition(key="metadata.source", match=MatchValue(value=source))]
+    )
+
+
+def upload(client, name, vectors, sources, args, quantization=None):
+    if client.collection_exists(name):
+        client.delete_collection(name)
+
+    kwargs = {}
+    if quantization is not None:
+        kwargs = dict(
+            hnsw_config=get_hnsw_config(args.hnsw_m, args.hnsw_ef_construct),
+            quantization_config=get_quantization_config(quantization),
+        )
+
+    client.create_collection(
+        name,
+        vectors_config=VectorParams(
+            size=args.dimensions,
+            distance=Distance.COSINE,
+            on_disk=args.on_disk or None,
+        ),
+        **kwargs,
+    )
+
+    client.upload_collection(
+        name,
+        vectors=vectors,
+        payload=[dict(metadata=dict(source=source)) for source in sources],
+        ids=range(len(vectors)),
+        batch_size=1024,
+        wait=True,
+    )
+
+    # wait until the optimizer has built the index
+    while client.get_collection(name).status != "green":
+        time.sleep(1)
+
+
+def search(client, name, queries, query_sources, args, search_params=None):
+    results = []
+    latencies = []
+    for vector, source in zip(queries, query_sources):
+        start = time.perf_counter()
+        points = client.search(
+            name,
+            query_vector=vector,
+            query_filter=source_filter(source),
+            limit=args.top_k,
+            search_params=search_params,
+        )
+        latencies.append(time.perf_counter() - start)
+        results.append({point.id for point in points})
+
+    return results, sorted(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:6333")
+    parser.add_argument("--points", type=int, default=100000)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--clusters", type=int, default=1000)
+    parser.add_argument("--sources", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument(
+        "--quantization",
+        nargs="+",
+        choices=QUANTIZATION_TYPES,
+        default=QUANTIZATION_TYPES,
+    )
+    parser.add_argument(
+        "--oversampling", type=float, nargs="+", default=[1.0, 2.0, 4.0]
+    )
+    parser.add_argument("--on-disk", action="store_true")
+    parser.add_argument("--hnsw-m", type=int, default=0)
+    parser.add_argument("--hnsw-ef-construct", type=int, default=0)
+    args = parser.parse_args()
+
+    vectors, sources, queries, query_sources = generate_points(args)
+
+    exact_client = qdrant_client.QdrantClient(":memory:")
+    upload(exact_client, "exact", vectors, sources, args)
+    expected, _ = search(exact_client, "exact", queries, query_sources, args)
+
+    client = qdrant_client.QdrantClient(args.url, timeout=300)
+    for quantization in args.quantization:
+        name = f"bench_quantization_{quantization}"
+        try:
+            start = time.perf_counter()
+            upload(client, name, vectors, sources, args, quantization)
+            print(f"{quantization}: indexed in {time.perf_counter() - start:.1f}s")
+
+            # (rescore, oversampling) pairs. Search params do not apply without quantization
+            settings = [(False, None)]
+            if quantization != "none":
+                settings += [(True, value) for value in args.oversampling]
+
+            for rescore, oversampling in settings:
+                search_params = get_search_params(quantization, rescore, oversampling)
+                results, latencies = search(
+                    client, name, queries, query_sources, args, search_params
+                )
+                recall = statistics.mean(
+                    len(result & truth) / max(1, len(truth))
+                    for result, truth in zip(results, expected)
+                )
+                print(
+                    f"  rescore={rescore} oversampling={oversampling}: "
+                    f"recall@{args.top_k} {recall:.3f}, "
+                    f"p50 {statistics.median(latencies) * 1000:.1f}ms, "
+                    f"p99 {latencies[int(0.99 * (len(latencies) - 1))] * 1000:.1f}ms"
+                )
+
+        finally:
+            if client.collection_exists(name):
+                client.delete_collection(name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Micro-benchmark of document splitting with tiktoken length function.
+
+It compares
+    - before: RecursiveCharacterTextSplitter.from_tiktoken_encoder built for every split (per-piece tokenizer calls)
+    - after: the cached splitter from get_text_splitter (memoized, batched token counting)
+
+The tiktoken encoding file must be available (downloaded or in TIKTOKEN_CACHE_DIR).
+
+Usage:
+    python -m benchmarks.bench_splitter --size-mb 2 --repeat 3
+"""
+
+import argparse
+import os
+import time
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from api.service.llm import load_ocr_json_result
+from api.service.llm.splitter import get_text_splitter
+
+MODEL_NAME = "gpt-3.5-turbo"
+
+
+def load_text(size_mb: float) -> str:
+    path = os.path.join("test_files", "ocr", "建築基準法施行令.json")
+    if os.path.exists(path):
+        base = load_ocr_json_result(path)[0].page_content
+    else:
+        base = "".join(
+            f"第{i}条　建築物の敷地、構造及び建築設備は、この政令の定める基準に適合しなければならない。\n"
+            for i in range(1000)
+        )
+
+    repeat = max(1, int(size_mb * 1024 * 1024 / len(base.encode())))
+    return base * repeat
+
+
+def split_before(text: str, chunk_size: int, chunk_overlap: int) -> int:
+    splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+        model_name=MODEL_NAME, chunk_size=chunk_size, chunk_overlap=chunk_overlap
+    )
+    return len(splitter.split_text(text))
+
+
+def split_after(text: str, chunk_size: int, chunk_overlap: int) -> int:
+    splitter = get_text_splitter(MODEL_NAME, chunk_size, chunk_overlap)
+    return len(splitter.split_text(text))
+
+
+def measure(name, split_function, text, args):
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        chunks = split_function(text, args.chunk_size, args.chunk_overlap)
+    seconds = time.perf_counter() - start
+    print(
+        f"{name}: {args.repeat / seconds:.2f} splits/s, {chunks * args.repeat / seconds:.0f} chunks/s ({chunks} chunks per split)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=float, default=2)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--chunk-size", type=int, default=128)
+    parser.add_argument("--chunk-overlap", type=int, default=20)
+    args = parser.parse_args()
+
+    text = load_text(args.size_mb)
+    print(f"text size: {len(text.encode()) / 1024 / 1024:.1f}MB")
+
+    measure("before", split_before, text, args)
+    measure("after ", split_after, text, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark of large file upload through /v1/upload (FastAPI UploadFile, spooled to a temporary file)
+and /v1/upload/stream (incremental multipart parser, piped to object storage multipart upload).
+The multipart body with a synthetic TIFF file is generated on the fly, so files of several GB need no disk space.
+
+It requires running API with object storage (e.g. local MinIO of docker-compose-local.yml).
+Pass the process id of the API (e.g. `pgrep -f uvicorn`) to report its peak memory (VmHWM, linux only).
+Peak memory is not reset between runs, so run the endpoints in separate API processes for comparison.
+
+Usage:
+    python -m benchmarks.bench_stream_upload --url http://localhost:8000 --size-mb 2048 --endpoint stream --api-pid <pid>
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+import httpx
+
+BOUNDARY = "benchmarkboundary7MA4YWxkTrZu0gW"
+
+# little-endian TIFF header. The rest of the file is random data (content is not validated by the API)
+TIFF_HEADER = b"II*\x00\x08\x00\x00\x00"
+
+
+def get_peak_memory_mb(pid):
+    if pid is None:
+        return None
+
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+
+    return None
+
+
+async def generate_body(size_in_bytes, chunk_size, filename):
+    yield (
+        f"--{BOUNDARY}\r\n"
+        f'Content-Disposition: form-data; name="files"; filename="{filename}"\r\n'
+        f"Content-Type: image/tiff\r\n\r\n"
+    ).encode()
+    yield TIFF_HEADER
+
+    # random data is reused, so generating the body costs (almost) nothing
+    chunk = os.urandom(chunk_size)
+    remaining = size_in_bytes - len(TIFF_HEADER)
+    while remaining > 0:
+        yield chunk[: min(remaining, chunk_size)]
+        remaining -= chunk_size
+
+    yield f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+async def run(args):
+    path = "/v1/upload/stream" if args.endpoint == "stream" else "/v1/upload"
+    size_in_bytes = args.size_mb * 1024 * 1024
+    headers = {"Content-Type": f"multipart/form-data; boundary={BOUNDARY}"}
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=None) as client:
+        for run_number in range(args.runs):
+            start = time.perf_counter()
+            response = await client.post(
+                path,
+                headers=headers,
+                content=generate_body(
+                    size_in_bytes, args.chunk_kb * 1024, f"bench_{run_number}.tif"
+                ),
+            )
+            elapsed = time.perf_counter() - start
+
+            response.raise_for_status()
+            result = response.json()["upload_results"][0]
+            if result["signed_url"] is None:
+                raise RuntimeError(
+                    f"Upload failed: {result['error_code']} {result['detail']}"
+                )
+
+            print(
+                f"{path}: {args.size_mb}MB in {elapsed:.2f}s, {args.size_mb / elapsed:.1f}MB/s",
+                end="",
+            )
+            peak_memory = get_peak_memory_mb(args.api_pid)
+            print(
+                f", API peak memory {peak_memory:.0f}MB"
+                if peak_memory is not None
+                else ""
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--endpoint", choices=["stream", "upload"], default="stream")
+    parser.add_argument("--size-mb", type=int, default=2048)
+    parser.add_argument("--chunk-kb", type=int, default=64)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--api-pid", type=int, default=None)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
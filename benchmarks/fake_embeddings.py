@@ -0,0 +1,86 @@
+import time
+from hashlib import sha256
+from threading import Lock
+from typing import List
+
+import httpx
+import openai
+from langchain_core.embeddings import Embeddings
+
+
+def create_rate_limit_error() -> openai.RateLimitError:
+    """
+    Function to create the same error as openai client raises on HTTP 429
+    """
+    request = httpx.Request("POST", "http://localhost/v1/embeddings")
+    response = httpx.Response(429, request=request)
+    return openai.RateLimitError("Rate limit reached", response=response, body=None)
+
+
+class SimulatedEmbeddings(Embeddings):
+    """
+    Offline stand-in for OpenAIEmbeddings used for benchmarking.
+    Each embed_documents call behaves like one api request: it sleeps for a fixed round-trip latency plus
+    a per-text processing time, and raises RateLimitError when too many requests or too many texts are in flight.
+    The vectors are deterministic pseudo-random values derived from the text.
+
+    Args:
+        - dimensions: size of the returned vectors
+        - latency_seconds: round-trip latency of one request
+        - seconds_per_text: processing time per text in a request
+        - max_concurrent_requests: requests beyond this number fail with RateLimitError
+        - max_texts_in_flight: texts beyond this number (across concurrent requests) fail with RateLimitError
+    """
+
+    def __init__(
+        self,
+        dimensions: int = 1536,
+        latency_seconds: float = 0.2,
+        seconds_per_text: float = 0.0005,
+        max_concurrent_requests: int = 8,
+        max_texts_in_flight: int = 4096,
+    ) -> None:
+        self.dimensions = dimensions
+        self.latency_seconds = latency_seconds
+        self.seconds_per_text = seconds_per_text
+        self.max_concurrent_requests = max_concurrent_requests
+        self.max_texts_in_flight = max_texts_in_flight
+
+        self._lock = Lock()
+        self._requests_in_flight = 0
+        self._texts_in_flight = 0
+        self.requests = 0
+        self.rate_limited_requests = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with self._lock:
+            self.requests += 1
+            if (
+                self._requests_in_flight + 1 > self.max_concurrent_requests
+                or self._texts_in_flight + len(texts) > self.max_texts_in_flight
+            ):
+                self.rate_limited_requests += 1
+                raise create_rate_limit_error()
+
+            self._requests_in_flight += 1
+            self._texts_in_flight += len(texts)
+
+        try:
+            time.sleep(self.latency_seconds + self.seconds_per_text * len(texts))
+            return [self._get_vector(text) for text in texts]
+
+        finally:
+            with self._lock:
+                self._requests_in_flight -= 1
+                self._texts_in_flight -= len(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.latency_seconds)
+        return self._get_vector(text)
+
+    def _get_vector(self, text: str) -> List[float]:
+        digest = sha256(text.encode()).digest()
+        return [
+            (digest[i % len(digest)] ^ (i * 31 % 256)) / 255.0
+            for i in range(self.dimensions)
+        ]
@@ -0,0 +1,81 @@
+"""
+Load test of event loop responsiveness.
+It keeps sending /v1/extract requests with fixed concurrency and measures the latency of /v1/health at the same time.
+If extract blocks the event loop (e.g. blocking object storage call), health check latency grows with the extract load.
+
+It requires running API (with object storage, vector db and OpenAI) and a signed URL of an imported document.
+
+Usage:
+    python -m benchmarks.load_health_p99 --url http://localhost:8000 --signed-url <signed url> --concurrency 50 --duration 30
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+def percentile(values, q):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))
+    return values[index]
+
+
+async def extract_worker(client, args, stop_at, latencies):
+    payload = dict(query=args.query, signed_url=args.signed_url)
+    while time.perf_counter() < stop_at:
+        start = time.perf_counter()
+        await client.post("/v1/extract", json=payload)
+        latencies.append(time.perf_counter() - start)
+
+
+async def health_worker(client, args, stop_at, latencies):
+    while time.perf_counter() < stop_at:
+        start = time.perf_counter()
+        await client.get("/v1/health")
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(args.health_interval)
+
+
+async def run(args):
+    limits = httpx.Limits(max_connections=args.concurrency + 10)
+    async with httpx.AsyncClient(
+        base_url=args.url, timeout=300, limits=limits
+    ) as client:
+        stop_at = time.perf_counter() + args.duration
+        extract_latencies, health_latencies = [], []
+
+        await asyncio.gather(
+            health_worker(client, args, stop_at, health_latencies),
+            *[
+                extract_worker(client, args, stop_at, extract_latencies)
+                for _ in range(args.concurrency)
+            ],
+        )
+
+    print(
+        f"extract: {len(extract_latencies)} requests, p50 {statistics.median(extract_latencies) * 1000:.0f}ms"
+    )
+    print(
+        f"health : {len(health_latencies)} requests, p50 {statistics.median(health_latencies) * 1000:.1f}ms, "
+        f"p99 {percentile(health_latencies, 99) * 1000:.1f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--signed-url", required=True)
+    parser.add_argument(
+        "--query", default="When Tokyo Building Safety Regulation is made"
+    )
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--health-interval", type=float, default=0.05)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
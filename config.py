@@ -1,5 +1,7 @@
+from typing import Literal
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from pydantic import Field, NonNegativeInt
+from pydantic import Field, NonNegativeInt, PositiveInt
 
 
 class AppSettings(BaseSettings):
@@ -11,9 +13,41 @@ class AppSettings(BaseSettings):
     # Vector database URL
     llm_vector_db_url: str = Field(default="http://localhost:6333")
 
-    # Vector database collection name
+    # Vector database collection name. It is an alias of the collection storing the vectors of the current
+    # embedding model (<collection name>_<model>_<dimensions>), so that the embedding migration can switch it atomically
     llm_vector_db_collection_name: str = Field(default="tektome")
 
+    # Number of vector db collections the documents are partitioned into (by the hash of the document source).
+    # Import and query use only the partition of the document, so their cost does not grow with the whole corpus.
+    # 1 means a single collection named LLM_VECTOR_DB_COLLECTION_NAME. Otherwise the collections are named
+    # <collection name>_<partition number>. Changing this value requires re-importing the documents
+    llm_vector_db_partitions: PositiveInt = Field(default=1)
+
+    # Store the original vectors on disk instead of RAM (memory-mapped). Useful with quantization,
+    # because the quantized vectors are used for search and the original ones only for rescoring.
+    # Vector db storage settings (this one, HNSW and quantization) are applied when the collection is created
+    llm_vector_db_on_disk: bool = Field(default=False)
+
+    # HNSW index parameter m (edges per node). Larger value is more accurate but uses more memory. 0 means qdrant default (16)
+    llm_vector_db_hnsw_m: NonNegativeInt = Field(default=0)
+
+    # HNSW index parameter ef_construct. Larger value builds more accurate index slower. 0 means qdrant default (100)
+    llm_vector_db_hnsw_ef_construct: NonNegativeInt = Field(default=0)
+
+    # Vector quantization: none, scalar (int8, 4x less memory) or binary (1 bit per dimension, 32x less memory)
+    llm_vector_db_quantization: Literal["none", "scalar", "binary"] = Field(
+        default="none"
+    )
+
+    # Keep the quantized vectors in RAM (recommended when the original vectors are on disk)
+    llm_vector_db_quantization_always_ram: bool = Field(default=True)
+
+    # Re-rank the candidates found by the quantized vectors with the original vectors
+    llm_vector_search_rescore: bool = Field(default=True)
+
+    # Number of candidates for rescoring relative to top-k (e.g. 2.0 means 2 * top-k candidates)
+    llm_vector_search_oversampling: float = Field(default=2.0, ge=1.0)
+
     # During LLM process, the large document is splitted for vector embedding and query process.
     # This parameter specifies the chunk size of the splitted text
     llm_preprocess_chunk_size: NonNegativeInt = Field(default=128)
@@ -21,9 +55,95 @@ class AppSettings(BaseSettings):
     # Specified the chunk overlap parameter during document splitting
     llm_preprocess_chunk_overlap: NonNegativeInt = Field(default=20)
 
+    # Number of processes used for splitting documents during import. 0 means splitting in the worker process itself.
+    # Parallel splitting produces the same chunks as the serial one. In daemon processes (e.g. celery prefork pool),
+    # which cannot start child processes, threads are used instead
+    llm_preprocess_split_workers: NonNegativeInt = Field(default=0)
+
     # Maximum mumber of relevant documents to be retrieved from vector db
     llm_vector_search_top_k: NonNegativeInt = Field(default=1)
 
+    # Retrieval mode: dense (embedding similarity) or hybrid (embedding similarity and BM25 keyword search fused by
+    # reciprocal rank fusion). Keyword search finds exact terms like article numbers (第十二条 / 第12条), so hybrid mode
+    # usually needs a smaller LLM_VECTOR_SEARCH_TOP_K for the same answer quality (smaller prompts, faster completions).
+    # Keyword (sparse) vectors are written to collections created by this version. Older collections are searched
+    # by dense vectors only until they are rebuilt by the embedding migration (see README)
+    llm_vector_search_mode: Literal["dense", "hybrid"] = Field(default="dense")
+
+    # Number of candidates of each search (dense and keyword) fused in hybrid mode. At least LLM_VECTOR_SEARCH_TOP_K
+    llm_hybrid_search_candidates: PositiveInt = Field(default=20)
+
+    # Number of candidates retrieved before maximal marginal relevance (MMR) selects LLM_VECTOR_SEARCH_TOP_K diverse
+    # chunks, skipping near-duplicates like overlapping neighbour chunks. 0 (or at most LLM_VECTOR_SEARCH_TOP_K)
+    # disables MMR. Candidate vectors are returned by the search, so keep it small (e.g. 20-50)
+    llm_retrieval_candidates: NonNegativeInt = Field(default=0)
+
+    # MMR trade-off between relevance (1) and diversity (0)
+    llm_retrieval_mmr_lambda: float = Field(default=0.5, ge=0, le=1)
+
+    # Cross-encoder model reranking the selected chunks on the local CPU (huggingface model name or path, e.g.
+    # cross-encoder/ms-marco-MiniLM-L-6-v2). Requires `pip install sentence-transformers`. Empty disables reranking
+    llm_retrieval_reranker_model: str = Field(default="")
+
+    # Maximum number of tokens of the context in the prompt. Adjacent retrieved chunks are merged into one passage
+    # without their duplicated overlap, then passages exceeding the budget are dropped (least relevant first,
+    # the most relevant passage is always kept). 0 means no limit
+    llm_retrieval_max_tokens: NonNegativeInt = Field(default=0)
+
+    # Embedding backend: openai (OpenAI embedding api), local (sentence-transformers model on CPU, loaded once
+    # per process. Requires `pip install sentence-transformers`) or hash (deterministic hash embeddings without
+    # network, for tests only). LLM_EMBEDDING_MODEL is a huggingface model name or path for the local backend.
+    # Changing the backend requires the embedding migration (see README)
+    llm_embedding_backend: Literal["openai", "local", "hash"] = Field(default="openai")
+
+    # Embedding model used for documents and queries
+    llm_embedding_model: str = Field(default="text-embedding-ada-002")
+
+    # Number of dimensions of the embeddings. 0 means the native dimensions of the model.
+    # text-embedding-3-small and text-embedding-3-large can return shortened embeddings (e.g. 256 or 512),
+    # which need several times less vector db memory and make search faster.
+    # The vector size of the collection is derived from the model and dimensions. To change them for existing
+    # collections, run the embedding migration (see README) before changing these values
+    llm_embedding_dimensions: NonNegativeInt = Field(default=0)
+
+    # Path of the local SQLite file that caches document embeddings by (model, sha256(text)).
+    # Repeated imports of the same content do not call the embedding api. Empty string disables the on-disk cache
+    llm_embedding_cache_path: str = Field(default=".cache/embeddings.sqlite3")
+
+    # Maximum number of embedding vectors kept in the in-memory (LRU) cache
+    llm_embedding_cache_memory_size: NonNegativeInt = Field(default=10000)
+
+    # During import, chunks are packed into batches and each batch is sent as one embedding request.
+    # This parameter specifies the maximum number of tokens in one batch
+    llm_embedding_batch_max_tokens: PositiveInt = Field(default=50000)
+
+    # Maximum number of chunks in one embedding request. The batch size is reduced automatically when rate limited
+    llm_embedding_batch_max_size: PositiveInt = Field(default=512)
+
+    # Maximum number of embedding requests sent concurrently during import by one worker process.
+    # The import pipeline and the embedding batches share this limit. The total number of requests in flight
+    # is this value multiplied by the number of processes importing at the same time (e.g. celery --concurrency)
+    llm_embedding_max_concurrency: PositiveInt = Field(default=4)
+
+    # Import runs splitting, embedding and writing to vector db as a pipeline.
+    # This parameter specifies the maximum number of batches waiting between the stages (bounds the memory usage)
+    llm_import_queue_depth: PositiveInt = Field(default=8)
+
+    # Maximum number of answers cached by the extract endpoint. 0 disables the answer cache.
+    # The same query for the same file returns the cached answer without calling embedding api and LLM.
+    # Vector db is still searched, so the answer is returned only while the retrieved chunks are the same
+    llm_answer_cache_size: NonNegativeInt = Field(default=1000)
+
+    # Lifetime (seconds) of a cached answer
+    llm_answer_cache_ttl_seconds: NonNegativeInt = Field(default=3600)
+
+    # A cached answer of a similar query is returned if the cosine similarity of the query embeddings is
+    # at least this value and the retrieved chunks are the same. 1.0 means only (almost) identical queries
+    llm_answer_cache_similarity_threshold: float = Field(default=0.95, ge=0.0, le=1.0)
+
+    # Maximum number of chat completions running concurrently for one batch extract request
+    llm_batch_query_max_concurrency: PositiveInt = Field(default=8)
+
     # Service endpoint of object storage. No need to include http://
     storage_service_endpoint: str = Field(default="localhost:9000")
 
@@ -39,6 +159,28 @@ class AppSettings(BaseSettings):
     # type of connection to object storage
     storage_secure_connection: bool = Field(default=False)
 
+    # Maximum number of cached results of file existence checks (both found and not found files).
+    # 0 disables the cache
+    storage_existence_cache_size: NonNegativeInt = Field(default=10000)
+
+    # Lifetime (seconds) of a cached existence check result. Upload and delete in the same process invalidate
+    # the entry immediately, changes made by other processes are visible after this time. 0 disables the cache
+    storage_existence_cache_ttl_seconds: NonNegativeInt = Field(default=60)
+
+    # Maximum number of files of one upload request sent to object storage concurrently
+    storage_upload_max_concurrency: PositiveInt = Field(default=8)
+
+    # Size of the parts of multipart upload to object storage used by the streaming and presigned upload endpoints
+    # (at least 5MB). Memory usage of one streaming upload is about three parts
+    storage_upload_part_size_mb: int = Field(default=16, ge=5)
+
+    # Lifetime (seconds) of the presigned part urls returned by the presigned upload endpoint
+    storage_presigned_upload_expiration_seconds: PositiveInt = Field(default=3600)
+
+    # The content (sha256) of the files stored by upload endpoints is stored once. Every upload keeps its own
+    # stored file (a metadata-only reference to the content) and the content is deleted with its last stored file
+    storage_deduplicate_uploads: bool = Field(default=True)
+
     # Celery is used to process long running ocr task.
     # This parameter is for celery broker url (message communication)
     celery_broker_url: str = Field(default="redis://localhost:6379/0")
@@ -5,6 +5,8 @@ from fastapi.responses import JSONResponse
 from api.common.error import (
     ObjectStorageError,
     UnsupportedFileTypeError,
+    InvalidMultipartRequestError,
+    IncompleteUploadError,
     ObjectStorageFileNotFoundError,
     LlmError,
     APIError,
@@ -39,6 +41,32 @@ async def unsupported_file_type_error_handler(
     )
 
 
+@app.exception_handler(InvalidMultipartRequestError)
+async def invalid_multipart_request_error_handler(
+    request: Request, exc: InvalidMultipartRequestError
+):
+
+    return JSONResponse(
+        status_code=400,
+        content=dict(
+            error_code=exc.__class__.__name__,
+            detail=get_traceback_str(exc, debug=app_config.debug),
+        ),
+    )
+
+
+@app.exception_handler(IncompleteUploadError)
+async def incomplete_upload_error_handler(request: Request, exc: IncompleteUploadError):
+
+    return JSONResponse(
+        status_code=400,
+        content=dict(
+            error_code=exc.__class__.__name__,
+            detail=get_traceback_str(exc, debug=app_config.debug),
+        ),
+    )
+
+
 @app.exception_handler(ObjectStorageFileNotFoundError)
 async def file_not_found_error_handler(
     request: Request, exc: ObjectStorageFileNotFoundError
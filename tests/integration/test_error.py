@@ -45,13 +45,13 @@ def signed_url():
 
 def test_upload_with_object_storage_error(mocker):
     """
-    Test upload endpoint when the called MinioStorage.upload() function is patched to raise ObjectStorageError.
+    Test upload endpoint when the called MinioStorage.aupload() function is patched to raise ObjectStorageError.
     The returned response from API should be correct json with HTTP status 500
     """
 
     # patch function called in query() to trigger error handling code
     mocker.patch(
-        "api.service.storage.minio_storage.MinioStorage.upload",
+        "api.service.storage.minio_storage.MinioStorage.aupload",
         side_effect=ObjectStorageError("some error"),
     )
 
@@ -73,14 +73,14 @@ def test_upload_with_object_storage_error(mocker):
 
 def test_upload_with_unexpected_error(mocker):
     """
-    Test upload endpoint when the called MinioStorage.upload() function is patched.
+    Test upload endpoint when the called MinioStorage.aupload() function is patched.
     So, API should handle an error we don't specifically handle.
     The returned error code should be APIerror with HTTP status 500.
     """
 
     # patch function called in query() to trigger error handling code
     mocker.patch(
-        "api.service.storage.minio_storage.MinioStorage.upload",
+        "api.service.storage.minio_storage.MinioStorage.aupload",
         side_effect=ValueError("value error"),
     )
 
@@ -100,6 +100,48 @@ def test_upload_with_unexpected_error(mocker):
     assert output["detail"] == "Unknown error"
 
 
+def test_upload_with_partial_object_storage_error(mocker):
+    """
+    Test upload endpoint when MinioStorage.aupload() is patched to fail for one of the files.
+    The other files should be uploaded and the failed file should be reported in its result with HTTP status 200
+    """
+
+    async def aupload(filename, file_data, file_length_in_bytes=-1):
+        if filename == "tektome.png":
+            raise ObjectStorageError("some error")
+
+        return f"http://storage/{filename}"
+
+    mocker.patch(
+        "api.service.storage.minio_storage.MinioStorage.aupload",
+        side_effect=aupload,
+    )
+
+    client = TestClient(app)
+
+    files = [
+        ("files", open(os.path.join("test_files", "tektome.jpg"), "rb")),
+        ("files", open(os.path.join("test_files", "tektome.png"), "rb")),
+        ("files", open(os.path.join("test_files", "tektome.tif"), "rb")),
+    ]
+    response = client.post(url="/v1/upload", files=files)
+
+    assert response.status_code == status.HTTP_200_OK
+
+    results = response.json()["upload_results"]
+    assert [result["filename"] for result in results] == [
+        "tektome.jpg",
+        "tektome.png",
+        "tektome.tif",
+    ]
+    assert results[0]["signed_url"] == "http://storage/tektome.jpg"
+    assert results[0]["error_code"] is None
+    assert results[1]["signed_url"] is None
+    assert results[1]["error_code"] == "ObjectStorageError"
+    assert results[1]["detail"] == "some error"
+    assert results[2]["signed_url"] == "http://storage/tektome.tif"
+
+
 def test_mock_ocr_with_unexpected_error(mocker):
     """
     Test OCR endpoint when the called import_doc_to_vector_store.delay function is patched.
@@ -241,9 +283,9 @@ def test_extract_with_llm_error(mocker, signed_url):
         LlmVectorStoreError,
     ]
 
-    # patch function called in Gpt35LLMService.query() to trigger error handling code
+    # patch function called in Gpt35LLMService.aquery() to trigger error handling code
     mocker.patch(
-        "api.service.llm.gpt35.Gpt35LLMService._get_retriever", side_effect=side_effects
+        "api.service.llm.gpt35.Gpt35LLMService._aretrieve", side_effect=side_effects
     )
 
     for error in exepected_error_codes:
@@ -1,3 +1,4 @@
+import json
 import os
 
 from fastapi.testclient import TestClient
@@ -5,7 +6,11 @@ from fastapi import status
 from main import app
 from api.service.llm import load_ocr_json_result
 from api.routers.tektome import llm_service, object_storage_service
-from api.schemas.extract import ExtractResponse
+from api.schemas.extract import (
+    ExtractBatchResponse,
+    ExtractResponse,
+    ExtractStreamMetadata,
+)
 
 
 def test_extract_endpoint_with_invalid_file():
@@ -77,3 +82,100 @@ def test_extract_endpoint_with_valid_file():
     # TODO: find better way to check the relevancy of the output because output is non-deterministic
     # assert "December" in extract_response.response
     # assert "1950" in extract_response.response
+
+
+def test_extract_stream_endpoint_with_invalid_file():
+    """
+    Testing streaming endpoint with the non-existing file.
+    We should get 400 bad request error before the stream starts
+    """
+    client = TestClient(app)
+    response = client.post(
+        "/v1/extract/stream", json={"query": "hello", "signed_url": "file_not_found"}
+    )
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json()["error_code"] == "ObjectStorageFileNotFoundError"
+
+
+def test_extract_stream_endpoint_with_valid_file():
+    """
+    Test the streaming extract endpoint with the existing file.
+    The first event should be metadata, followed by token events and the done event
+    """
+    with open(
+        os.path.join("test_files", "sample", "東京都建築安全条例.pdf"), "rb"
+    ) as fp:
+        signed_url = object_storage_service.upload(
+            "東京都建築安全条例.pdf", file_data=fp, append_uuid_to_filename=False
+        )
+
+    docs = load_ocr_json_result(
+        os.path.join("test_files", "ocr", "東京都建築安全条例.json"),
+        source_name="東京都建築安全条例.pdf",
+    )
+
+    llm_service.import_docs_to_vector_store(docs)
+
+    query = "When Tokyo Building Safety Regulation is made"
+
+    client = TestClient(app)
+    response = client.post(
+        "/v1/extract/stream", json={"query": query, "signed_url": signed_url}
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    events = []
+    for message in response.text.strip().split("\n\n"):
+        event_line, data_line = message.split("\n")
+        events.append(
+            (event_line.removeprefix("event: "), json.loads(data_line[len("data: ") :]))
+        )
+
+    assert events[0][0] == "metadata"
+    assert ExtractStreamMetadata(**events[0][1]).filename == "東京都建築安全条例.pdf"
+    assert events[-1][0] == "done"
+
+    tokens = [data["token"] for event, data in events[1:-1]]
+    assert all(event == "token" for event, _ in events[1:-1])
+    assert len("".join(tokens)) > 0
+
+
+def test_extract_batch_endpoint_with_valid_file():
+    """
+    Test the batch extract endpoint with the existing file.
+    The results should be in the same order as the queries and each result should contain response
+    """
+    with open(
+        os.path.join("test_files", "sample", "東京都建築安全条例.pdf"), "rb"
+    ) as fp:
+        signed_url = object_storage_service.upload(
+            "東京都建築安全条例.pdf", file_data=fp, append_uuid_to_filename=False
+        )
+
+    docs = load_ocr_json_result(
+        os.path.join("test_files", "ocr", "東京都建築安全条例.json"),
+        source_name="東京都建築安全条例.pdf",
+    )
+
+    llm_service.import_docs_to_vector_store(docs)
+
+    queries = [
+        "When Tokyo Building Safety Regulation is made",
+        "What is the purpose of Tokyo Building Safety Regulation",
+    ]
+
+    client = TestClient(app)
+    response = client.post(
+        "/v1/extract/batch", json={"queries": queries, "signed_url": signed_url}
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    batch_response = ExtractBatchResponse(**response.json())
+
+    assert batch_response.filename == "東京都建築安全条例.pdf"
+    assert [result.query for result in batch_response.results] == queries
+    assert all(result.error_code is None for result in batch_response.results)
+    assert all(len(result.response) > 0 for result in batch_response.results)
@@ -1,7 +1,13 @@
+import asyncio
 import os
 
+import pytest
+from langchain_core.documents import Document
+from qdrant_client.http.models import FilterSelector
+
 from api.service.llm.gpt35 import Gpt35LLMService
 from api.service.llm import load_ocr_json_result
+from api.common.error import LlmVectorStoreError
 from config import app_config
 
 
@@ -35,8 +41,8 @@ def test_import_docs():
 
 def test_import_multiple_docs():
     """
-    Test import multiple documents to qdrant vector database (in-memory mode).
-    Then, we check whether the metadata contains original filename and they are nothing changed after we import each file
+    Test import the same document content twice with different sources to qdrant vector database (in-memory mode).
+    The second import should not add new vectors. Instead, the new source should be attached to the existing ones
     """
 
     llm = Gpt35LLMService(
@@ -58,9 +64,7 @@ def test_import_multiple_docs():
     total_docs = llm.qdrant_client.count("tektome").count
     docs, _ = llm.qdrant_client.scroll("tektome", limit=total_docs)
 
-    documents1_ids_list = []
     for d in docs:
-        documents1_ids_list.append(d.id)
         assert d.payload["metadata"]["source"] == "file1"
 
     docs = load_ocr_json_result(
@@ -70,15 +74,49 @@ def test_import_multiple_docs():
 
     llm.import_docs_to_vector_store(docs)
 
-    total_docs = llm.qdrant_client.count("tektome").count
-    docs, _ = llm.qdrant_client.scroll("tektome", limit=total_docs)
+    # no duplicated vectors should be stored
+    assert llm.qdrant_client.count("tektome").count == total_docs
 
+    docs, _ = llm.qdrant_client.scroll("tektome", limit=total_docs)
     for d in docs:
-        if d.id in documents1_ids_list:
-            assert d.payload["metadata"]["source"] == "file1"
-            continue
+        assert d.payload["metadata"]["source"] == ["file1", "file2"]
+
+    # both sources can be retrieved
+    assert len(llm._retrieve("Tokyo", "file1")[1]) > 0
+    assert len(llm._retrieve("Tokyo", "file2")[1]) > 0
+
+
+def test_reimport_incomplete_docs():
+    """
+    Test that the content whose import failed halfway (some chunks are missing) is imported again
+    instead of being treated as the already imported content
+    """
+    llm = Gpt35LLMService(
+        openai_api_key=app_config.openai_api_key,
+        vector_db_url=":memory:",
+        vector_db_collection_name="tektome",
+        text_split_chunk_size=128,
+        text_split_chunk_overlap=20,
+        vector_search_top_k=5,
+    )
+
+    docs = load_ocr_json_result(
+        os.path.join("test_files", "ocr", "東京都建築安全条例.json"),
+        source_name="file1",
+    )
+
+    llm.import_docs_to_vector_store(docs)
+
+    total_docs = llm.qdrant_client.count("tektome").count
+    points, _ = llm.qdrant_client.scroll("tektome", limit=total_docs)
+    for point in points:
+        assert point.payload["metadata"]["chunk_count"] > 0
 
-        assert d.payload["metadata"]["source"] == "file2"
+    llm.qdrant_client.delete("tektome", points_selector=[points[0].id])
+
+    llm.import_docs_to_vector_store(docs)
+
+    assert llm.qdrant_client.count("tektome").count == total_docs
 
 
 def test_query():
@@ -118,3 +156,339 @@ def test_query():
     keywords = ["December", "1950", "Showa 25", "7"]
     found_relevant_keyword = any([True if k in result else False for k in keywords])
     assert found_relevant_keyword == False
+
+
+def test_aquery():
+    """
+    Function to test async query with the tokyo building safety content.
+    The LLM should return the same kind of response as the sync query
+    """
+    llm = Gpt35LLMService(
+        openai_api_key=app_config.openai_api_key,
+        vector_db_url=":memory:",
+        vector_db_collection_name="tektome",
+        text_split_chunk_size=128,
+        text_split_chunk_overlap=20,
+        vector_search_top_k=5,
+    )
+
+    docs = load_ocr_json_result(
+        os.path.join("test_files", "ocr", "東京都建築安全条例.json"),
+        source_name="file1",
+    )
+
+    llm.import_docs_to_vector_store(docs)
+
+    query = "When Tokyo Building Safety Regulation is made"
+    result = asyncio.run(llm.aquery(query, "file1"))
+
+    assert isinstance(result, str)
+    keywords = ["December", "1950", "Showa 25", "7"]
+    found_relevant_keyword = any([True if k in result else False for k in keywords])
+    assert found_relevant_keyword == True
+
+
+def test_query_answer_cache(mocker):
+    """
+    Function to test the answer cache of query.
+    The repeated query should not call LLM and re-importing the file should invalidate the cached answers.
+    The cached answer should not be used when the retrieved chunks changed in another process
+    """
+    llm = Gpt35LLMService(
+        openai_api_key=app_config.openai_api_key,
+        vector_db_url=":memory:",
+        vector_db_collection_name="tektome",
+        text_split_chunk_size=128,
+        text_split_chunk_overlap=20,
+        vector_search_top_k=5,
+    )
+
+    docs = load_ocr_json_result(
+        os.path.join("test_files", "ocr", "東京都建築安全条例.json"),
+        source_name="file1",
+    )
+
+    llm.import_docs_to_vector_store(docs)
+
+    query = "When Tokyo Building Safety Regulation is made"
+    result = llm.query(query, "file1")
+
+    answer_chain = mocker.patch.object(llm, "answer_chain")
+    retrieve = mocker.spy(llm, "_retrieve")
+
+    assert llm.query(query, "file1") == result
+    assert llm.query(f"  {query} ", "file1") == result
+    assert retrieve.call_count == 0
+    assert answer_chain.invoke.call_count == 0
+
+    # the file is deleted by another process, which cannot invalidate the answer cache of this process
+    llm.qdrant_client.delete(
+        "tektome",
+        points_selector=FilterSelector(
+            filter=llm._get_metadata_filter("source", "file1")
+        ),
+    )
+    llm.query(query, "file1")
+    assert answer_chain.invoke.call_count == 1
+
+    llm.import_docs_to_vector_store(docs)
+    assert len(llm.answer_cache) == 0
+
+
+def test_import_docs_to_partitions():
+    """
+    Test import of the same content with different sources to partitioned collections (in-memory mode).
+    Each source should be retrievable from its own partition and the partitions of other sources should be empty
+    """
+    llm = Gpt35LLMService(
+        openai_api_key=app_config.openai_api_key,
+        vector_db_url=":memory:",
+        vector_db_collection_name="tektome",
+        text_split_chunk_size=128,
+        text_split_chunk_overlap=20,
+        vector_search_top_k=5,
+        vector_db_partitions=4,
+    )
+
+    sources = ["file1", "file2"]
+    for source in sources:
+        docs = load_ocr_json_result(
+            os.path.join("test_files", "ocr", "東京都建築安全条例.json"),
+            source_name=source,
+        )
+        llm.import_docs_to_vector_store(docs)
+
+    partitions = {llm._get_collection_name(source) for source in sources}
+    for collection_name in llm.collection_names:
+        count = llm.qdrant_client.count(collection_name).count
+        assert (count > 0) == (collection_name in partitions)
+
+    for source in sources:
+        assert len(llm._retrieve("Tokyo", source)[1]) > 0
+
+
+def test_migrate_embeddings():
+    """
+    Test migration of the stored chunks to reduced-dimension embeddings (in-memory mode).
+    The alias should point to the new collection with the same chunks and the old model should not be usable with it
+    """
+    llm = Gpt35LLMService(
+        openai_api_key=app_config.openai_api_key,
+        vector_db_url=":memory:",
+        vector_db_collection_name="tektome",
+        text_split_chunk_size=128,
+        text_split_chunk_overlap=20,
+        vector_search_top_k=5,
+    )
+
+    docs = load_ocr_json_result(
+        os.path.join("test_files", "ocr", "東京都建築安全条例.json"),
+        source_name="file1",
+    )
+    llm.import_docs_to_vector_store(docs)
+    total_docs = llm.qdrant_client.count("tektome").count
+
+    [collection_name] = llm.migrate_embeddings("text-embedding-3-small", 256)
+
+    assert llm._get_collection_aliases()["tektome"] == collection_name
+    assert llm.qdrant_client.count(collection_name).count == total_docs
+    collection = llm.qdrant_client.get_collection(collection_name)
+    assert collection.config.params.vectors.size == 256
+
+    # the old embedding model cannot be used with the migrated collection
+    with pytest.raises(LlmVectorStoreError):
+        llm._get_or_create_collection("tektome")
+
+
+def test_import_after_migration():
+    """
+    Test import after another process migrated the collections (hash embedding backend, in-memory mode).
+    The documents should be written to the new collection of the same embeddings,
+    and the import should fail instead of writing to the old collection after a migration to other embeddings
+    """
+    llm = Gpt35LLMService(
+        openai_api_key=app_config.openai_api_key,
+        vector_db_url=":memory:",
+        vector_db_collection_name="tektome",
+        text_split_chunk_size=64,
+        text_split_chunk_overlap=0,
+        vector_search_top_k=1,
+        embedding_backend="hash",
+        embedding_model="hash",
+    )
+    old_collection_name = llm.collection_names[0]
+    llm.import_docs_to_vector_store(
+        [Document(page_content="第十一条 建築物の敷地", metadata={"source": "file1"})]
+    )
+
+    # the migration of another process does not change the collections of this service
+    [collection_name] = llm.migrate_embeddings("hash")
+    assert llm.collection_names == [old_collection_name]
+
+    llm.import_docs_to_vector_store(
+        [Document(page_content="第十二条 特殊建築物", metadata={"source": "file2"})]
+    )
+    assert llm.collection_names == [collection_name]
+    assert len(llm._retrieve("特殊建築物", "file2")[1]) == 1
+    assert llm.qdrant_client.count(collection_name).count == 2
+    assert llm.qdrant_client.count(old_collection_name).count == 1
+
+    llm.migrate_embeddings("hash", 128)
+    with pytest.raises(LlmVectorStoreError):
+        llm.import_docs_to_vector_store(
+            [
+                Document(
+                    page_content="第十三条 建築物の高さ", metadata={"source": "file3"}
+                )
+            ]
+        )
+    assert llm.qdrant_client.count(collection_name).count == 2
+
+
+def test_switch_aliases_of_legacy_collection():
+    """
+    Test alias switch of a collection created by older versions (named like the alias).
+    The legacy collection should be kept and the alias should be resolved to the new collection
+    """
+    llm = Gpt35LLMService(
+        openai_api_key=app_config.openai_api_key,
+        vector_db_url=":memory:",
+        vector_db_collection_name="tektome",
+        text_split_chunk_size=128,
+        text_split_chunk_overlap=20,
+        vector_search_top_k=5,
+        embedding_backend="hash",
+        embedding_model="hash",
+    )
+
+    llm._create_collection("legacy", llm.vector_dimensions)
+    assert llm._get_or_create_collection("legacy") == "legacy"
+
+    llm._switch_collection_aliases({"legacy": llm.collection_names[0]})
+
+    assert llm.qdrant_client.collection_exists("legacy")
+    assert llm._get_or_create_collection("legacy") == llm.collection_names[0]
+
+
+def test_import_docs_with_hash_embeddings():
+    """
+    Test import and retrieval with the deterministic hash embedding backend (in-memory mode).
+    The embedding api should not be needed and the retrieved chunks should be from the imported file
+    """
+    llm = Gpt35LLMService(
+        openai_api_key=app_config.openai_api_key,
+        vector_db_url=":memory:",
+        vector_db_collection_name="tektome",
+        text_split_chunk_size=128,
+        text_split_chunk_overlap=20,
+        vector_search_top_k=5,
+        embedding_backend="hash",
+        embedding_model="hash",
+    )
+
+    docs = load_ocr_json_result(
+        os.path.join("test_files", "ocr", "東京都建築安全条例.json"),
+        source_name="file1",
+    )
+    llm.import_docs_to_vector_store(docs)
+
+    assert llm.qdrant_client.count("tektome").count > 1
+
+    _, retrieved_docs = llm._retrieve("東京都建築安全条例", "file1")
+    assert len(retrieved_docs) == 5
+    assert all(doc.metadata["source"] == "file1" for doc in retrieved_docs)
+
+
+def test_hybrid_search_article_number():
+    """
+    Test hybrid (dense and keyword) retrieval with the hash embedding backend (in-memory mode).
+    The chunk of the queried article should be retrieved with top-k 1, also when the number is written in arabic
+    """
+    llm = Gpt35LLMService(
+        openai_api_key=app_config.openai_api_key,
+        vector_db_url=":memory:",
+        vector_db_collection_name="tektome",
+        text_split_chunk_size=64,
+        text_split_chunk_overlap=0,
+        vector_search_top_k=1,
+        embedding_backend="hash",
+        embedding_model="hash",
+        vector_search_mode="hybrid",
+    )
+
+    articles = [
+        "第十一条 建築物の敷地は、幅員六メートル以上の道路に接しなければならない。",
+        "第十二条 特殊建築物の主要構造部は、耐火構造としなければならない。",
+        "第十三条 建築物の高さは、隣地境界線からの距離に応じて制限される。",
+        "第十四条 共同住宅の廊下の幅は、一・二メートル以上としなければならない。",
+    ]
+    docs = [Document(page_content="\n\n".join(articles), metadata={"source": "file1"})]
+    llm.import_docs_to_vector_store(docs)
+
+    _, retrieved_docs = llm._retrieve("第12条の規定について", "file1")
+    assert len(retrieved_docs) == 1
+    assert "第十二条" in retrieved_docs[0].page_content
+
+
+def test_hybrid_search_with_mmr():
+    """
+    Test hybrid retrieval with MMR over the over-fetched candidates (hash embedding backend, in-memory mode).
+    MMR should select by the fused rank, so the chunk of the queried article is kept
+    """
+    llm = Gpt35LLMService(
+        openai_api_key=app_config.openai_api_key,
+        vector_db_url=":memory:",
+        vector_db_collection_name="tektome",
+        text_split_chunk_size=64,
+        text_split_chunk_overlap=0,
+        vector_search_top_k=1,
+        embedding_backend="hash",
+        embedding_model="hash",
+        vector_search_mode="hybrid",
+        retrieval_candidates=4,
+    )
+
+    articles = [
+        "第十一条 建築物の敷地は、幅員六メートル以上の道路に接しなければならない。",
+        "第十二条 特殊建築物の主要構造部は、耐火構造としなければならない。",
+        "第十三条 建築物の高さは、隣地境界線からの距離に応じて制限される。",
+        "第十四条 共同住宅の廊下の幅は、一・二メートル以上としなければならない。",
+    ]
+    docs = [Document(page_content="\n\n".join(articles), metadata={"source": "file1"})]
+    llm.import_docs_to_vector_store(docs)
+
+    _, retrieved_docs = llm._retrieve("第12条の規定について", "file1")
+    assert len(retrieved_docs) == 1
+    assert "第十二条" in retrieved_docs[0].page_content
+
+
+def test_retrieve_with_mmr():
+    """
+    Test retrieval with MMR over the over-fetched candidates (hash embedding backend, in-memory mode).
+    The near-duplicate chunk of the most relevant chunk should be skipped for a different article
+    """
+    llm = Gpt35LLMService(
+        openai_api_key=app_config.openai_api_key,
+        vector_db_url=":memory:",
+        vector_db_collection_name="tektome",
+        text_split_chunk_size=64,
+        text_split_chunk_overlap=0,
+        vector_search_top_k=2,
+        embedding_backend="hash",
+        embedding_model="hash",
+        retrieval_candidates=4,
+    )
+
+    articles = [
+        "第十一条 建築物の敷地は、幅員六メートル以上の道路に接しなければならない。",
+        "第十一条 建築物の敷地は、幅員六メートル以上の道路に接しなければならない。ただし書",
+        "第十二条 特殊建築物の主要構造部は、耐火構造としなければならない。",
+        "第十三条 建築物の高さは、隣地境界線からの距離に応じて制限される。",
+    ]
+    docs = [Document(page_content="\n\n".join(articles), metadata={"source": "file1"})]
+    llm.import_docs_to_vector_store(docs)
+
+    _, retrieved_docs = llm._retrieve("建築物の敷地の道路", "file1")
+    assert len(retrieved_docs) == 2
+    assert "第十一条" in retrieved_docs[0].page_content
+    assert "第十一条" not in retrieved_docs[1].page_content
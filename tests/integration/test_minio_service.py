@@ -1,7 +1,16 @@
+import asyncio
+import hashlib
+import io
 import os
 from urllib.parse import urlparse
 
+import pytest
+
 from config import app_config
+from minio.error import S3Error
+
+from api.common.error import ObjectStorageError, ObjectStorageFileNotFoundError
+from api.service.storage import get_original_filename
 from api.service.storage.minio_storage import MinioStorage
 
 sample_files_md5 = {
@@ -22,6 +31,15 @@ object_storage = MinioStorage(
 )
 
 
+def get_stored_md5(stored_filename):
+    """
+    Helper to get md5 of the content of the stored file. The stored file of duplicate upload is
+    a metadata-only reference, so the content is read through the object storage service
+    """
+    data = asyncio.run(object_storage.aread_range(stored_filename, 0, 2**40))
+    return hashlib.md5(data).hexdigest()
+
+
 def test_upload_file():
     """
     Test case for uploading sample file.
@@ -39,10 +57,7 @@ def test_upload_file():
         url = urlparse(signed_url)
         stored_filename = os.path.basename(url.path)
 
-        data = object_storage.client.stat_object(
-            app_config.storage_bucket_name, stored_filename
-        )
-        assert sample_files_md5["tektome.jpg"] == data.etag
+        assert sample_files_md5["tektome.jpg"] == get_stored_md5(stored_filename)
 
 
 def test_contains_existing_file():
@@ -91,3 +106,248 @@ def test_delete_non_existence_file():
     """
     object_storage.delete("random_filename.pdf")
     assert object_storage.contains_file("random_filename.pdf") == False
+
+
+def test_async_upload_contains_and_delete_file():
+    """
+    Test case for async upload, contains_file and delete functions.
+    The md5 of local and uploaded file should be identical and the file should not exist after deletion
+    """
+
+    async def run():
+        path = os.path.join("test_files", "tektome.jpg")
+        with open(path, "rb") as fp:
+            signed_url = await object_storage.aupload(
+                "test_async_upload_file.jpg", fp, os.path.getsize(path)
+            )
+
+        stored_filename = os.path.basename(urlparse(signed_url).path)
+        data = await object_storage.aread_range(stored_filename, 0, 2**40)
+        assert sample_files_md5["tektome.jpg"] == hashlib.md5(data).hexdigest()
+
+        assert await object_storage.acontains_file(stored_filename) == True
+        assert await object_storage.adelete(stored_filename) == True
+        assert await object_storage.acontains_file(stored_filename) == False
+        assert await object_storage.adelete(stored_filename) == False
+
+    asyncio.run(run())
+
+
+def test_contains_file_cache_invalidated_by_upload():
+    """
+    Test case for the cached result of contains_file.
+    The cached "not found" result should be invalidated when the file is uploaded
+    """
+    try:
+        object_storage.client.remove_object(
+            app_config.storage_bucket_name, "test_cached_file.jpg"
+        )
+    except:
+        pass
+
+    assert object_storage.contains_file("test_cached_file.jpg") == False
+
+    with open(os.path.join("test_files", "tektome.jpg"), "rb") as fp:
+        object_storage.upload(
+            "test_cached_file.jpg", file_data=fp, append_uuid_to_filename=False
+        )
+
+    assert object_storage.contains_file("test_cached_file.jpg") == True
+
+    object_storage.delete("test_cached_file.jpg")
+    assert object_storage.contains_file("test_cached_file.jpg") == False
+
+
+def test_async_upload_stream_multipart():
+    """
+    Test case for streaming upload of a file larger than the part size (multipart upload).
+    The content of the uploaded file (copied from the temporary object) should be identical to the streamed data
+    """
+    part_size = MinioStorage.MIN_PART_SIZE
+    data = os.urandom(part_size * 2 + 1000)
+
+    async def chunks():
+        for start in range(0, len(data), 65536):
+            yield data[start : start + 65536]
+
+    async def run():
+        signed_url = await object_storage.aupload_stream(
+            "test_stream_upload_file.tif", chunks(), part_size
+        )
+
+        stored_filename = os.path.basename(urlparse(signed_url).path)
+        assert await object_storage.aread_range(stored_filename, 0, 2**40) == data
+        assert await object_storage.adelete(stored_filename) == True
+
+    asyncio.run(run())
+
+
+def test_async_upload_stream_with_too_small_part_size():
+    """
+    Test case for streaming upload with the part size below the minimum part size of multipart upload.
+    ObjectStorageError should be raised instead of uploading the file
+    """
+
+    async def chunks():
+        yield b"data"
+
+    with pytest.raises(ObjectStorageError):
+        asyncio.run(
+            object_storage.aupload_stream(
+                "test_small_part_size.tif", chunks(), MinioStorage.MIN_PART_SIZE - 1
+            )
+        )
+
+
+def test_upload_duplicate_file():
+    """
+    Test case for deduplicated upload.
+    Every upload of the same content should get its own stored file, which is a metadata-only reference to the content
+    stored once. The content should be kept until the last stored file of the content is deleted
+    """
+    data = b"\x89PNG\r\n\x1a\n" + os.urandom(1024)
+    sha256 = hashlib.sha256(data).hexdigest()
+
+    async def chunks():
+        yield data
+
+    signed_urls = [
+        object_storage.upload("test_duplicate_1.png", file_data=io.BytesIO(data)),
+        object_storage.upload("test_duplicate_2.png", file_data=io.BytesIO(data)),
+        asyncio.run(object_storage.aupload_stream("test_duplicate_3.png", chunks())),
+    ]
+    stored_filenames = [os.path.basename(urlparse(url).path) for url in signed_urls]
+    assert len(set(stored_filenames)) == 3
+
+    content = object_storage.client.stat_object(
+        app_config.storage_bucket_name, MinioStorage.CONTENT_PREFIX + sha256
+    )
+    assert content.size == len(data)
+
+    for number, stored_filename in enumerate(stored_filenames, start=1):
+        stat = object_storage.client.stat_object(
+            app_config.storage_bucket_name, stored_filename
+        )
+        assert stat.size == 0
+        assert stat.metadata["x-amz-meta-content-length"] == str(len(data))
+        assert get_original_filename(stored_filename) == f"test_duplicate_{number}.png"
+        assert get_stored_md5(stored_filename) == hashlib.md5(data).hexdigest()
+
+    # the content is kept for the other uploads
+    assert object_storage.delete(stored_filenames[0]) == True
+    assert object_storage.contains_file(stored_filenames[0]) == False
+    assert get_stored_md5(stored_filenames[1]) == hashlib.md5(data).hexdigest()
+
+    # the content is deleted with the last stored file
+    assert asyncio.run(object_storage.adelete(stored_filenames[1])) == True
+    assert get_stored_md5(stored_filenames[2]) == hashlib.md5(data).hexdigest()
+    assert object_storage.delete(stored_filenames[2]) == True
+
+    with pytest.raises(S3Error):
+        object_storage.client.stat_object(
+            app_config.storage_bucket_name, MinioStorage.CONTENT_PREFIX + sha256
+        )
+
+    for prefix in [
+        f"{MinioStorage.REFERENCE_PREFIX}{sha256}/",
+        MinioStorage.TEMPORARY_PREFIX,
+    ]:
+        assert (
+            list(
+                object_storage.client.list_objects(
+                    app_config.storage_bucket_name, prefix=prefix
+                )
+            )
+            == []
+        )
+
+
+def test_upload_duplicate_file_concurrently():
+    """
+    Test case for concurrent deduplicated uploads of the same content.
+    Both stored files should be references to the content stored once
+    """
+    data = b"%PDF-1.7\n" + os.urandom(1024)
+
+    async def run():
+        return await asyncio.gather(
+            *[
+                object_storage.aupload(
+                    f"test_concurrent_{number}.pdf", io.BytesIO(data), len(data)
+                )
+                for number in range(2)
+            ]
+        )
+
+    stored_filenames = [
+        os.path.basename(urlparse(url).path) for url in asyncio.run(run())
+    ]
+    for stored_filename in stored_filenames:
+        assert get_stored_md5(stored_filename) == hashlib.md5(data).hexdigest()
+
+    content = object_storage.client.stat_object(
+        app_config.storage_bucket_name,
+        MinioStorage.CONTENT_PREFIX + hashlib.sha256(data).hexdigest(),
+    )
+    assert content.size == len(data)
+
+
+def test_delete_and_upload_duplicate_file_concurrently():
+    """
+    Test case for deleting the last stored file of the content while the same content is uploaded.
+    The new stored file should always be readable
+    """
+    data = b"%PDF-1.7\n" + os.urandom(1024)
+
+    async def run():
+        signed_url = await object_storage.aupload(
+            "test_delete_upload.pdf", io.BytesIO(data), len(data)
+        )
+        for _ in range(10):
+            _, signed_url = await asyncio.gather(
+                object_storage.adelete(os.path.basename(urlparse(signed_url).path)),
+                object_storage.aupload(
+                    "test_delete_upload.pdf", io.BytesIO(data), len(data)
+                ),
+            )
+            stored_filename = os.path.basename(urlparse(signed_url).path)
+            assert await object_storage.aread_range(stored_filename, 0, 2**40) == data
+
+    asyncio.run(run())
+
+
+def test_index_objects_are_not_stored_files():
+    """
+    Test case for the objects of the content index.
+    They should not be found, deleted or read as stored files, and they cannot be uploaded
+    """
+    data = b"%PDF-1.7\n" + os.urandom(1024)
+    object_storage.upload("test_index.pdf", file_data=io.BytesIO(data))
+    index_object = MinioStorage.CONTENT_PREFIX + hashlib.sha256(data).hexdigest()
+
+    assert object_storage.contains_file(index_object) == False
+    assert object_storage.delete(index_object) == False
+    with pytest.raises(ObjectStorageFileNotFoundError):
+        asyncio.run(object_storage.aread_range(index_object, 0, 1024))
+
+    with pytest.raises(ObjectStorageError):
+        object_storage.upload(
+            index_object, io.BytesIO(data), append_uuid_to_filename=False
+        )
+
+
+def test_read_range_of_empty_file():
+    """
+    Test case for reading the first bytes of an empty file.
+    Empty bytes should be returned instead of error (the range of empty file is not satisfiable)
+    """
+
+    async def run():
+        signed_url = await object_storage.aupload(
+            "test_empty_file.pdf", io.BytesIO(b""), 0
+        )
+        stored_filename = os.path.basename(urlparse(signed_url).path)
+
+        assert await object_storage.aread_range(stored_filename, 0, 1024) == b""
+
+    asyncio.run(run())
@@ -1,10 +1,20 @@
+import asyncio
+import hashlib
 import os
 import requests
 
 from fastapi.testclient import TestClient
 from fastapi import status
 from main import app
-from api.schemas.upload import UploadListResponse
+from api.routers.tektome import object_storage_service
+from api.common.utils import get_filename_from_signed_url
+from api.service.storage import get_original_filename
+from config import app_config
+from api.schemas.upload import (
+    UploadListResponse,
+    UploadResponse,
+    PresignedUploadResponse,
+)
 
 client = TestClient(app)
 
@@ -17,8 +27,14 @@ sample_files_md5 = {
 }
 
 
-def clean_quote_from_etag(etag):
-    return etag[1:-1]
+def get_stored_md5(signed_url):
+    """
+    Helper to get md5 of the content of the uploaded file. The stored file of duplicate upload is
+    a metadata-only reference, so the content is read through the object storage service
+    """
+    stored_filename = get_filename_from_signed_url(signed_url)
+    data = asyncio.run(object_storage_service.aread_range(stored_filename, 0, 2**40))
+    return hashlib.md5(data).hexdigest()
 
 
 def test_upload_one_pdf_file():
@@ -46,11 +62,7 @@ def test_upload_one_pdf_file():
     url = upload_list_data.upload_results[0].signed_url
 
     # check md5 of the uploaded file
-    result = requests.head(url)
-    md5 = result.headers["ETAG"]
-
-    # clean quote character from etag
-    assert sample_files_md5["建築基準法施行令.pdf"] == clean_quote_from_etag(md5)
+    assert sample_files_md5["建築基準法施行令.pdf"] == get_stored_md5(url)
 
 
 def test_upload_jpeg_file():
@@ -72,11 +84,7 @@ def test_upload_jpeg_file():
     url = upload_list_data.upload_results[0].signed_url
 
     # check md5 of the uploaded file
-    result = requests.head(url)
-    md5 = result.headers["ETAG"]
-
-    # clean quote character from etag
-    assert sample_files_md5["tektome.jpg"] == clean_quote_from_etag(md5)
+    assert sample_files_md5["tektome.jpg"] == get_stored_md5(url)
 
 
 def test_upload_png_file():
@@ -97,11 +105,7 @@ def test_upload_png_file():
     assert upload_list_data.upload_results[0].filename == "tektome.png"
     url = upload_list_data.upload_results[0].signed_url
     # check md5 of the uploaded file
-    result = requests.head(url)
-    md5 = result.headers["ETAG"]
-
-    # clean quote character from etag
-    assert sample_files_md5["tektome.png"] == clean_quote_from_etag(md5)
+    assert sample_files_md5["tektome.png"] == get_stored_md5(url)
 
 
 def test_upload_tiff_file():
@@ -123,11 +127,7 @@ def test_upload_tiff_file():
     url = upload_list_data.upload_results[0].signed_url
 
     # check md5 of the uploaded file
-    result = requests.head(url)
-    md5 = result.headers["ETAG"]
-
-    # clean quote character from etag
-    assert sample_files_md5["tektome.tif"] == clean_quote_from_etag(md5)
+    assert sample_files_md5["tektome.tif"] == get_stored_md5(url)
 
 
 def test_upload_multiple_files():
@@ -165,29 +165,19 @@ def test_upload_multiple_files():
 
     url = upload_list_data.upload_results[0].signed_url
     # check md5 of each uploaded file
-    result = requests.head(url)
-    md5 = result.headers["ETAG"]
-    assert sample_files_md5["建築基準法施行令.pdf"] == clean_quote_from_etag(md5)
+    assert sample_files_md5["建築基準法施行令.pdf"] == get_stored_md5(url)
 
     url = upload_list_data.upload_results[1].signed_url
-    result = requests.head(url)
-    md5 = result.headers["ETAG"]
-    assert sample_files_md5["東京都建築安全条例.pdf"] == clean_quote_from_etag(md5)
+    assert sample_files_md5["東京都建築安全条例.pdf"] == get_stored_md5(url)
 
     url = upload_list_data.upload_results[2].signed_url
-    result = requests.head(url)
-    md5 = result.headers["ETAG"]
-    assert sample_files_md5["tektome.jpg"] == clean_quote_from_etag(md5)
+    assert sample_files_md5["tektome.jpg"] == get_stored_md5(url)
 
     url = upload_list_data.upload_results[3].signed_url
-    result = requests.head(url)
-    md5 = result.headers["ETAG"]
-    assert sample_files_md5["tektome.png"] == clean_quote_from_etag(md5)
+    assert sample_files_md5["tektome.png"] == get_stored_md5(url)
 
     url = upload_list_data.upload_results[4].signed_url
-    result = requests.head(url)
-    md5 = result.headers["ETAG"]
-    assert sample_files_md5["tektome.tif"] == clean_quote_from_etag(md5)
+    assert sample_files_md5["tektome.tif"] == get_stored_md5(url)
 
 
 def test_upload_file_with_unsupported_type():
@@ -235,3 +225,233 @@ def test_upload_multiple_files_with_unsupported_type():
     response["detail"] = (
         "The uploaded file(s) are not in supported format main.py, config.py"
     )
+
+
+def test_upload_stream_with_unsupported_type():
+    """
+    Test streaming upload of a valid pdf file and an unsupported file.
+    The pdf file should be uploaded (identical md5) and the unsupported file should be reported in its result
+    """
+    files = [
+        (
+            "files",
+            open(os.path.join("test_files", "sample", "建築基準法施行令.pdf"), "rb"),
+        ),
+        ("files", open("main.py", "rb")),
+    ]
+
+    response = client.post(url="/v1/upload/stream", files=files)
+
+    assert response.status_code == status.HTTP_200_OK
+
+    upload_list_data = UploadListResponse(**response.json())
+
+    assert len(upload_list_data.upload_results) == 2
+    pdf_result, unsupported_result = upload_list_data.upload_results
+
+    assert pdf_result.filename == "建築基準法施行令.pdf"
+    assert sample_files_md5["建築基準法施行令.pdf"] == get_stored_md5(
+        pdf_result.signed_url
+    )
+
+    assert unsupported_result.filename == "main.py"
+    assert unsupported_result.signed_url is None
+    assert unsupported_result.error_code == "UnsupportedFileTypeError"
+
+
+def test_presigned_upload_and_finalize():
+    """
+    Test presigned upload of one valid tiff file.
+    The parts are uploaded directly to object storage and the md5 of the finalized file is identical to the local file
+    """
+    path = os.path.join("test_files", "tektome.tif")
+    with open(path, "rb") as fp:
+        data = fp.read()
+
+    response = client.post(
+        url="/v1/upload/presigned",
+        json=dict(
+            filename="tektome.tif",
+            content_type="image/tiff",
+            file_length_in_bytes=len(data),
+        ),
+    )
+    assert response.status_code == status.HTTP_200_OK
+    presigned_upload = PresignedUploadResponse(**response.json())
+
+    part_size = presigned_upload.part_size_in_bytes
+    for index, url in enumerate(presigned_upload.part_urls):
+        result = requests.put(
+            url, data=data[index * part_size : (index + 1) * part_size]
+        )
+        assert result.status_code == status.HTTP_200_OK
+
+    response = client.post(
+        url="/v1/upload/presigned/finalize",
+        json=dict(
+            stored_filename=presigned_upload.stored_filename,
+            upload_id=presigned_upload.upload_id,
+        ),
+    )
+    assert response.status_code == status.HTTP_200_OK
+    upload_data = UploadResponse(**response.json())
+    assert upload_data.filename == "tektome.tif"
+
+    # the file is stored by multipart upload, so its etag is not md5 of the file
+    assert hashlib.md5(data).hexdigest() == get_stored_md5(upload_data.signed_url)
+
+
+def test_presigned_upload_with_unsupported_content():
+    """
+    Test presigned upload of a file whose content is not supported although pdf content type is declared.
+    Finalize should return BadRequest error and the file should be deleted
+    """
+    response = client.post(
+        url="/v1/upload/presigned",
+        json=dict(
+            filename="main.pdf", content_type="application/pdf", file_length_in_bytes=10
+        ),
+    )
+    presigned_upload = PresignedUploadResponse(**response.json())
+    requests.put(presigned_upload.part_urls[0], data=b"#!/bin/sh\n")
+
+    response = client.post(
+        url="/v1/upload/presigned/finalize",
+        json=dict(
+            stored_filename=presigned_upload.stored_filename,
+            upload_id=presigned_upload.upload_id,
+        ),
+    )
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json()["error_code"] == "UnsupportedFileTypeError"
+    assert (
+        object_storage_service.contains_file(presigned_upload.stored_filename) == False
+    )
+
+
+def test_finalize_presigned_upload_of_other_file():
+    """
+    Test finalize request with the stored filename that is not the file of the upload.
+    Finalize should return BadRequest error and the upload should not be completed
+    """
+    response = client.post(
+        url="/v1/upload/presigned",
+        json=dict(
+            filename="tektome.tif", content_type="image/tiff", file_length_in_bytes=8
+        ),
+    )
+    presigned_upload = PresignedUploadResponse(**response.json())
+    requests.put(presigned_upload.part_urls[0], data=b"II*\x00\x08\x00\x00\x00")
+
+    response = client.post(
+        url="/v1/upload/presigned/finalize",
+        json=dict(
+            stored_filename="other_" + presigned_upload.stored_filename,
+            upload_id=presigned_upload.upload_id,
+        ),
+    )
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json()["error_code"] == "ObjectStorageFileNotFoundError"
+    assert (
+        object_storage_service.contains_file(presigned_upload.stored_filename) == False
+    )
+
+
+def test_presigned_upload_of_duplicate_file():
+    """
+    Test presigned upload of the content which is already stored.
+    Finalize should return its own stored file, which is a metadata-only reference to the stored content
+    """
+    data = b"%PDF-1.7\n" + os.urandom(1024)
+    signed_urls = []
+    for _ in range(2):
+        response = client.post(
+            url="/v1/upload/presigned",
+            json=dict(
+                filename="duplicate.pdf",
+                content_type="application/pdf",
+                file_length_in_bytes=len(data),
+            ),
+        )
+        presigned_upload = PresignedUploadResponse(**response.json())
+        requests.put(presigned_upload.part_urls[0], data=data)
+
+        response = client.post(
+            url="/v1/upload/presigned/finalize",
+            json=dict(
+                stored_filename=presigned_upload.stored_filename,
+                upload_id=presigned_upload.upload_id,
+            ),
+        )
+        assert response.status_code == status.HTTP_200_OK
+        signed_urls.append(UploadResponse(**response.json()).signed_url)
+
+    first_filename, second_filename = map(get_filename_from_signed_url, signed_urls)
+    assert first_filename != second_filename
+    assert get_original_filename(second_filename) == "duplicate.pdf"
+    head = requests.head(signed_urls[1]).headers
+    assert int(head["Content-Length"]) == 0
+    assert int(head["x-amz-meta-content-length"]) == len(data)
+    assert get_stored_md5(signed_urls[1]) == hashlib.md5(data).hexdigest()
+
+    # the content is kept for the other upload
+    assert object_storage_service.delete(first_filename) == True
+    assert get_stored_md5(signed_urls[1]) == hashlib.md5(data).hexdigest()
+
+
+def test_resume_presigned_upload():
+    """
+    Test interrupted presigned upload.
+    Finalize should fail while the last part is missing, and resume should return the uploaded parts,
+    so only the missing part is uploaded again
+    """
+    data = b"%PDF-1.7\n" + os.urandom(
+        app_config.storage_upload_part_size_mb * 1024 * 1024
+    )
+
+    response = client.post(
+        url="/v1/upload/presigned",
+        json=dict(
+            filename="resumed.pdf",
+            content_type="application/pdf",
+            file_length_in_bytes=len(data),
+        ),
+    )
+    presigned_upload = PresignedUploadResponse(**response.json())
+    part_size = presigned_upload.part_size_in_bytes
+    assert len(presigned_upload.part_urls) > 1
+
+    # upload is interrupted before the last part
+    for index, url in enumerate(presigned_upload.part_urls[:-1]):
+        requests.put(url, data=data[index * part_size : (index + 1) * part_size])
+
+    finalize_request = dict(
+        stored_filename=presigned_upload.stored_filename,
+        upload_id=presigned_upload.upload_id,
+    )
+    response = client.post(url="/v1/upload/presigned/finalize", json=finalize_request)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json()["error_code"] == "IncompleteUploadError"
+
+    response = client.post(
+        url="/v1/upload/presigned/resume",
+        json=dict(upload_id=presigned_upload.upload_id),
+    )
+    assert response.status_code == status.HTTP_200_OK
+    resumed_upload = PresignedUploadResponse(**response.json())
+    assert resumed_upload.uploaded_parts == list(
+        range(1, len(presigned_upload.part_urls))
+    )
+
+    for index, url in enumerate(resumed_upload.part_urls):
+        if index + 1 not in resumed_upload.uploaded_parts:
+            requests.put(url, data=data[index * part_size : (index + 1) * part_size])
+
+    response = client.post(url="/v1/upload/presigned/finalize", json=finalize_request)
+    assert response.status_code == status.HTTP_200_OK
+
+    assert hashlib.md5(data).hexdigest() == get_stored_md5(
+        UploadResponse(**response.json()).signed_url
+    )
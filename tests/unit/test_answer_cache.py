@@ -0,0 +1,63 @@
+import time
+
+from api.service.llm.answer_cache import AnswerCache
+
+
+def test_answer_cache_exact_match():
+    """
+    Test exact match of the answer cache.
+    The same query (ignoring extra whitespaces) for the same source should return the cached answer with its context
+    """
+    cache = AnswerCache(max_size=10, ttl_seconds=60)
+    cache.put("file1", "When is it made?", [1.0, 0.0], ["a", "b"], "1950")
+
+    cached = cache.get("file1", "  When is it   made? ")
+    assert cached.answer == "1950"
+    assert cached.chunk_ids == ("a", "b")
+    assert cached.query_vector.tolist() == [1.0, 0.0]
+    assert cache.get("file2", "When is it made?") is None
+    assert cache.get("file1", "Who made it?") is None
+
+
+def test_answer_cache_semantic_match():
+    """
+    Test semantic match of the answer cache.
+    The cached answer should be returned only if the query is similar enough and the retrieved chunks are the same
+    """
+    cache = AnswerCache(max_size=10, ttl_seconds=60, similarity_threshold=0.9)
+    cache.put("file1", "When is it made?", [1.0, 0.0], ["a", "b"], "1950")
+
+    assert cache.find_similar("file1", [0.99, 0.05], ["a", "b"]) == "1950"
+    assert cache.find_similar("file1", [0.99, 0.05], ["a", "c"]) is None
+    assert cache.find_similar("file1", [0.5, 0.5], ["a", "b"]) is None
+    assert cache.find_similar("file2", [1.0, 0.0], ["a", "b"]) is None
+
+
+def test_answer_cache_invalidation_and_expiration():
+    """
+    Test invalidation and TTL of the answer cache.
+    Invalidating a source should remove only its answers and all answers should expire after the TTL
+    """
+    cache = AnswerCache(max_size=10, ttl_seconds=0.1)
+    cache.put("file1", "q", [1.0, 0.0], ["a"], "answer1")
+    cache.put("file2", "q", [1.0, 0.0], ["b"], "answer2")
+
+    cache.invalidate("file1")
+    assert cache.get("file1", "q") is None
+    assert cache.find_similar("file1", [1.0, 0.0], ["a"]) is None
+    assert cache.get("file2", "q").answer == "answer2"
+
+    time.sleep(0.2)
+    assert cache.get("file2", "q") is None
+    assert cache.find_similar("file2", [1.0, 0.0], ["b"]) is None
+
+
+def test_answer_cache_skips_answer_without_context():
+    """
+    Test that the answer without retrieved chunks (e.g. the file is not imported yet) is not cached
+    """
+    cache = AnswerCache(max_size=10, ttl_seconds=60)
+    cache.put("file1", "q", [1.0, 0.0], [], "I don't know")
+
+    assert cache.get("file1", "q") is None
+    assert len(cache) == 0
@@ -0,0 +1,120 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import List
+
+import httpx
+import openai
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from api.service.llm.batch_embedding import BatchedEmbeddings
+
+
+class RateLimitedEmbeddings(Embeddings):
+    """
+    Fake embeddings that rejects requests with more than max_texts texts
+    """
+
+    def __init__(self, max_texts: int) -> None:
+        self.max_texts = max_texts
+        self.requests = []
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.requests.append(list(texts))
+        if len(texts) > self.max_texts:
+            request = httpx.Request("POST", "http://localhost/v1/embeddings")
+            raise openai.RateLimitError(
+                "Rate limit reached",
+                response=httpx.Response(429, request=request),
+                body=None,
+            )
+
+        return [[float(text)] for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return [float(text)]
+
+
+def test_pack_batches_by_token_budget():
+    """
+    Test batch packing.
+    Each batch should not exceed the token budget and the order of texts should be preserved
+    """
+    embeddings = BatchedEmbeddings(
+        RateLimitedEmbeddings(100), max_batch_tokens=5, max_batch_size=10
+    )
+    batches = list(embeddings.pack_batches(["aa", "bb", "cc", "d", "eeeeee"]))
+
+    assert batches == [["aa", "bb"], ["cc", "d"], ["eeeeee"]]
+
+
+def test_embed_documents_concurrently_in_order():
+    """
+    Test concurrent embedding.
+    The returned vectors should be in the same order as the input texts
+    """
+    texts = [str(i) for i in range(100)]
+    embeddings = BatchedEmbeddings(
+        RateLimitedEmbeddings(100), max_batch_size=7, max_concurrency=4
+    )
+
+    assert embeddings.embed_documents(texts) == [[float(i)] for i in range(100)]
+
+
+def test_embed_documents_reduces_batch_size_on_rate_limit():
+    """
+    Test adaptive batch size.
+    Rate limited batches should be retried in smaller batches instead of failing
+    """
+    texts = [str(i) for i in range(40)]
+    wrapped = RateLimitedEmbeddings(max_texts=8)
+    embeddings = BatchedEmbeddings(
+        wrapped, max_batch_size=32, max_concurrency=2, retry_wait_seconds=0
+    )
+
+    assert embeddings.embed_documents(texts) == [[float(i)] for i in range(40)]
+    assert embeddings.batch_size < 32
+
+
+def test_embed_documents_raises_after_max_retries():
+    """
+    Test adaptive batch size.
+    RateLimitError should be raised when even the smallest batch is rejected
+    """
+    embeddings = BatchedEmbeddings(
+        RateLimitedEmbeddings(max_texts=0), max_retries=2, retry_wait_seconds=0
+    )
+
+    with pytest.raises(openai.RateLimitError):
+        embeddings.embed_documents(["1", "2"])
+
+
+def test_embed_documents_limits_concurrency_of_all_callers():
+    """
+    Test that the concurrent callers (e.g. embedding workers of the import pipeline) share max_concurrency.
+    The number of requests in flight should never exceed it
+    """
+    in_flight = [0, 0]
+    lock = Lock()
+
+    class SlowEmbeddings(RateLimitedEmbeddings):
+        def embed_documents(self, texts: List[str]) -> List[List[float]]:
+            with lock:
+                in_flight[0] += 1
+                in_flight[1] = max(in_flight[1], in_flight[0])
+            time.sleep(0.01)
+            with lock:
+                in_flight[0] -= 1
+
+            return super().embed_documents(texts)
+
+    embeddings = BatchedEmbeddings(
+        SlowEmbeddings(100), max_batch_size=2, max_concurrency=3
+    )
+    texts = [str(i) for i in range(20)]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(embeddings.embed_documents, [texts] * 4))
+
+    assert results == [[[float(i)] for i in range(20)]] * 4
+    assert in_flight[1] <= 3
@@ -0,0 +1,75 @@
+from langchain_core.documents import Document
+
+from api.service.llm.context_packing import (
+    format_context,
+    get_overlap_length,
+    merge_adjacent_chunks,
+    pack_context,
+)
+
+
+def chunk(text: str, chunk_index: int, content_hash: str = "doc1") -> Document:
+    return Document(
+        page_content=text,
+        metadata=dict(content_hash=content_hash, chunk_index=chunk_index),
+    )
+
+
+def test_get_overlap_length():
+    """
+    Test detection of the overlap of adjacent chunks. Short accidental matches should not be treated as overlap
+    """
+    assert (
+        get_overlap_length(
+            "第一条 建築物の敷地は道路に接する。", "敷地は道路に接する。第二条"
+        )
+        == 10
+    )
+    assert get_overlap_length("abcdefghij klmnop", "klmnop qrstuv") == 0
+    assert get_overlap_length("abcdefghij klmnop", "abcdefghij klmnop qrstuv") == 17
+    assert get_overlap_length("first chunk.", "second chunk.") == 0
+
+
+def test_merge_adjacent_chunks():
+    """
+    Test merging of adjacent chunks of the same document.
+    The overlap should not be duplicated, the merged passage should have the rank of its best chunk
+    and chunks of other documents or without chunk index should be kept as they are
+    """
+    docs = [
+        chunk("other document chunk", 0, content_hash="doc2"),
+        chunk("second chunk text. third chunk starts", 1),
+        Document(page_content="legacy chunk", metadata={}),
+        chunk("first chunk text. second chunk text.", 0),
+        chunk("fourth chunk", 3),
+    ]
+
+    passages = merge_adjacent_chunks(docs)
+
+    assert [passage.page_content for passage in passages] == [
+        "other document chunk",
+        "first chunk text. second chunk text. third chunk starts",
+        "legacy chunk",
+        "fourth chunk",
+    ]
+    assert passages[1].metadata["chunk_index"] == 0
+
+
+def test_pack_context():
+    """
+    Test packing of the chunks within the token budget (characters as tokens).
+    Passages after the budget is exceeded should be dropped and the context should contain only the texts
+    """
+    docs = [
+        chunk("a" * 10, 0),
+        chunk("b" * 10, 5),
+        chunk("c" * 10, 1),
+    ]
+
+    passages = pack_context(docs, 25, len)
+    assert [passage.page_content for passage in passages] == [
+        "a" * 10 + "\n" + "c" * 10
+    ]
+
+    passages = pack_context(docs, 0, len)
+    assert format_context(passages) == "a" * 10 + "\n" + "c" * 10 + "\n\n" + "b" * 10
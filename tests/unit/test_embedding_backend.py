@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from api.service.llm.embedding_backend import (
+    HashEmbeddingBackend,
+    OpenAIEmbeddingBackend,
+    get_embedding_backend,
+)
+
+
+def test_get_embedding_backend():
+    """
+    Test embedding backend selection by name.
+    Unknown backend should raise ValueError
+    """
+    assert isinstance(get_embedding_backend("openai", "key"), OpenAIEmbeddingBackend)
+    assert isinstance(get_embedding_backend("hash"), HashEmbeddingBackend)
+
+    with pytest.raises(ValueError):
+        get_embedding_backend("unknown")
+
+
+def test_hash_embeddings():
+    """
+    Test deterministic hash embeddings.
+    The same text should get the same normalized vector and texts sharing words should be more similar
+    """
+    backend = HashEmbeddingBackend()
+    assert backend.get_vector_size("any-model") == 256
+    assert backend.get_vector_size("any-model", 64) == 64
+
+    embeddings = backend.create_embeddings("any-model", 64)
+    vectors = np.array(
+        embeddings.embed_documents(
+            ["東京都建築安全条例", "東京都建築安全条例", "building safety regulation"]
+        )
+    )
+    query = np.array(embeddings.embed_query("東京都の建築安全条例"))
+
+    assert vectors.shape == (3, 64)
+    assert np.allclose(vectors[0], vectors[1])
+    assert np.allclose(np.linalg.norm(vectors, axis=1), 1.0)
+    assert query @ vectors[0] > query @ vectors[2]
@@ -0,0 +1,117 @@
+import asyncio
+import os
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+from api.common.cache import LRUCache
+from api.service.llm.embedding_cache import (
+    CachedEmbeddings,
+    SqliteEmbeddingStore,
+    get_embedding_cache_key,
+)
+
+
+class CountingEmbeddings(Embeddings):
+    """
+    Fake embeddings that records the embedded texts
+    """
+
+    def __init__(self) -> None:
+        self.embedded_texts = []
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.embedded_texts.extend(texts)
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return [float(len(text)), 1.0]
+
+
+def test_lru_cache_eviction():
+    """
+    Test LRU cache.
+    The least recently used entry should be evicted when the cache is full
+    """
+    cache = LRUCache(max_size=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+
+    assert "a" in cache
+    assert "b" not in cache
+    assert len(cache) == 2
+
+
+def test_embedding_cache_key():
+    """
+    Test cache key generation.
+    The key should depend on both model name and text
+    """
+    assert get_embedding_cache_key("m1", "text") == get_embedding_cache_key(
+        "m1", "text"
+    )
+    assert get_embedding_cache_key("m1", "text") != get_embedding_cache_key(
+        "m2", "text"
+    )
+
+
+def test_cached_embeddings_in_memory():
+    """
+    Test in-memory embedding cache.
+    The second call with the same texts should not call the wrapped embeddings
+    """
+    wrapped = CountingEmbeddings()
+    embeddings = CachedEmbeddings(wrapped, model_name="fake")
+
+    first = embeddings.embed_documents(["a", "bb", "a"])
+    second = embeddings.embed_documents(["bb", "a"])
+
+    assert wrapped.embedded_texts == ["a", "bb"]
+    assert first == [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0]]
+    assert second == [[2.0, 1.0], [1.0, 1.0]]
+    assert embeddings.get_stats()["hits"] == 3
+    assert embeddings.get_stats()["misses"] == 2
+
+
+def test_cached_embeddings_persistent_store(tmp_path):
+    """
+    Test on-disk embedding cache.
+    A new cache instance using the same file should not call the wrapped embeddings
+    """
+    path = os.path.join(tmp_path, "cache", "embeddings.sqlite3")
+
+    wrapped = CountingEmbeddings()
+    embeddings = CachedEmbeddings(
+        wrapped, model_name="fake", store=SqliteEmbeddingStore(path)
+    )
+    embeddings.embed_documents(["a", "bb"])
+
+    new_wrapped = CountingEmbeddings()
+    new_embeddings = CachedEmbeddings(
+        new_wrapped, model_name="fake", store=SqliteEmbeddingStore(path)
+    )
+    result = new_embeddings.embed_documents(["bb", "a"])
+
+    assert new_wrapped.embedded_texts == []
+    assert result == [[2.0, 1.0], [1.0, 1.0]]
+    assert new_embeddings.get_stats()["hits"] == 2
+
+
+def test_cached_embeddings_does_not_cache_queries():
+    """
+    Test async embedding of several queries.
+    The queries should be embedded by the wrapped embeddings every time, without changing the cache stats
+    """
+    wrapped = CountingEmbeddings()
+    embeddings = CachedEmbeddings(wrapped, model_name="fake")
+
+    for _ in range(2):
+        vectors = asyncio.run(embeddings.aembed_queries(["a", "bb"]))
+        assert vectors == [[1.0, 1.0], [2.0, 1.0]]
+
+    assert wrapped.embedded_texts == ["a", "bb", "a", "bb"]
+    assert len(embeddings.memory_cache) == 0
+    assert embeddings.get_stats()["hits"] == 0
+    assert embeddings.get_stats()["misses"] == 0
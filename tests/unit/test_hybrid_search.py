@@ -0,0 +1,67 @@
+import pytest
+from qdrant_client.http.models import ScoredPoint
+
+from api.service.llm.hybrid_search import (
+    get_document_sparse_vectors,
+    get_query_sparse_vector,
+    parse_number,
+    reciprocal_rank_fusion,
+    tokenize,
+)
+
+
+def sparse_dot(a, b) -> float:
+    weights = dict(zip(a.indices, a.values))
+    return sum(
+        weights.get(index, 0.0) * value for index, value in zip(b.indices, b.values)
+    )
+
+
+def test_tokenize_article_numbers():
+    """
+    Test keyword tokenizer with japanese legal text.
+    Kanji and arabic (full-width) article numbers should be normalized to the same tokens
+    """
+    assert parse_number("百二十") == 120
+    assert parse_number("二十五") == 25
+
+    tokens = tokenize("第百二十条の二第１項")
+    assert "第120条" in tokens
+    assert "第120条の2" in tokens
+    assert "第1項" in tokens
+    assert "第120条" in tokenize("第120条")
+
+    # japanese text is split into character bigrams
+    assert tokenize("建築基準") == ["建築", "築基", "基準"]
+
+
+def test_bm25_sparse_vectors():
+    """
+    Test BM25 sparse vectors of the chunks of one document.
+    The chunk containing the queried article number should get the highest score
+    """
+    texts = [
+        "第十二条 建築物の敷地は道路に接しなければならない",
+        "第十三条 建築物の高さは制限される",
+        "第一条 この条例は建築物の安全を目的とする",
+    ]
+    vectors = get_document_sparse_vectors(texts)
+    query = get_query_sparse_vector("第12条の内容")
+
+    scores = [sparse_dot(vector, query) for vector in vectors]
+    assert scores[0] > 0
+    assert scores[0] == max(scores)
+    assert scores[1] == 0
+
+
+def test_reciprocal_rank_fusion():
+    """
+    Test reciprocal rank fusion of dense and keyword search results.
+    The points found by both searches should be ranked before the points found by one search
+    """
+    dense = [ScoredPoint(id=i, version=0, score=1.0 - i / 10) for i in [1, 2, 3]]
+    sparse = [ScoredPoint(id=i, version=0, score=10.0 - i) for i in [3, 4, 2]]
+
+    fused = reciprocal_rank_fusion([dense, sparse], limit=3)
+    assert [point.id for point in fused] == [3, 2, 1]
+    assert fused[0].score == pytest.approx(1 / 61 + 1 / 63)
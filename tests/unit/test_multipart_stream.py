@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+from api.common.error import InvalidMultipartRequestError
+from api.common.multipart_stream import StreamingMultipartParser, get_multipart_boundary
+
+BOUNDARY = b"testboundary"
+
+
+def _build_body(parts):
+    body = b""
+    for name, filename, content_type, data in parts:
+        disposition = f'form-data; name="{name}"'
+        if filename is not None:
+            disposition += f'; filename="{filename}"'
+
+        body += b"--" + BOUNDARY + b"\r\n"
+        body += f"Content-Disposition: {disposition}\r\n".encode()
+        if content_type is not None:
+            body += f"Content-Type: {content_type}\r\n".encode()
+        body += b"\r\n" + data + b"\r\n"
+
+    return body + b"--" + BOUNDARY + b"--\r\n"
+
+
+async def _stream(body, chunk_size):
+    for start in range(0, len(body), chunk_size):
+        yield body[start : start + chunk_size]
+
+
+def _parse(body, chunk_size=7, read_parts=None):
+    async def run():
+        results = []
+        parser = StreamingMultipartParser(_stream(body, chunk_size), BOUNDARY)
+        async for part in parser.iter_parts():
+            data = None
+            if read_parts is None or part.name in read_parts:
+                data = b"".join([chunk async for chunk in part.data])
+            results.append((part.name, part.filename, part.content_type, data))
+
+        return results
+
+    return asyncio.run(run())
+
+
+def test_parse_streamed_parts():
+    """
+    Test parsing body that arrives in small chunks (part boundaries are split across chunks).
+    Files and form fields are returned in order with their data
+    """
+    body = _build_body(
+        [
+            ("files", "a.pdf", "application/pdf", b"%PDF-1.4 data\r\n--not boundary"),
+            ("comment", None, None, "日本語".encode()),
+            ("files", "b.png", "image/png", bytes(range(256)) * 10),
+        ]
+    )
+
+    assert _parse(body) == [
+        ("files", "a.pdf", "application/pdf", b"%PDF-1.4 data\r\n--not boundary"),
+        ("comment", None, "application/octet-stream", "日本語".encode()),
+        ("files", "b.png", "image/png", bytes(range(256)) * 10),
+    ]
+
+
+def test_skip_unread_parts():
+    """
+    Test that the data of a part that is not read is skipped when the next part is requested
+    """
+    body = _build_body(
+        [
+            ("skipped", "a.pdf", "application/pdf", b"x" * 1000),
+            ("read", "b.pdf", "application/pdf", b"y" * 1000),
+        ]
+    )
+
+    assert _parse(body, read_parts={"read"}) == [
+        ("skipped", "a.pdf", "application/pdf", None),
+        ("read", "b.pdf", "application/pdf", b"y" * 1000),
+    ]
+
+
+def test_truncated_body():
+    """
+    Test that truncated body raises InvalidMultipartRequestError instead of returning incomplete file
+    """
+    body = _build_body([("files", "a.pdf", "application/pdf", b"x" * 1000)])
+
+    with pytest.raises(InvalidMultipartRequestError):
+        _parse(body[:500])
+
+
+def test_get_multipart_boundary():
+    """
+    Test getting boundary from Content-Type header. Other content types and missing boundary are rejected
+    """
+    assert get_multipart_boundary("multipart/form-data; boundary=abc") == b"abc"
+    assert get_multipart_boundary('multipart/form-data; boundary="a b"') == b"a b"
+
+    for content_type in [None, "application/json", "multipart/form-data"]:
+        with pytest.raises(InvalidMultipartRequestError):
+            get_multipart_boundary(content_type)
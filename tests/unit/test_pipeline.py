@@ -0,0 +1,47 @@
+import pytest
+from langchain_core.documents import Document
+
+from api.service.llm.pipeline import ImportPipeline
+
+
+def test_import_pipeline():
+    """
+    Test import pipeline.
+    Every document should be embedded and written exactly once
+    """
+    written = []
+
+    def upsert(docs, vectors):
+        written.extend(zip([doc.page_content for doc in docs], vectors))
+
+    pipeline = ImportPipeline(
+        embed_function=lambda texts: [[float(len(text))] for text in texts],
+        upsert_function=upsert,
+        embedding_workers=3,
+        queue_depth=1,
+    )
+    batches = (
+        [Document(page_content="x" * (i * 10 + j)) for j in range(10)]
+        for i in range(20)
+    )
+
+    assert pipeline.run(batches) == 200
+    assert sorted(written) == sorted(("x" * i, [float(i)]) for i in range(200))
+
+
+def test_import_pipeline_error():
+    """
+    Test import pipeline when embedding fails.
+    The error should be raised to the caller and the pipeline should not hang
+    """
+
+    def embed(texts):
+        raise ValueError("embedding failed")
+
+    pipeline = ImportPipeline(
+        embed_function=embed, upsert_function=lambda docs, vectors: None, queue_depth=1
+    )
+    batches = ([Document(page_content="text")] for _ in range(100))
+
+    with pytest.raises(ValueError):
+        pipeline.run(batches)
@@ -0,0 +1,42 @@
+from langchain_core.documents import Document
+
+from api.service.llm.reranking import maximal_marginal_relevance, trim_to_token_budget
+
+
+def test_maximal_marginal_relevance():
+    """
+    Test MMR selection. The near-duplicate of the most relevant vector should be skipped for a diverse one,
+    and relevance only (lambda 1) should keep the similarity order
+    """
+    query_vector = [1.0, 0.0, 0.0]
+    vectors = [
+        [1.0, 0.1, 0.0],
+        [1.0, 0.11, 0.0],  # near-duplicate of the first vector
+        [0.7, 0.0, 0.7],
+    ]
+
+    assert maximal_marginal_relevance(query_vector, vectors, 2) == [0, 2]
+    assert maximal_marginal_relevance(query_vector, vectors, 2, lambda_mult=1.0) == [
+        0,
+        1,
+    ]
+    assert maximal_marginal_relevance(query_vector, vectors, 5) == [0, 2, 1]
+    assert maximal_marginal_relevance(query_vector, [], 2) == []
+
+    # given relevance (e.g. fused scores of hybrid search) replaces the similarity to the query
+    relevance = [0.01, 0.02, 0.03]
+    assert maximal_marginal_relevance(
+        query_vector, vectors, 1, relevance=relevance
+    ) == [2]
+
+
+def test_trim_to_token_budget():
+    """
+    Test trimming documents to the token budget (characters as tokens).
+    Documents after the budget is exceeded should be dropped, but the first document is always kept
+    """
+    docs = [Document(page_content=text) for text in ["aaaa", "bbb", "cc"]]
+
+    assert trim_to_token_budget(docs, 7, len) == docs[:2]
+    assert trim_to_token_budget(docs, 9, len) == docs
+    assert trim_to_token_budget(docs, 1, len) == docs[:1]
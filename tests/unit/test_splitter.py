@@ -0,0 +1,139 @@
+import pytest
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+
+from api.service.llm import splitter as splitter_module
+from api.service.llm.splitter import (
+    StreamingRecursiveCharacterTextSplitter,
+    TokenLengthFunction,
+)
+
+TEXT = (
+    "第一条　この条例は、建築基準法第四十条の規定による建築物の敷地、構造及び建築設備に関する制限を定める。\n\n"
+    "第二条　削除\n"
+    "第三条　延べ面積が千平方メートルを超える建築物の敷地は、その延べ面積に応じて、道路に接しなければならない。\n"
+    + "a quick brown fox jumps over the lazy dog " * 20
+)
+
+
+class ByteEncoding:
+    """
+    Fake tiktoken encoding which treats every utf-8 byte as a token
+    """
+
+    def __init__(self) -> None:
+        self.calls = 0
+
+    def encode_ordinary(self, text):
+        self.calls += 1
+        return list(text.encode())
+
+    def encode_ordinary_batch(self, texts):
+        self.calls += 1
+        return [list(text.encode()) for text in texts]
+
+
+@pytest.fixture
+def byte_encoding(monkeypatch):
+    """
+    Fixture to replace tiktoken encoding with ByteEncoding.
+    The cached splitters and length functions hold the encoding, so the caches are cleared afterwards
+    """
+    monkeypatch.setattr(splitter_module, "get_encoding", lambda model: ByteEncoding())
+    yield
+    splitter_module.get_text_splitter.cache_clear()
+    splitter_module.get_token_length_function.cache_clear()
+
+
+def test_streaming_splitter_produces_same_chunks():
+    """
+    Test streaming text splitter.
+    The chunks should be identical to RecursiveCharacterTextSplitter with the same parameters
+    """
+    for chunk_size, chunk_overlap in [(10, 0), (32, 8), (50, 20), (200, 50)]:
+        expected = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap
+        ).split_text(TEXT)
+        splitter = StreamingRecursiveCharacterTextSplitter(
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap
+        )
+
+        assert list(splitter.iter_split_text(TEXT)) == expected
+
+
+def test_streaming_splitter_copies_metadata():
+    """
+    Test splitting documents lazily.
+    Every chunk should have a copy of the original metadata
+    """
+    splitter = StreamingRecursiveCharacterTextSplitter(chunk_size=32, chunk_overlap=8)
+    chunks = splitter.iter_split_documents(
+        [Document(page_content=TEXT, metadata=dict(source="file1"))]
+    )
+
+    first = next(chunks)
+    assert first.metadata == dict(source="file1")
+    assert all(chunk.metadata == dict(source="file1") for chunk in chunks)
+
+
+def test_token_length_function():
+    """
+    Test memoized token length function.
+    The text should be tokenized only once and primed texts should not be tokenized again
+    """
+    encoding = ByteEncoding()
+    length_function = TokenLengthFunction(encoding)
+
+    assert length_function("建築") == 6
+    assert length_function("建築") == 6
+    assert encoding.calls == 1
+
+    length_function.prime(["a", "bb", "建築"])
+    assert encoding.calls == 2
+    assert length_function("bb") == 2
+    assert encoding.calls == 2
+
+
+def test_streaming_splitter_with_token_length_function():
+    """
+    Test streaming text splitter with batched token counting.
+    The chunks should be identical to RecursiveCharacterTextSplitter with per-piece counting
+    """
+    expected = RecursiveCharacterTextSplitter(
+        chunk_size=64, chunk_overlap=16, length_function=lambda text: len(text.encode())
+    ).split_text(TEXT)
+    splitter = StreamingRecursiveCharacterTextSplitter(
+        chunk_size=64,
+        chunk_overlap=16,
+        length_function=TokenLengthFunction(ByteEncoding()),
+    )
+
+    assert splitter.split_text(TEXT) == expected
+
+
+def test_parallel_splitter_produces_same_chunks(byte_encoding):
+    """
+    Test parallel text splitter (with thread pool instead of process pool).
+    The chunks should be identical to the serial splitter
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    text = TEXT + "\n" + "x" * 300 + "\n" + TEXT
+
+    for chunk_size, chunk_overlap in [(16, 4), (64, 16)]:
+        serial = splitter_module.get_text_splitter(
+            "fake-model", chunk_size, chunk_overlap
+        )
+        expected = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            length_function=lambda text: len(text.encode()),
+        ).split_text(text)
+
+        with ThreadPoolExecutor(4) as executor:
+            parallel = splitter_module.ParallelTextSplitter(
+                executor, "fake-model", chunk_size, chunk_overlap, count_batch_size=3
+            )
+            assert list(parallel.split_text(text)) == expected
+
+        assert serial.split_text(text) == expected
@@ -1,4 +1,4 @@
-from api.service.storage import prepend_unique_id_to_filename
+from api.service.storage import get_original_filename, prepend_unique_id_to_filename
 
 
 def test_prepend_unique_id_to_filename():
@@ -11,3 +11,14 @@ def test_prepend_unique_id_to_filename():
 
     assert len(uuid_part) == 36
     assert filename == "file.txt"
+
+
+def test_get_original_filename():
+    """
+    Test utility function that removes the prepended uuid from stored filename.
+    Filenames without uuid are returned as they are
+    """
+    stored_filename = prepend_unique_id_to_filename("file_1.pdf")
+
+    assert get_original_filename(stored_filename) == "file_1.pdf"
+    assert get_original_filename("file_1.pdf") == "file_1.pdf"
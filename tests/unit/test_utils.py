@@ -1,10 +1,14 @@
 from api.common.utils import (
     get_filename_from_signed_url,
     is_allowed_content_type,
+    get_content_type_from_signature,
     ALLOWED_FILE_FORMAT,
+    StageTimer,
 )
+from api.common.cache import TTLCache
 from api.common.error import ObjectStorageFileNotFoundError
 import pytest
+import time
 
 
 def test_get_filename_from_signed_url():
@@ -36,3 +40,55 @@ def test_is_allowed_content_type():
         assert is_allowed_content_type(supported_mime_type) == True
 
     assert is_allowed_content_type("application/video") == False
+
+
+def test_get_content_type_from_signature():
+    """
+    Test function to detect file type from the first bytes of the file.
+    The supported file types are detected regardless of the filename. Otherwise, None should be returned
+    """
+    assert get_content_type_from_signature(b"%PDF-1.7\n") == "application/pdf"
+    assert get_content_type_from_signature(b"\r\n%PDF-1.4") == "application/pdf"
+    assert get_content_type_from_signature(b"\xff\xd8\xff\xe0") == "image/jpeg"
+    assert get_content_type_from_signature(b"\x89PNG\r\n\x1a\n\x00") == "image/png"
+    assert get_content_type_from_signature(b"II*\x00\x08\x00") == "image/tiff"
+    assert get_content_type_from_signature(b"MM\x00*\x00\x00") == "image/tiff"
+
+    assert get_content_type_from_signature(b"") is None
+    assert get_content_type_from_signature(b"#!/bin/sh") is None
+    assert get_content_type_from_signature(b"x" * 2000 + b"%PDF-1.4") is None
+
+
+def test_ttl_cache_expiration():
+    """
+    Test TTL cache.
+    Both True and False values should be cached and the entries should expire after the TTL
+    """
+    cache = TTLCache(max_size=10, ttl_seconds=0.05)
+    cache.put("found", True)
+    cache.put("not_found", False)
+
+    assert cache.get("found") == True
+    assert cache.get("not_found") == False
+
+    time.sleep(0.1)
+    assert cache.get("found") is None
+    assert "not_found" not in cache
+    assert len(cache) == 0
+
+
+def test_stage_timer():
+    """
+    Test stage timer. Durations of a repeated stage should be summed and all stages should be reported
+    """
+    timer = StageTimer()
+    for _ in range(2):
+        with timer.stage("search"):
+            time.sleep(0.01)
+    with timer.stage("mmr"):
+        pass
+
+    assert list(timer.durations) == ["search", "mmr"]
+    assert timer.durations["search"] >= 20
+    assert str(timer).startswith("search ")
+    assert ", mmr " in str(timer)
@@ -0,0 +1,69 @@
+import pytest
+from qdrant_client.http.models import BinaryQuantization, ScalarQuantization
+
+from api.service.llm.vector_db_config import (
+    get_hnsw_config,
+    get_quantization_config,
+    get_search_params,
+    get_vector_size,
+)
+
+
+def test_get_quantization_config():
+    """
+    Test quantization config of the collection.
+    Each supported type should return its config and unknown type should raise ValueError
+    """
+    assert get_quantization_config("none") is None
+    assert isinstance(get_quantization_config("scalar"), ScalarQuantization)
+    assert isinstance(get_quantization_config("binary"), BinaryQuantization)
+
+    with pytest.raises(ValueError):
+        get_quantization_config("product")
+
+
+def test_get_hnsw_config():
+    """
+    Test HNSW config of the collection.
+    Zero values should be left to qdrant default
+    """
+    assert get_hnsw_config(0, 0) is None
+
+    config = get_hnsw_config(32, 0)
+    assert config.m == 32
+    assert config.ef_construct is None
+
+
+def test_get_search_params():
+    """
+    Test search params of the quantized collection.
+    Oversampling should be used only with rescoring
+    """
+    assert get_search_params("none") is None
+
+    params = get_search_params("scalar", rescore=True, oversampling=3.0)
+    assert params.quantization.rescore == True
+    assert params.quantization.oversampling == 3.0
+
+    params = get_search_params("binary", rescore=False, oversampling=3.0)
+    assert params.quantization.rescore == False
+    assert params.quantization.oversampling is None
+
+
+def test_get_vector_size():
+    """
+    Test vector size of the collection derived from the embedding model.
+    0 should mean the native dimensions and unsupported dimensions should raise ValueError
+    """
+    assert get_vector_size("text-embedding-ada-002") == 1536
+    assert get_vector_size("text-embedding-3-large") == 3072
+    assert get_vector_size("text-embedding-3-small", 256) == 256
+
+    with pytest.raises(ValueError):
+        get_vector_size("text-embedding-ada-002", 256)
+
+    with pytest.raises(ValueError):
+        get_vector_size("text-embedding-3-small", 2048)
+
+    with pytest.raises(ValueError):
+        get_vector_size("unknown-model")
@@ -1,8 +1,10 @@
+import argparse
 import logging
 import os
 from celery import Celery
 from api.service.llm import load_ocr_json_result
 from api.common.error import ObjectStorageFileNotFoundError
+from api.service.llm.embedding_backend import EMBEDDING_BACKENDS
 from api.service.llm.gpt35 import Gpt35LLMService
 from api.service.storage.minio_storage import MinioStorage
 from api.common.utils import get_filename_from_signed_url
@@ -19,9 +21,34 @@ llm = Gpt35LLMService(
     openai_api_key=app_config.openai_api_key,
     vector_db_url=app_config.llm_vector_db_url,
     vector_db_collection_name=app_config.llm_vector_db_collection_name,
+    vector_db_partitions=app_config.llm_vector_db_partitions,
+    vector_on_disk=app_config.llm_vector_db_on_disk,
+    hnsw_m=app_config.llm_vector_db_hnsw_m,
+    hnsw_ef_construct=app_config.llm_vector_db_hnsw_ef_construct,
+    quantization=app_config.llm_vector_db_quantization,
+    quantization_always_ram=app_config.llm_vector_db_quantization_always_ram,
+    quantization_rescore=app_config.llm_vector_search_rescore,
+    quantization_oversampling=app_config.llm_vector_search_oversampling,
     text_split_chunk_size=app_config.llm_preprocess_chunk_size,
     text_split_chunk_overlap=app_config.llm_preprocess_chunk_overlap,
     vector_search_top_k=app_config.llm_vector_search_top_k,
+    vector_search_mode=app_config.llm_vector_search_mode,
+    hybrid_search_candidates=app_config.llm_hybrid_search_candidates,
+    retrieval_candidates=app_config.llm_retrieval_candidates,
+    mmr_lambda=app_config.llm_retrieval_mmr_lambda,
+    reranker_model=app_config.llm_retrieval_reranker_model,
+    retrieval_max_tokens=app_config.llm_retrieval_max_tokens,
+    embedding_backend=app_config.llm_embedding_backend,
+    embedding_model=app_config.llm_embedding_model,
+    embedding_dimensions=app_config.llm_embedding_dimensions,
+    embedding_cache_path=app_config.llm_embedding_cache_path,
+    embedding_cache_memory_size=app_config.llm_embedding_cache_memory_size,
+    embedding_batch_max_tokens=app_config.llm_embedding_batch_max_tokens,
+    embedding_batch_max_size=app_config.llm_embedding_batch_max_size,
+    embedding_max_concurrency=app_config.llm_embedding_max_concurrency,
+    import_queue_depth=app_config.llm_import_queue_depth,
+    text_split_workers=app_config.llm_preprocess_split_workers,
+    batch_query_max_concurrency=app_config.llm_batch_query_max_concurrency,
 )
 
 object_storage = MinioStorage(
@@ -29,6 +56,8 @@ object_storage = MinioStorage(
     bucket_name=app_config.storage_bucket_name,
     access_key=app_config.storage_access_key,
     secret_key=app_config.storage_secret_key,
+    existence_cache_size=app_config.storage_existence_cache_size,
+    existence_cache_ttl_seconds=app_config.storage_existence_cache_ttl_seconds,
 )
 
 
@@ -68,6 +97,51 @@ def import_doc_to_vector_store(target_file_signed_url: str):
     logger.info("Finished importing document to vector db")
 
 
+@app.task
+def migrate_vector_db_embeddings(
+    embedding_model: str, embedding_dimensions: int = 0, embedding_backend: str = None
+):
+    """
+    The celery task to re-embed the vector db collections with another embedding model or dimensions.
+    The aliases are switched to the new collections when all chunks are re-embedded
+
+    Args:
+        - embedding_model: name of the new embedding model
+        - embedding_dimensions: number of dimensions of the new embeddings. 0 means the native dimensions
+        - embedding_backend: name of the new embedding backend. None means the current backend
+
+    Returns:
+        - names of the new collections
+
+    Raises:
+        - LLMError family if there is problem with llm service
+    """
+    collection_names = llm.migrate_embeddings(
+        embedding_model, embedding_dimensions, embedding_backend
+    )
+    logger.info(f"Finished migrating vector db to {collection_names}")
+    return collection_names
+
+
 if __name__ == "__main__":
-    worker = app.Worker()
-    worker.start()
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command")
+
+    migrate_parser = subparsers.add_parser(
+        "migrate-embeddings",
+        help="re-embed the vector db collections in the background (by a worker)",
+    )
+    migrate_parser.add_argument("--model", required=True)
+    migrate_parser.add_argument("--dimensions", type=int, default=0)
+    migrate_parser.add_argument("--backend", choices=EMBEDDING_BACKENDS)
+    args = parser.parse_args()
+
+    if args.command == "migrate-embeddings":
+        result = migrate_vector_db_embeddings.delay(
+            args.model, args.dimensions, args.backend
+        )
+        print(f"Started embedding migration task {result.id}")
+
+    else:
+        worker = app.Worker()
+        worker.start()